@@ -0,0 +1,151 @@
+import threading
+import numpy as np
+from bson.binary import Binary
+from bson.objectid import ObjectId
+from typing import Dict, List, Any, Optional, Tuple
+
+# A bucket holds the boxes of `span` consecutive frames as packed columns:
+# per-frame ObjectIds and box offsets, then per-box ObjectId, int16 bbox,
+# uint8 class and float16 confidence. All little-endian.
+OBJECT_ID_SIZE = 12
+EMPTY_OBJECT_ID = bytes(OBJECT_ID_SIZE)
+
+
+def bucket_index(frame_number: int, span: int) -> int:
+    return frame_number // span
+
+
+def encode_bucket(video_id: ObjectId, bucket: int, span: int,
+                  frames: Dict[int, Tuple[ObjectId, List[Dict[str, Any]]]]) -> Dict[str, Any]:
+    # frames maps frame_number -> (frame_id, annotations) for frames of
+    # this bucket; annotations must already have their _id assigned.
+    start_frame = bucket * span
+    frame_ids = bytearray(span * OBJECT_ID_SIZE)
+    counts = np.zeros(span, dtype=np.int64)
+    boxes = []
+    for frame_number in sorted(frames):
+        frame_id, annotations = frames[frame_number]
+        slot = frame_number - start_frame
+        frame_ids[slot * OBJECT_ID_SIZE:(slot + 1) * OBJECT_ID_SIZE] = frame_id.binary
+        counts[slot] = len(annotations)
+        boxes.extend(annotations)
+
+    offsets = np.zeros(span + 1, dtype='<i4')
+    np.cumsum(counts, out=offsets[1:])
+    bbox = np.array([annotation["bbox"] for annotation in boxes], dtype=np.int64).reshape(-1, 4)
+    return {
+        "video_id": video_id,
+        "bucket": bucket,
+        "start_frame": start_frame,
+        "end_frame": start_frame + span - 1,
+        "span": span,
+        "count": len(boxes),
+        "frame_ids": Binary(bytes(frame_ids)),
+        "offsets": Binary(offsets.tobytes()),
+        "ids": Binary(b''.join(annotation["_id"].binary for annotation in boxes)),
+        "bbox": Binary(np.clip(bbox, -32768, 32767).astype('<i2').tobytes()),
+        "classes": Binary(np.array([annotation["class_id"] for annotation in boxes], dtype=np.uint8).tobytes()),
+        "confidence": Binary(np.array(
+            [annotation.get("confidence", 1.0) for annotation in boxes], dtype='<f2'
+        ).tobytes())
+    }
+
+
+def decode_bucket(doc: Dict[str, Any], class_names: List[str], start_frame: Optional[int] = None,
+                  end_frame: Optional[int] = None) -> Dict[int, List[Dict[str, Any]]]:
+    # Rebuilds annotation documents as the per-box layout stores them,
+    # keyed by frame number and limited to [start_frame, end_frame].
+    span = doc["span"]
+    first = doc["start_frame"]
+    lo = 0 if start_frame is None else max(start_frame - first, 0)
+    hi = span - 1 if end_frame is None else min(end_frame - first, span - 1)
+    if lo > hi:
+        return {}
+
+    offsets = np.frombuffer(doc["offsets"], dtype='<i4')
+    box_lo, box_hi = int(offsets[lo]), int(offsets[hi + 1])
+    ids = doc["ids"][box_lo * OBJECT_ID_SIZE:box_hi * OBJECT_ID_SIZE]
+    bbox = np.frombuffer(doc["bbox"], dtype='<i2').reshape(-1, 4)[box_lo:box_hi].tolist()
+    classes = np.frombuffer(doc["classes"], dtype=np.uint8)[box_lo:box_hi].tolist()
+    confidence = np.frombuffer(doc["confidence"], dtype='<f2')[box_lo:box_hi].astype(np.float64).tolist()
+    frame_ids = doc["frame_ids"]
+
+    result = {}
+    for slot in range(lo, hi + 1):
+        raw_frame_id = frame_ids[slot * OBJECT_ID_SIZE:(slot + 1) * OBJECT_ID_SIZE]
+        if raw_frame_id == EMPTY_OBJECT_ID:
+            continue
+        frame_id = ObjectId(raw_frame_id)
+        frame_number = first + slot
+        annotations = []
+        for box in range(int(offsets[slot]) - box_lo, int(offsets[slot + 1]) - box_lo):
+            class_id = classes[box]
+            annotations.append({
+                "_id": ObjectId(ids[box * OBJECT_ID_SIZE:(box + 1) * OBJECT_ID_SIZE]),
+                "frame_id": frame_id,
+                "video_id": doc["video_id"],
+                "frame_number": frame_number,
+                "bbox": bbox[box],
+                "class_id": class_id,
+                "class_name": class_names[class_id] if class_id < len(class_names) else "unknown",
+                "confidence": confidence[box]
+            })
+        result[frame_number] = annotations
+    return result
+
+
+def replace_frame_ids(doc: Dict[str, Any], frame_ids: Dict[int, ObjectId]) -> Binary:
+    # The bucket's frame_ids column with occupied slots of the given frame
+    # numbers pointing at new frame ids.
+    column = bytearray(doc["frame_ids"])
+    for frame_number, frame_id in frame_ids.items():
+        slot = frame_number - doc["start_frame"]
+        if 0 <= slot < doc["span"] and column[slot * OBJECT_ID_SIZE:(slot + 1) * OBJECT_ID_SIZE] != EMPTY_OBJECT_ID:
+            column[slot * OBJECT_ID_SIZE:(slot + 1) * OBJECT_ID_SIZE] = frame_id.binary
+    return Binary(bytes(column))
+
+
+class AnnotationBucketBuffer:
+    # Collects annotations of videos being ingested frame by frame, possibly
+    # out of order, until their buckets can be written.
+
+    def __init__(self, span: int):
+        self.span = span
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def add(self, video_id: ObjectId, frame_number: int, frame_id: ObjectId,
+            annotations: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            bucket = self._buckets.setdefault((video_id, bucket_index(frame_number, self.span)), {})
+            _, existing = bucket.get(frame_number, (frame_id, []))
+            bucket[frame_number] = (frame_id, existing + annotations)
+
+    def pop_before(self, video_id: ObjectId, bucket: int) -> List[Dict[str, Any]]:
+        # Encoded buckets of the video with an index below `bucket`.
+        with self._lock:
+            keys = [key for key in self._buckets if key[0] == video_id and key[1] < bucket]
+            return [encode_bucket(video_id, key[1], self.span, self._buckets.pop(key)) for key in sorted(keys)]
+
+    def pop_all(self, video_id: ObjectId) -> List[Dict[str, Any]]:
+        return self.pop_before(video_id, float('inf'))
+
+    def discard(self, video_id: ObjectId) -> None:
+        with self._lock:
+            for key in [key for key in self._buckets if key[0] == video_id]:
+                del self._buckets[key]
+
+    def newest_bucket(self, video_id: ObjectId) -> int:
+        with self._lock:
+            return max((key[1] for key in self._buckets if key[0] == video_id), default=-1)
+
+    def pending(self, video_id: ObjectId, start_frame: int, end_frame: int) -> List[Dict[str, Any]]:
+        # Buckets not yet written, encoded so readers decode them like stored ones.
+        with self._lock:
+            return [
+                encode_bucket(video_id, key[1], self.span, dict(frames))
+                for key, frames in self._buckets.items()
+                if key[0] == video_id
+                and key[1] >= bucket_index(start_frame, self.span)
+                and key[1] <= bucket_index(end_frame, self.span)
+            ]
@@ -0,0 +1,383 @@
+import asyncio
+from typing import Dict, List, Any, Optional, Iterable, Tuple, Awaitable, Callable
+from pymongo import AsyncMongoClient
+from gridfs import AsyncGridFS
+from bson.objectid import ObjectId
+
+from app.mongo_client import POOL_OPTIONS, get_client
+from app.frame_directory import FrameDirectory
+from app.spatial_index import SpatialGridIndex
+from app.frame_bitmap import FrameBitmapIndex, FramePredicate, bitmap_frame_ranges
+from app.frame_sampler import FrameSamplingRecord
+from app.segment_tree import (
+    CompactFrameSegmentTree, LazyFrameSegmentTree, AppendableFrameSegmentTree, FrameCountTree,
+    class_mask_to_classes, segment_tree_from_dict
+)
+from app.database_manager import (
+    DatabaseManager, SEGMENT_TREE_CACHE, LIVE_SEGMENT_TREES, LIVE_SPATIAL_INDEXES, VIDEO_ANNOTATION_LAYOUTS
+)
+
+
+class AsyncDatabaseManager:
+    # Read side of DatabaseManager for asyncio code. Results match the
+    # synchronous methods; deserialized trees are shared with it through
+    # SEGMENT_TREE_CACHE. An AsyncMongoClient is bound to the event loop it
+    # is first used on, so each manager owns its client.
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        if config.get('storage', {}).get('backend', 'mongodb') != 'mongodb':
+            raise ValueError("AsyncDatabaseManager requires the mongodb storage backend")
+
+        db_config = config.get('mongodb', {})
+        self.db_config = db_config
+        self.db_name = db_config.get('db_name', 'visdrone_db')
+        options = {
+            option: db_config[key]
+            for key, option in POOL_OPTIONS.items()
+            if db_config.get(key) is not None
+        }
+        self.client = AsyncMongoClient(db_config.get('uri') or 'mongodb://localhost:27017', **options)
+        self.db = self.client[self.db_name]
+        self.videos = self.db["videos"]
+        self.frames = self.db["frames"]
+        self.annotations = self.db["annotations"]
+        self.segment_trees = self.db["segment_trees"]
+        self.count_trees = self.db["count_trees"]
+        self.segment_tree_nodes = self.db["segment_tree_nodes"]
+        self.spatial_indices = self.db["spatial_indices"]
+        self.frame_bitmaps = self.db["frame_bitmaps"]
+        self.frame_sampling = self.db["frame_sampling"]
+        self.annotation_buckets = self.db["annotation_buckets"]
+        self.segment_tree_files = AsyncGridFS(self.db, collection="segment_tree_files")
+        storage_config = config.get('annotation_storage', {})
+        self.bucket_frames = storage_config.get('bucket_frames', 256)
+        self.tree_cache = SEGMENT_TREE_CACHE
+        self.concurrency = db_config.get('async_concurrency', 8)
+
+    async def __aenter__(self) -> 'AsyncDatabaseManager':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    async def _cached(self, key, load: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        value = self.tree_cache.get(key)
+        if value is None:
+            value = await load()
+            if value is not None:
+                self.tree_cache.put(key, value)
+        return value
+
+    async def _get_packed(self, doc: Dict) -> bytes:
+        if doc["format"] == "gridfs":
+            grid_out = await self.segment_tree_files.get(doc["gridfs_id"])
+            return await grid_out.read()
+        return doc["tree_binary"]
+
+    async def _load_tree_pages(self, video_id, object_class, keys) -> Dict:
+        page_filter = DatabaseManager._tree_page_filter(video_id, object_class, keys)
+        return {
+            (page["kind"], page["partition"], page["page"]): page["data"]
+            async for page in self.segment_tree_nodes.find(page_filter)
+        }
+
+    async def _prefetch_pages(self, tree: LazyFrameSegmentTree, video_id, object_class, keys) -> None:
+        # Lazy trees load pages through a blocking callback; fetching the
+        # pages a query needs beforehand keeps the event loop free.
+        missing = tree.missing_pages(keys)
+        if missing:
+            tree.add_pages(await self._load_tree_pages(video_id, object_class, missing))
+
+    def _load_pages_blocking(self, video_id, object_class, keys) -> Dict:
+        # Fallback for trees this manager put in the shared cache and a
+        # synchronous DatabaseManager queries later.
+        segment_tree_nodes = get_client(self.db_config)[self.db_name]["segment_tree_nodes"]
+        return {
+            (page["kind"], page["partition"], page["page"]): page["data"]
+            for page in segment_tree_nodes.find(DatabaseManager._tree_page_filter(video_id, object_class, keys))
+        }
+
+    async def _get_segment_tree(self, video_id, object_class):
+        async def load():
+            tree_doc = await self.segment_trees.find_one({"video_id": video_id, "object_class": object_class})
+            if not tree_doc:
+                return None
+            tree_format = tree_doc.get("format", "dict")
+            if tree_format == "paged":
+                tree = LazyFrameSegmentTree(
+                    tree_doc["tree_header"],
+                    lambda keys: self._load_pages_blocking(video_id, object_class, keys)
+                )
+                tree.on_grow = lambda: self.tree_cache.recharge((video_id, object_class), tree)
+                return tree
+            if tree_format in ("binary", "gridfs"):
+                return CompactFrameSegmentTree.from_bytes(await self._get_packed(tree_doc))
+            return segment_tree_from_dict(tree_doc["tree_structure"])
+
+        return await self._cached((video_id, object_class), load)
+
+    async def _query_tree(self, tree, video_id, object_class, start_frame, end_frame, classes):
+        if isinstance(tree, LazyFrameSegmentTree):
+            await self._prefetch_pages(tree, video_id, object_class, tree.offset_page_keys(start_frame, end_frame, classes))
+            ordinals = tree.query_ordinals(start_frame, end_frame, classes)
+            await self._prefetch_pages(tree, video_id, object_class, tree.id_page_keys(ordinals))
+        return tree.query(start_frame, end_frame, classes)
+
+    async def _load_spatial_index(self, video_id) -> Optional[SpatialGridIndex]:
+        live_index = LIVE_SPATIAL_INDEXES.get(video_id)
+        if live_index is not None:
+            return live_index
+
+        async def load():
+            index_doc = await self.spatial_indices.find_one({"video_id": video_id})
+            return SpatialGridIndex.from_bytes(await self._get_packed(index_doc)) if index_doc else None
+
+        return await self._cached((video_id, "spatial"), load)
+
+    async def _load_frame_bitmaps(self, video_id) -> Optional[FrameBitmapIndex]:
+        live_tree = LIVE_SEGMENT_TREES.get(video_id)
+        if live_tree is not None:
+            num_classes = len(self.config.get('classes', []))
+            return FrameBitmapIndex.from_counts(live_tree.frame_counts(num_classes))
+
+        async def load():
+            bitmap_doc = await self.frame_bitmaps.find_one({"video_id": video_id})
+            return FrameBitmapIndex.from_bytes(await self._get_packed(bitmap_doc)) if bitmap_doc else None
+
+        return await self._cached((video_id, "bitmaps"), load)
+
+    async def get_frame_sampling(self, video_id) -> Optional[FrameSamplingRecord]:
+        async def load():
+            sampling_doc = await self.frame_sampling.find_one({"video_id": video_id})
+            return FrameSamplingRecord.from_bytes(await self._get_packed(sampling_doc)) if sampling_doc else None
+
+        return await self._cached((video_id, "sampling"), load)
+
+    async def _load_count_tree(self, video_id) -> Optional[FrameCountTree]:
+        live_tree = LIVE_SEGMENT_TREES.get(video_id)
+        if live_tree is not None:
+            return DatabaseManager._live_count_tree(live_tree, len(self.config.get('classes', [])))
+
+        async def load():
+            tree_doc = await self.count_trees.find_one({"video_id": video_id})
+            if not tree_doc:
+                return None
+            return FrameCountTree.from_dict(
+                tree_doc["tree_structure"],
+                DatabaseManager._inferred_mask(await self.get_frame_sampling(video_id), tree_doc["tree_structure"]["n"])
+            )
+
+        tree = await self._cached((video_id, "counts"), load)
+        if tree is None:
+            print(f"No count tree found for video {video_id}")
+        return tree
+
+    async def get_video_info(self, video_id: ObjectId) -> Dict:
+        return await self.videos.find_one({"_id": video_id})
+
+    async def get_video_by_name(self, name: str) -> Dict:
+        return await self.videos.find_one({"name": name})
+
+    async def get_all_videos(self) -> List[Dict]:
+        return await self.videos.find().to_list()
+
+    async def get_videos_by_source_type(self, source_type: str) -> List[Dict]:
+        return await self.videos.find({"source_type": source_type}).to_list()
+
+    async def get_frame_directory(self, video_id: ObjectId) -> FrameDirectory:
+        async def load():
+            return FrameDirectory.from_frames(
+                await self.frames.find({"video_id": video_id}, {"frame_number": 1, "image_path": 1, "timestamp": 1}).to_list()
+            )
+
+        if video_id in LIVE_SEGMENT_TREES:
+            return await load()
+        return await self._cached((video_id, "frames"), load)
+
+    async def get_frame(self, video_id: ObjectId, frame_number: int) -> Dict:
+        directory = await self.get_frame_directory(video_id)
+        ordinal = directory.nearest(frame_number)
+        if ordinal is None:
+            return None
+        return await self.frames.find_one({"_id": directory.frame_at(ordinal)["_id"]})
+
+    async def _video_layout(self, video_id) -> Tuple[bool, int]:
+        layout = VIDEO_ANNOTATION_LAYOUTS.get(video_id)
+        if layout is None:
+            video = await self.videos.find_one({"_id": video_id}, {"annotation_layout": 1}) or {}
+            bucket_doc = None
+            if "annotation_layout" not in video:
+                bucket_doc = await self.annotation_buckets.find_one({"video_id": video_id}, {"span": 1})
+            layout = VIDEO_ANNOTATION_LAYOUTS[video_id] = DatabaseManager._layout_of(video, bucket_doc, self.bucket_frames)
+        return layout
+
+    async def get_frame_annotations(self, frame_id: ObjectId, video_id: Optional[ObjectId] = None) -> List[Dict]:
+        frame = None
+        if video_id is None:
+            frame = await self.frames.find_one({"_id": frame_id}, {"video_id": 1, "frame_number": 1})
+            if not frame:
+                return []
+            video_id = frame["video_id"]
+        if not (await self._video_layout(video_id))[0]:
+            return await self.annotations.find({"frame_id": frame_id}).to_list()
+
+        frame = frame or await self.frames.find_one({"_id": frame_id}, {"video_id": 1, "frame_number": 1})
+        if not frame:
+            return []
+        frame_number = frame["frame_number"]
+        annotations = await self._read_bucketed_annotations(frame["video_id"], frame_number, frame_number)
+        return [annotation for annotation in annotations.get(frame_number, []) if annotation["frame_id"] == frame_id]
+
+    async def _read_bucketed_annotations(self, video_id, start_frame, end_frame) -> Dict[int, List[Dict]]:
+        bucket_docs = await self.annotation_buckets.find({
+            "video_id": video_id,
+            "start_frame": {"$lte": end_frame},
+            "end_frame": {"$gte": start_frame}
+        }).to_list()
+        span = (await self._video_layout(video_id))[1]
+        bucket_docs.extend(DatabaseManager._bucket_buffer(span).pending(video_id, start_frame, end_frame))
+        return DatabaseManager._merge_buckets(bucket_docs, self.config.get('classes', []), start_frame, end_frame)
+
+    async def _group_annotations_by_frame(self, object_ids, video_id, start_frame, end_frame) -> Dict[int, List[Dict]]:
+        if (await self._video_layout(video_id))[0]:
+            frames = await self._read_bucketed_annotations(video_id, start_frame, end_frame)
+            return DatabaseManager._select_annotations(frames, object_ids)
+
+        cursor = await self.annotations.aggregate([
+            {"$match": {"_id": {"$in": list(object_ids)}}},
+            {"$group": {"_id": "$frame_number", "annotations": {"$push": "$$ROOT"}}},
+            {"$sort": {"_id": 1}}
+        ])
+
+        result = {}
+        async for group in cursor:
+            if group["_id"] is None:
+                await self._group_by_frame_lookup(group["annotations"], result)
+            else:
+                result.setdefault(group["_id"], []).extend(group["annotations"])
+        return result
+
+    async def _group_by_frame_lookup(self, annotations: List[Dict], result: Dict[int, List[Dict]]) -> None:
+        frame_ids = list({annotation["frame_id"] for annotation in annotations})
+        frame_numbers = {
+            frame["_id"]: frame["frame_number"]
+            async for frame in self.frames.find({"_id": {"$in": frame_ids}}, {"frame_number": 1})
+        }
+        for annotation in annotations:
+            frame_number = frame_numbers.get(annotation["frame_id"])
+            if frame_number is not None:
+                result.setdefault(frame_number, []).append(annotation)
+
+    async def query_frame_range(self, video_id, start_frame, end_frame, object_class=None, class_mask=None):
+        if class_mask is not None:
+            object_class = class_mask_to_classes(class_mask)
+        classes = DatabaseManager._normalize_classes(object_class)
+
+        tree = LIVE_SEGMENT_TREES.get(video_id)
+        if tree is not None:
+            end_frame = min(end_frame, tree.n - 1)
+            if start_frame > end_frame:
+                return {}
+        else:
+            tree = await self._get_segment_tree(video_id, None)
+        if tree is None:
+            print(f"No segment tree found for video {video_id}")
+            return {}
+
+        if isinstance(tree, (CompactFrameSegmentTree, AppendableFrameSegmentTree)):
+            object_ids = await self._query_tree(tree, video_id, None, start_frame, end_frame, classes)
+        elif classes is None:
+            object_ids = tree.query(start_frame, end_frame)
+        else:
+            object_ids = set()
+            for class_id in classes:
+                class_tree = await self._get_segment_tree(video_id, class_id)
+                if class_tree is None:
+                    print(f"No segment tree found for video {video_id}, class {class_id}")
+                    continue
+                object_ids |= class_tree.query(start_frame, end_frame)
+
+        return await self._group_annotations_by_frame(object_ids, video_id, start_frame, end_frame)
+
+    async def query_region(self, video_id, start_frame, end_frame, region, object_class=None, contained=False):
+        spatial_index = await self._load_spatial_index(video_id)
+        if spatial_index is None:
+            print(f"No spatial index found for video {video_id}")
+            return {}
+
+        classes = DatabaseManager._normalize_classes(object_class)
+        object_ids = spatial_index.query(start_frame, end_frame, region, classes, contained)
+        return await self._group_annotations_by_frame(object_ids, video_id, start_frame, end_frame)
+
+    async def aggregate_frame_range(self, video_id, start_frame, end_frame, object_class=None) -> Dict[str, Any]:
+        tree = await self._load_count_tree(video_id)
+        return DatabaseManager._summarize_counts(tree, start_frame, end_frame, object_class)
+
+    async def count_frame_range(self, video_id, start_frame, end_frame, object_class=None) -> int:
+        return (await self.aggregate_frame_range(video_id, start_frame, end_frame, object_class)).get("count", 0)
+
+    async def query_frames_matching(self, video_id, predicate: FramePredicate, start_frame=0, end_frame=None) -> List[tuple]:
+        bitmap_index = await self._load_frame_bitmaps(video_id)
+        if bitmap_index is None:
+            print(f"No frame bitmaps found for video {video_id}")
+            return []
+
+        end_frame = bitmap_index.n - 1 if end_frame is None else min(end_frame, bitmap_index.n - 1)
+        return bitmap_frame_ranges(
+            DatabaseManager._inferred_only(predicate.evaluate(bitmap_index), await self.get_frame_sampling(video_id)),
+            max(start_frame, 0), end_frame
+        )
+
+    async def gather_limited(self, awaitables: Iterable[Awaitable], concurrency: Optional[int] = None) -> List:
+        # asyncio.gather with at most `concurrency` awaitables in flight, so a
+        # fan-out over many videos does not exhaust the connection pool.
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+
+        async def run(awaitable):
+            async with semaphore:
+                return await awaitable
+
+        return await asyncio.gather(*(run(awaitable) for awaitable in awaitables))
+
+    async def _video_ids(self, video_ids=None) -> List[ObjectId]:
+        if video_ids is not None:
+            return list(video_ids)
+        return [video["_id"] async for video in self.videos.find({}, {"_id": 1})]
+
+    async def query_frame_range_all_videos(self, start_frame, end_frame, object_class=None,
+                                           video_ids=None) -> Dict[ObjectId, Dict[int, List[Dict]]]:
+        video_ids = await self._video_ids(video_ids)
+        results = await self.gather_limited(
+            self.query_frame_range(video_id, start_frame, end_frame, object_class) for video_id in video_ids
+        )
+        return {video_id: result for video_id, result in zip(video_ids, results) if result}
+
+    async def query_region_all_videos(self, start_frame, end_frame, region, object_class=None, contained=False,
+                                      video_ids=None) -> Dict[ObjectId, Dict[int, List[Dict]]]:
+        video_ids = await self._video_ids(video_ids)
+        results = await self.gather_limited(
+            self.query_region(video_id, start_frame, end_frame, region, object_class, contained)
+            for video_id in video_ids
+        )
+        return {video_id: result for video_id, result in zip(video_ids, results) if result}
+
+    async def aggregate_frame_range_all_videos(self, start_frame, end_frame, object_class=None,
+                                               video_ids=None) -> Dict[ObjectId, Dict[str, Any]]:
+        video_ids = await self._video_ids(video_ids)
+        results = await self.gather_limited(
+            self.aggregate_frame_range(video_id, start_frame, end_frame, object_class) for video_id in video_ids
+        )
+        return {video_id: result for video_id, result in zip(video_ids, results) if result}
+
+    async def aggregate_ranges(self, video_id, ranges: Iterable[Tuple[int, int]],
+                               object_class=None) -> List[Dict[str, Any]]:
+        # The count tree is loaded once; every range is then answered from it.
+        tree = await self._load_count_tree(video_id)
+        return [
+            DatabaseManager._summarize_counts(tree, start_frame, end_frame, object_class)
+            for start_frame, end_frame in ranges
+        ]
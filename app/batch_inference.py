@@ -0,0 +1,86 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+import numpy as np
+
+
+class BatchInference:
+    # Runs a model on frames submitted from any thread, in batches of up to
+    # max_batch frames. A batch is sent once it is full or max_wait_ms after
+    # its first frame arrived, whichever is sooner; each submit() gets a
+    # Future resolved with that frame's result.
+
+    def __init__(self, model: Callable[[List[np.ndarray]], List[Any]], max_batch: int = 8, max_wait_ms: float = 20):
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.frames = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, frame: np.ndarray) -> Future:
+        if self._closed:
+            raise RuntimeError("BatchInference is closed")
+        future = Future()
+        self._queue.put((frame, future))
+        return future
+
+    def infer(self, frame: np.ndarray) -> Any:
+        return self.submit(frame).result()
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self) -> 'BatchInference':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _next_batch(self) -> List:
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop.
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            futures = [future for _, future in batch if future.set_running_or_notify_cancel()]
+            frames = [frame for frame, future in batch if future.running()]
+            if not frames:
+                continue
+            try:
+                results = self.model(frames)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.frames += len(frames)
+            for future, result in zip(futures, results):
+                future.set_result(result)
@@ -0,0 +1,82 @@
+import queue
+import threading
+from typing import Dict, List, Any, Optional
+
+from pymongo.errors import BulkWriteError
+
+
+class BulkWriter:
+    # Buffers documents per collection and inserts them in unordered
+    # insert_many batches on a background thread. The queue of pending
+    # batches is bounded, so a producer that outruns the server blocks
+    # instead of buffering the whole dataset.
+
+    def __init__(self, batch_size: int = 5000, max_pending_batches: int = 4):
+        self.batch_size = batch_size
+        self.inserted = 0
+        self._buffers = {}
+        self._collections = {}
+        self._queue = queue.Queue(maxsize=max_pending_batches)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, collection, document: Dict[str, Any]) -> None:
+        buffer = self._buffers.setdefault(collection.full_name, [])
+        self._collections[collection.full_name] = collection
+        buffer.append(document)
+        if len(buffer) >= self.batch_size:
+            self._submit(collection.full_name)
+
+    def add_many(self, collection, documents: List[Dict[str, Any]]) -> None:
+        for document in documents:
+            self.add(collection, document)
+
+    def flush(self) -> None:
+        for name in list(self._buffers):
+            if self._buffers[name]:
+                self._submit(name)
+
+    def close(self) -> int:
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self.inserted
+
+    def _submit(self, name: str) -> None:
+        if self._error is not None:
+            raise self._error
+        self._queue.put((self._collections[name], self._buffers[name]))
+        self._buffers[name] = []
+
+    def _run(self) -> None:
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                continue
+            collection, documents = batch
+            try:
+                result = collection.insert_many(documents, ordered=False)
+                self.inserted += len(result.inserted_ids)
+            except BulkWriteError as e:
+                self.inserted += e.details.get("nInserted", 0)
+                self._error = e
+            except Exception as e:
+                self._error = e
+
+    def __enter__(self) -> 'BulkWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> Optional[bool]:
+        if exc_type is None:
+            self.close()
+        else:
+            # Drain and stop the writer without masking the original error.
+            self._buffers = {}
+            self._queue.put(None)
+            self._thread.join()
+        return None
@@ -1,42 +1,146 @@
+import os
 import sys
 import datetime
+import threading
 import cv2
 from pathlib import Path
-from typing import Dict, List, Any
-from pymongo import MongoClient
+from typing import Dict, List, Any, Optional, Tuple
+from pymongo import DeleteMany, ReplaceOne, UpdateMany, UpdateOne
+from bson.binary import Binary
 from bson.objectid import ObjectId
 
-from app.segment_tree import FrameSegmentTree
+from app.cache import LRUCache
+from app.storage_backend import create_storage_backend
+from app.bulk_writer import BulkWriter
+from app.frame_directory import FrameDirectory
+from app.frame_store import VideoFrameStore
+from app.frame_sampler import FrameSamplingRecord
+from app.import_manifest import fingerprint_files, content_changed
+from app.annotation_buckets import AnnotationBucketBuffer, bucket_index, decode_bucket, replace_frame_ids
+from utils.converters import parse_visdrone_files, visdrone_records_to_mongodb_format
+from app.spatial_index import SpatialGridIndex
+from app.frame_bitmap import FrameBitmapIndex, FramePredicate, bitmap_frame_ranges
+from app.segment_tree import (
+    SEGMENT_TREE_KINDS, FrameSegmentTree, CompactFrameSegmentTree, LazyFrameSegmentTree,
+    AppendableFrameSegmentTree, FrameCountTree,
+    class_mask_to_classes, segment_tree_from_dict
+)
+
+# Deserialized trees shared by every DatabaseManager in the process, keyed by
+# (video_id, object_class); count trees use the object_class slot "counts".
+SEGMENT_TREE_CACHE = LRUCache(256 * 1024 * 1024, lambda tree: tree.memory_usage())
+
+# Trees and spatial indexes of videos that are still being ingested, fed
+# frame by frame.
+LIVE_SEGMENT_TREES = {}
+LIVE_SPATIAL_INDEXES = {}
+
+# Bucketed annotations of videos being ingested, keyed by bucket span.
+PENDING_ANNOTATION_BUCKETS = {}
+
+# (bucketed, bucket span) each video's annotations are stored with, keyed by
+# video id; read from the video document once.
+VIDEO_ANNOTATION_LAYOUTS = {}
 
 class DatabaseManager:
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         
-        db_config = config.get('mongodb', {})
-        uri = db_config.get('uri', 'mongodb://localhost:27017')
-        db_name = db_config.get('db_name', 'visdrone_db')
-        
         try:
-            self.client = MongoClient(uri)
-            self.db = self.client[db_name]
-            self.videos = self.db["videos"]
-            self.frames = self.db["frames"]
-            self.annotations = self.db["annotations"]
-            self.segment_trees = self.db["segment_trees"]
-            print(f"Connected to MongoDB at {uri}")
+            self.backend = create_storage_backend(config)
+            self.videos = self.backend.collection("videos")
+            self.frames = self.backend.collection("frames")
+            self.annotations = self.backend.collection("annotations")
+            self.segment_trees = self.backend.collection("segment_trees")
+            self.count_trees = self.backend.collection("count_trees")
+            self.segment_tree_nodes = self.backend.collection("segment_tree_nodes")
+            self.spatial_indices = self.backend.collection("spatial_indices")
+            self.frame_bitmaps = self.backend.collection("frame_bitmaps")
+            self.frame_sampling = self.backend.collection("frame_sampling")
+            self.migrations = self.backend.collection("migrations")
+            self.annotation_buckets = self.backend.collection("annotation_buckets")
+            self.import_manifests = self.backend.collection("import_manifests")
+            storage_config = config.get('annotation_storage', {})
+            self.bucketed = storage_config.get('layout', 'documents') == 'buckets'
+            self.bucket_frames = storage_config.get('bucket_frames', 256)
+            self.segment_tree_files = self.backend.file_store("segment_tree_files")
+            frame_store_config = config.get('frame_store', {})
+            self.frame_store = VideoFrameStore(
+                frame_store_config.get('max_open_videos', 4),
+                frame_store_config.get('max_forward_frames', 30)
+            )
+            self.tree_cache = SEGMENT_TREE_CACHE
+            cache_max_bytes = config.get('segment_tree', {}).get('cache_max_bytes')
+            if cache_max_bytes is not None:
+                self.tree_cache.resize(cache_max_bytes)
+            print(f"Using {self.backend.describe()}")
         except Exception as e:
-            print(f"Error connecting to MongoDB: {e}")
+            print(f"Error opening database storage: {e}")
             sys.exit(1)
 
     def create_indices(self):
         self.frames.create_index([("video_id", 1), ("frame_number", 1)])
         self.annotations.create_index([("frame_id", 1)])
         self.annotations.create_index([("class_id", 1)])
+        self.annotations.create_index([("video_id", 1), ("frame_number", 1)])
+        self.annotation_buckets.create_index([("video_id", 1), ("start_frame", 1)])
+        self.import_manifests.create_index([("video_id", 1), ("frame_number", 1)])
         self.segment_trees.create_index([("video_id", 1), ("object_class", 1)])
+        self.count_trees.create_index([("video_id", 1)])
+        self.spatial_indices.create_index([("video_id", 1)])
+        self.frame_bitmaps.create_index([("video_id", 1)])
+        self.frame_sampling.create_index([("video_id", 1)])
+        self.segment_tree_nodes.create_index([
+            ("video_id", 1), ("object_class", 1), ("kind", 1), ("partition", 1), ("page", 1)
+        ])
         print("Database indices created")
     
-    def import_visdrone_dataset(self, dataset_path: str, fps: int = 30) -> List[ObjectId]:
+    def start_background_setup(self) -> threading.Thread:
+        # Index creation and migrations wait for the server; run them off
+        # the GUI thread so the window paints before the cluster answers.
+        def setup():
+            try:
+                self.create_indices()
+                self.run_migrations()
+            except Exception as e:
+                print(f"Background database setup failed: {e}")
+        
+        thread = threading.Thread(target=setup, daemon=True)
+        thread.start()
+        return thread
+    
+    def run_migrations(self):
+        migrations = [
+            ("annotation_frame_fields", self._migrate_annotation_frame_fields)
+        ]
+        for name, migrate in migrations:
+            if self.migrations.find_one({"_id": name}):
+                continue
+            print(f"Running migration {name}...")
+            migrate()
+            self.migrations.insert_one({"_id": name, "applied_at": datetime.datetime.now()})
+    
+    def _migrate_annotation_frame_fields(self, batch_size: int = 1000):
+        # Copies video_id and frame_number from each frame onto its
+        # annotations, one UpdateMany per frame sent in bulk batches.
+        operations = []
+        updated = 0
+        for frame in self.frames.find({}, {"video_id": 1, "frame_number": 1}):
+            operations.append(UpdateMany(
+                {"frame_id": frame["_id"], "frame_number": {"$exists": False}},
+                {"$set": {"video_id": frame["video_id"], "frame_number": frame["frame_number"]}}
+            ))
+            if len(operations) >= batch_size:
+                updated += self.annotations.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            updated += self.annotations.bulk_write(operations, ordered=False).modified_count
+        print(f"Backfilled frame fields on {updated} annotations")
+    
+    def import_visdrone_dataset(self, dataset_path: str, fps: int = 30, incremental: Optional[bool] = None) -> List[ObjectId]:
+        # incremental: when a video was imported before, only frames whose
+        # files changed since (per the import manifest) are written again.
         dataset_path = Path(dataset_path)
         images_path = dataset_path / "images"
         annotations_path = dataset_path / "annotations"
@@ -70,6 +174,9 @@ class DatabaseManager:
         print(f"Found {len(videos)} videos in dataset")
         
         created_video_ids = []
+        import_config = self.config.get('dataset_import', {})
+        if incremental is None:
+            incremental = import_config.get('incremental', True)
         
         for video_id, frames in videos.items():
             frames.sort(key=lambda x: x[0])
@@ -91,102 +198,558 @@ class DatabaseManager:
             }
             
             existing_video = self.videos.find_one({"video_id": video_id})
+            annotation_files = [annotations_path / f"{image_file.stem}.txt" for _, image_file in frames]
             if existing_video:
-                print(f"Video '{video_name}' already exists, updating...")
                 mongo_video_id = existing_video["_id"]
                 self.videos.update_one({"_id": mongo_video_id}, {"$set": video_data})
+                # Cleared again once the writes land: a query in between can
+                # cache trees or annotations that are about to be replaced.
+                self.invalidate_tree_cache(mongo_video_id)
+                created_video_ids.append(mongo_video_id)
                 
-                self.frames.delete_many({"video_id": mongo_video_id})
-                frame_ids = [f["_id"] for f in self.frames.find({"video_id": mongo_video_id})]
-                self.annotations.delete_many({"frame_id": {"$in": frame_ids}})
+                manifest = {
+                    entry["frame_number"]: entry
+                    for entry in self.import_manifests.find({"video_id": mongo_video_id})
+                }
+                if incremental and manifest and self._stored_layout_matches(mongo_video_id):
+                    print(f"Video '{video_name}' already exists, importing changed frames...")
+                    self._import_changed_frames(mongo_video_id, video_id, frames, annotation_files, manifest, fps)
+                    self.invalidate_tree_cache(mongo_video_id)
+                    continue
+                
+                print(f"Video '{video_name}' already exists, updating...")
+                self._delete_frames_and_annotations(mongo_video_id)
+                self._set_video_layout(mongo_video_id)
             else:
-                result = self.videos.insert_one(video_data)
+                result = self.videos.insert_one({**video_data, "annotation_layout": self._configured_layout()})
                 mongo_video_id = result.inserted_id
+                created_video_ids.append(mongo_video_id)
                 print(f"Created new video document with ID: {mongo_video_id}")
             
-            created_video_ids.append(mongo_video_id)
             class_names = self.config.get('classes', [])
             frame_annotations = {}
             
-            for frame_number, image_file in frames:
-                print(f"Processing frame {frame_number} from {image_file}")
-                
-                frame_data = {
-                    "video_id": mongo_video_id,
-                    "original_video_id": video_id,
-                    "frame_number": frame_number, 
-                    "image_path": str(image_file),
-                    "timestamp": frame_number / fps
-                }
-                
-                frame_result = self.frames.insert_one(frame_data)
-                frame_id = frame_result.inserted_id
-                
-                frame_annotations[frame_number] = []
+            parsed_files = parse_visdrone_files(
+                annotation_files,
+                len(class_names),
+                import_config.get('parse_workers', 4),
+                import_config.get('parse_chunk_files', 256)
+            )
+            fingerprints = self._fingerprint_frames(frames, annotation_files, {})
+            
+            bucket_buffer = AnnotationBucketBuffer(self.bucket_frames) if self.bucketed else None
+            
+            with BulkWriter(
+                import_config.get('batch_size', 5000),
+                import_config.get('max_pending_batches', 4)
+            ) as writer:
+                for (frame_number, image_file), records, fingerprint in zip(frames, parsed_files, fingerprints):
+                    # Ids are assigned client-side so annotations can reference
+                    # their frame before the frame batch reaches the server.
+                    frame_id = ObjectId()
+                    writer.add(self.frames, self._frame_doc(frame_id, mongo_video_id, video_id, frame_number, image_file, fps))
+                    writer.add(self.import_manifests, self._manifest_entry(mongo_video_id, frame_number, *fingerprint))
+                    
+                    annotation_docs = self._annotation_docs(records, frame_id, mongo_video_id, frame_number, frame_annotations)
+                    
+                    if bucket_buffer is None:
+                        writer.add_many(self.annotations, annotation_docs)
+                    else:
+                        # Frames arrive in order, so every earlier bucket is complete.
+                        bucket_buffer.add(mongo_video_id, frame_number, frame_id, annotation_docs)
+                        writer.add_many(
+                            self.annotation_buckets,
+                            bucket_buffer.pop_before(mongo_video_id, bucket_index(frame_number, self.bucket_frames))
+                        )
                 
-                annotation_file = annotations_path / f"{image_file.stem}.txt"
-                if annotation_file.exists():
-                    with open(annotation_file, "r") as f:
-                        for line in f:
-                            parts = line.strip().split(",")
-                            if len(parts) >= 6:
-                                x, y, w, h = map(int, parts[:4])
-                                score = int(parts[4])
-                                class_id = int(parts[5]) - 1  
-                                
-                                if score == 0:
-                                    continue
-                                
-                                if 0 <= class_id < len(class_names):
-                                    annotation_data = {
-                                        "frame_id": frame_id,
-                                        "bbox": [x, y, w, h],
-                                        "class_id": class_id,
-                                        "class_name": class_names[class_id],
-                                        "confidence": 1.0  # Default confidence
-                                    }
-                                    
-                                    annotation_result = self.annotations.insert_one(annotation_data)
-                                    
-                                    frame_annotations[frame_number].append({
-                                        "_id": annotation_result.inserted_id,
-                                        "class_id": class_id
-                                    })
+                if bucket_buffer is not None:
+                    writer.add_many(self.annotation_buckets, bucket_buffer.pop_all(mongo_video_id))
             
+            print(f"Inserted {writer.inserted} documents")
             print(f"Processed {len(frames)} frames for video {video_id}")
             
             self._build_segment_trees(mongo_video_id, frame_annotations, max(frame_annotations.keys()) + 1)
     
         return created_video_ids
-  
-    def _build_segment_trees(self, video_id, frame_annotations, max_frame_number):
+    
+    @staticmethod
+    def _frame_doc(frame_id, video_id, original_video_id, frame_number, image_file, fps) -> Dict:
+        return {
+            "_id": frame_id,
+            "video_id": video_id,
+            "original_video_id": original_video_id,
+            "frame_number": frame_number, 
+            "image_path": str(image_file),
+            "timestamp": frame_number / fps
+        }
+    
+    def _annotation_docs(self, records, frame_id, video_id, frame_number, frame_annotations) -> List[Dict]:
+        # Annotation documents of one frame; the fields trees are built from
+        # are also collected into frame_annotations.
+        annotation_docs = visdrone_records_to_mongodb_format(records, frame_id, self.config.get('classes', []))
+        frame_annotations[frame_number] = []
+        for annotation_data in annotation_docs:
+            annotation_data["_id"] = ObjectId()
+            annotation_data["video_id"] = video_id
+            annotation_data["frame_number"] = frame_number
+            
+            frame_annotations[frame_number].append({
+                "_id": annotation_data["_id"],
+                "class_id": annotation_data["class_id"],
+                "bbox": annotation_data["bbox"]
+            })
+        return annotation_docs
+    
+    @staticmethod
+    def _manifest_entry(video_id, frame_number, image_fingerprint, annotation_fingerprint) -> Dict:
+        return {
+            "video_id": video_id,
+            "frame_number": frame_number,
+            "image": image_fingerprint,
+            "annotation": annotation_fingerprint
+        }
+    
+    def _fingerprint_frames(self, frames, annotation_files, manifest) -> List[tuple]:
+        workers = self.config.get('dataset_import', {}).get('parse_workers', 4)
+        previous = [manifest.get(frame_number, {}) for frame_number, _ in frames]
+        image_fingerprints = fingerprint_files(
+            [image_file for _, image_file in frames], [entry.get("image") for entry in previous], workers
+        )
+        annotation_fingerprints = fingerprint_files(
+            annotation_files, [entry.get("annotation") for entry in previous], workers
+        )
+        return list(zip(image_fingerprints, annotation_fingerprints))
+    
+    def _stored_layout_matches(self, video_id) -> bool:
+        # Changed frames are patched in place only if the stored annotations
+        # use the configured layout (and bucket span).
+        bucketed, span = self._video_layout(video_id)
+        return bucketed == self.bucketed and (not bucketed or span == self.bucket_frames)
+    
+    def _configured_layout(self) -> Dict[str, Any]:
+        return {"layout": "buckets" if self.bucketed else "documents", "bucket_frames": self.bucket_frames}
+    
+    def _set_video_layout(self, video_id) -> None:
+        self.videos.update_one({"_id": video_id}, {"$set": {"annotation_layout": self._configured_layout()}})
+        VIDEO_ANNOTATION_LAYOUTS.pop(video_id, None)
+    
+    def _video_layout(self, video_id) -> Tuple[bool, int]:
+        # Reads follow the layout a video was imported with, not the current
+        # configuration.
+        layout = VIDEO_ANNOTATION_LAYOUTS.get(video_id)
+        if layout is None:
+            video = self.videos.find_one({"_id": video_id}, {"annotation_layout": 1}) or {}
+            bucket_doc = None
+            if "annotation_layout" not in video:
+                bucket_doc = self.annotation_buckets.find_one({"video_id": video_id}, {"span": 1})
+            layout = VIDEO_ANNOTATION_LAYOUTS[video_id] = self._layout_of(video, bucket_doc, self.bucket_frames)
+        return layout
+    
+    @staticmethod
+    def _layout_of(video: Dict, bucket_doc: Optional[Dict], default_span: int) -> Tuple[bool, int]:
+        # Videos imported before the layout was recorded are bucketed if any
+        # bucket exists for them.
+        stored = video.get("annotation_layout")
+        if stored is not None:
+            return stored["layout"] == "buckets", stored.get("bucket_frames", default_span)
+        if bucket_doc is not None:
+            return True, bucket_doc["span"]
+        return False, default_span
+    
+    @staticmethod
+    def _bucket_buffer(span: int) -> AnnotationBucketBuffer:
+        buffer = PENDING_ANNOTATION_BUCKETS.get(span)
+        if buffer is None:
+            buffer = PENDING_ANNOTATION_BUCKETS.setdefault(span, AnnotationBucketBuffer(span))
+        return buffer
+    
+    def _import_changed_frames(self, mongo_video_id, video_id, frames, annotation_files, manifest, fps) -> None:
+        # Frames whose files have the recorded content are left alone; the
+        # others are upserted, and trees are rebuilt only if annotations
+        # changed.
+        old_frame_count = max(manifest) + 1
+        fingerprints = self._fingerprint_frames(frames, annotation_files, manifest)
+        
+        manifest_operations = []
+        changed_frames = []
+        changed_annotations = []
+        for (frame_number, image_file), annotation_file, fingerprint in zip(frames, annotation_files, fingerprints):
+            entry = manifest.pop(frame_number, None)
+            image_fingerprint, annotation_fingerprint = fingerprint
+            if entry is None or entry["image"] != image_fingerprint or entry["annotation"] != annotation_fingerprint:
+                manifest_operations.append(ReplaceOne(
+                    {"video_id": mongo_video_id, "frame_number": frame_number},
+                    self._manifest_entry(mongo_video_id, frame_number, image_fingerprint, annotation_fingerprint),
+                    upsert=True
+                ))
+            if entry is None or content_changed(entry["image"], image_fingerprint):
+                changed_frames.append((frame_number, image_file))
+            if entry is None or content_changed(entry["annotation"], annotation_fingerprint):
+                changed_annotations.append((frame_number, annotation_file))
+        removed_frames = sorted(manifest)
+        
+        print(
+            f"{len(changed_frames)} frames and {len(changed_annotations)} annotation files changed, "
+            f"{len(removed_frames)} frames removed"
+        )
+        
+        existing_ids = {
+            frame["frame_number"]: frame["_id"]
+            for frame in self.frames.find(
+                {"video_id": mongo_video_id, "frame_number": {"$in": [fn for fn, _ in changed_frames + changed_annotations]}},
+                {"frame_number": 1}
+            )
+        }
+        # A frame whose document is missing is written again with its annotations.
+        image_files = dict(frames)
+        pending_frames = {frame_number for frame_number, _ in changed_frames}
+        changed_frames += [
+            (frame_number, image_files[frame_number])
+            for frame_number, _ in changed_annotations
+            if frame_number not in existing_ids and frame_number not in pending_frames
+        ]
+        frame_ids = {}
+        frame_operations = []
+        for frame_number, image_file in changed_frames:
+            frame_id = existing_ids.get(frame_number) or ObjectId()
+            frame_ids[frame_number] = frame_id
+            frame_operations.append(ReplaceOne(
+                {"_id": frame_id},
+                self._frame_doc(frame_id, mongo_video_id, video_id, frame_number, image_file, fps),
+                upsert=True
+            ))
+        if removed_frames:
+            frame_operations.append(DeleteMany({"video_id": mongo_video_id, "frame_number": {"$in": removed_frames}}))
+            manifest_operations.append(DeleteMany({"video_id": mongo_video_id, "frame_number": {"$in": removed_frames}}))
+        if frame_operations:
+            self.frames.bulk_write(frame_operations, ordered=False)
+        if manifest_operations:
+            self.import_manifests.bulk_write(manifest_operations, ordered=False)
+        
+        if not changed_annotations and not removed_frames:
+            print(f"Annotations of video {video_id} unchanged, keeping segment trees")
+            return
+        
+        class_names = self.config.get('classes', [])
+        import_config = self.config.get('dataset_import', {})
+        replaced = [frame_number for frame_number, _ in changed_annotations] + removed_frames
+        new_annotations = {}
+        annotation_docs = {}
+        parsed_files = parse_visdrone_files(
+            [annotation_file for _, annotation_file in changed_annotations],
+            len(class_names),
+            import_config.get('parse_workers', 4),
+            import_config.get('parse_chunk_files', 256)
+        )
+        for (frame_number, _), records in zip(changed_annotations, parsed_files):
+            frame_id = frame_ids.get(frame_number, existing_ids.get(frame_number))
+            annotation_docs[frame_number] = (
+                frame_id, self._annotation_docs(records, frame_id, mongo_video_id, frame_number, new_annotations)
+            )
+        
+        bucketed, span = self._video_layout(mongo_video_id)
+        if bucketed:
+            affected_classes = self._replace_bucketed_frames(mongo_video_id, annotation_docs, removed_frames, span)
+        else:
+            affected_classes = set(self.annotations.distinct(
+                "class_id", {"video_id": mongo_video_id, "frame_number": {"$in": replaced}}
+            ))
+            self.annotations.delete_many({"video_id": mongo_video_id, "frame_number": {"$in": replaced}})
+            docs = [doc for _, frame_docs in annotation_docs.values() for doc in frame_docs]
+            for start in range(0, len(docs), import_config.get('batch_size', 5000)):
+                self.annotations.insert_many(docs[start:start + import_config.get('batch_size', 5000)], ordered=False)
+        affected_classes |= {
+            annotation["class_id"] for annotations in new_annotations.values() for annotation in annotations
+        }
+        
+        frame_count = max(frame_number for frame_number, _ in frames) + 1
+        frame_annotations = self._load_frame_annotations(mongo_video_id, frame_count)
+        for frame_number, _ in frames:
+            frame_annotations.setdefault(frame_number, [])
+        # Per-class trees span every frame, so all of them are rebuilt when
+        # the frame count changes.
+        self._build_segment_trees(
+            mongo_video_id, frame_annotations, frame_count,
+            affected_classes if frame_count == old_frame_count else None
+        )
+    
+    def _replace_bucketed_frames(self, video_id, annotation_docs, removed_frames, span: int) -> set:
+        # Re-encodes the buckets holding replaced or removed frames; returns
+        # the classes of the annotations they held before.
+        buckets = sorted({bucket_index(frame_number, span) for frame_number in list(annotation_docs) + removed_frames})
+        removed = set(removed_frames)
+        directory = FrameDirectory.from_frames(
+            self.frames.find({"video_id": video_id}, {"frame_number": 1, "image_path": 1, "timestamp": 1})
+        )
+        
+        affected_classes = set()
+        bucket_buffer = AnnotationBucketBuffer(span)
+        for bucket in buckets:
+            stored = self._read_bucketed_annotations(video_id, bucket * span, bucket * span + span - 1)
+            for frame_number in range(bucket * span, bucket * span + span):
+                if frame_number in annotation_docs or frame_number in removed:
+                    affected_classes |= {annotation["class_id"] for annotation in stored.get(frame_number, [])}
+                if frame_number in annotation_docs:
+                    bucket_buffer.add(video_id, frame_number, *annotation_docs[frame_number])
+                elif frame_number not in removed and directory.ordinal(frame_number) is not None:
+                    frame_id = directory.frame_at(directory.ordinal(frame_number))["_id"]
+                    bucket_buffer.add(video_id, frame_number, frame_id, stored.get(frame_number, []))
+        
+        self.annotation_buckets.delete_many({"video_id": video_id, "bucket": {"$in": buckets}})
+        bucket_docs = bucket_buffer.pop_all(video_id)
+        if bucket_docs:
+            self.annotation_buckets.insert_many(bucket_docs, ordered=False)
+        return affected_classes
+    
+    def _load_frame_annotations(self, video_id, frame_count) -> Dict[int, List[Dict]]:
+        # The fields tree builds need, for every stored annotation of a video.
+        if self._video_layout(video_id)[0]:
+            return self._read_bucketed_annotations(video_id, 0, frame_count - 1)
+        
+        frame_annotations = {}
+        for annotation in self.annotations.find(
+            {"video_id": video_id}, {"frame_number": 1, "class_id": 1, "bbox": 1}
+        ).sort([("frame_number", 1)]):
+            frame_annotations.setdefault(annotation.pop("frame_number"), []).append(annotation)
+        return frame_annotations
+    
+    def _build_segment_trees(self, video_id, frame_annotations, max_frame_number, object_classes=None):
+        # object_classes limits which per-class trees are rebuilt; the general
+        # tree, count tree, bitmaps and spatial index always are.
         print("Building segment trees...")
         
-        self.segment_trees.delete_many({"video_id": video_id})
+        self._delete_segment_trees(video_id, None if object_classes is None else [None] + sorted(object_classes))
+        
+        representation = self.config.get('segment_tree', {}).get('representation', 'compact')
+        tree_cls = SEGMENT_TREE_KINDS.get(representation, FrameSegmentTree)
         
-        general_tree = FrameSegmentTree(max_frame_number)
+        general_tree = tree_cls(max_frame_number)
         general_tree.build(frame_annotations)
+        self._store_segment_tree(video_id, None, general_tree)
         
+        class_names = self.config.get('classes', [])
+        # A compact tree is partitioned by class, so it serves class queries too.
+        if tree_cls is FrameSegmentTree:
+            for class_id in range(len(class_names)):
+                if object_classes is not None and class_id not in object_classes:
+                    continue
+                class_tree = tree_cls(max_frame_number, class_id)
+                class_tree.build(frame_annotations)
+                self._store_segment_tree(video_id, class_id, class_tree)
+        
+        count_tree = FrameCountTree(max_frame_number, len(class_names))
+        count_tree.build(frame_annotations)
+        self._store_count_tree(video_id, count_tree)
+        self._store_frame_bitmaps(video_id, FrameBitmapIndex.from_counts(count_tree.frame_counts))
+        
+        spatial_index = SpatialGridIndex(self.config.get('spatial_index', {}).get('cell_size', 128))
+        spatial_index.build(frame_annotations)
+        self._store_spatial_index(video_id, spatial_index)
+        
+        self.invalidate_tree_cache(video_id)
+        
+        print("Segment trees built and stored")
+    
+    def start_live_segment_tree(self, video_id) -> AppendableFrameSegmentTree:
+        tree = AppendableFrameSegmentTree()
+        LIVE_SEGMENT_TREES[video_id] = tree
+        LIVE_SPATIAL_INDEXES[video_id] = SpatialGridIndex(self.config.get('spatial_index', {}).get('cell_size', 128))
+        self.invalidate_tree_cache(video_id)
+        return tree
+    
+    def append_live_frame(self, video_id, frame_number: int, objects: List[Dict]) -> None:
+        LIVE_SEGMENT_TREES[video_id].append_frame(frame_number, objects)
+        LIVE_SPATIAL_INDEXES[video_id].add_frame(frame_number, objects)
+    
+    def finish_live_segment_tree(self, video_id) -> None:
+        tree = LIVE_SEGMENT_TREES.get(video_id)
+        if tree is None:
+            return
+        
+        if tree.n == 0:
+            print("No frames found, skipping segment tree creation")
+        else:
+            print("Storing segment trees...")
+            self._delete_segment_trees(video_id)
+            self._store_segment_tree(video_id, None, tree.to_compact())
+            
+            num_classes = len(self.config.get('classes', []))
+            count_tree = FrameCountTree(tree.n, num_classes)
+            count_tree.build_from_counts(tree.frame_counts(num_classes))
+            self._store_count_tree(video_id, count_tree)
+            self._store_frame_bitmaps(video_id, FrameBitmapIndex.from_counts(count_tree.frame_counts))
+            self._store_spatial_index(video_id, LIVE_SPATIAL_INDEXES[video_id])
+            print("Segment trees built and stored")
+        
+        self.discard_live_segment_tree(video_id)
+        self.invalidate_tree_cache(video_id)
+    
+    def discard_live_segment_tree(self, video_id) -> None:
+        LIVE_SEGMENT_TREES.pop(video_id, None)
+        LIVE_SPATIAL_INDEXES.pop(video_id, None)
+    
+    def _store_count_tree(self, video_id, count_tree: FrameCountTree) -> None:
+        self.count_trees.delete_many({"video_id": video_id})
+        self.count_trees.insert_one({
+            "video_id": video_id,
+            "tree_structure": count_tree.to_dict()
+        })
+    
+    def _store_segment_tree(self, video_id, object_class, tree) -> None:
         tree_data = {
             "video_id": video_id,
-            "object_class": None,  
-            "tree_structure": general_tree.to_dict()
+            "object_class": object_class
         }
+        
+        tree_config = self.config.get('segment_tree', {})
+        if isinstance(tree, CompactFrameSegmentTree) and tree_config.get('storage', 'paged') == 'paged':
+            header, pages = tree.to_pages(
+                tree_config.get('page_frames', 4096),
+                tree_config.get('page_ids', 4096)
+            )
+            for page in pages:
+                page["video_id"] = video_id
+                page["object_class"] = object_class
+                page["data"] = Binary(page["data"])
+            for start in range(0, len(pages), 1000):
+                self.segment_tree_nodes.insert_many(pages[start:start + 1000], ordered=False)
+            tree_data["format"] = "paged"
+            tree_data["tree_header"] = header
+        elif isinstance(tree, CompactFrameSegmentTree):
+            self._put_packed(tree_data, tree.to_bytes())
+        else:
+            tree_data["tree_structure"] = tree.to_dict()
+        
         self.segment_trees.insert_one(tree_data)
+    
+    def _load_segment_tree(self, tree_doc: Dict):
+        tree_format = tree_doc.get("format", "dict")
+        if tree_format == "paged":
+            tree = LazyFrameSegmentTree(
+                tree_doc["tree_header"],
+                lambda keys: self._load_tree_pages(tree_doc["video_id"], tree_doc["object_class"], keys)
+            )
+            # Pages loaded by queries count against the cache budget.
+            key = (tree_doc["video_id"], tree_doc["object_class"])
+            tree.on_grow = lambda: self.tree_cache.recharge(key, tree)
+            return tree
+        if tree_format in ("binary", "gridfs"):
+            return CompactFrameSegmentTree.from_bytes(self._get_packed(tree_doc))
+        return segment_tree_from_dict(tree_doc["tree_structure"])
+    
+    def _put_packed(self, doc: Dict, packed: bytes) -> None:
+        # Inline as BSON Binary when it fits comfortably in a document,
+        # otherwise in GridFS.
+        inline_limit = self.config.get('segment_tree', {}).get('inline_limit_bytes', 8 * 1024 * 1024)
+        if len(packed) <= inline_limit:
+            doc["format"] = "binary"
+            doc["tree_binary"] = Binary(packed)
+        else:
+            doc["format"] = "gridfs"
+            doc["gridfs_id"] = self.segment_tree_files.put(packed, video_id=doc["video_id"])
+    
+    def _get_packed(self, doc: Dict) -> bytes:
+        if doc["format"] == "gridfs":
+            return self.segment_tree_files.get(doc["gridfs_id"]).read()
+        return doc["tree_binary"]
+    
+    def _delete_packed(self, collection, query: Dict) -> None:
+        for doc in collection.find({**query, "format": "gridfs"}, {"gridfs_id": 1}):
+            self.segment_tree_files.delete(doc["gridfs_id"])
+        collection.delete_many(query)
+    
+    def _store_spatial_index(self, video_id, spatial_index: SpatialGridIndex) -> None:
+        self._delete_packed(self.spatial_indices, {"video_id": video_id})
+        index_data = {"video_id": video_id}
+        self._put_packed(index_data, spatial_index.to_bytes())
+        self.spatial_indices.insert_one(index_data)
+    
+    def _store_frame_bitmaps(self, video_id, bitmap_index: FrameBitmapIndex) -> None:
+        self._delete_packed(self.frame_bitmaps, {"video_id": video_id})
+        bitmap_data = {"video_id": video_id}
+        self._put_packed(bitmap_data, bitmap_index.to_bytes())
+        self.frame_bitmaps.insert_one(bitmap_data)
+    
+    def _load_frame_bitmaps(self, video_id) -> Optional[FrameBitmapIndex]:
+        live_tree = LIVE_SEGMENT_TREES.get(video_id)
+        if live_tree is not None:
+            num_classes = len(self.config.get('classes', []))
+            return FrameBitmapIndex.from_counts(live_tree.frame_counts(num_classes))
         
-        class_names = self.config.get('classes', [])
-        for class_id in range(len(class_names)):
-            class_tree = FrameSegmentTree(max_frame_number, class_id)
-            class_tree.build(frame_annotations)
-            
-            tree_data = {
-                "video_id": video_id,
-                "object_class": class_id,
-                "tree_structure": class_tree.to_dict()
-            }
-            self.segment_trees.insert_one(tree_data)
+        def load():
+            bitmap_doc = self.frame_bitmaps.find_one({"video_id": video_id})
+            return FrameBitmapIndex.from_bytes(self._get_packed(bitmap_doc)) if bitmap_doc else None
         
-        print("Segment trees built and stored")
+        return self.tree_cache.get_or_load((video_id, "bitmaps"), load)
+    
+    def store_frame_sampling(self, video_id, sampling: FrameSamplingRecord) -> None:
+        self._delete_packed(self.frame_sampling, {"video_id": video_id})
+        sampling_data = {"video_id": video_id}
+        self._put_packed(sampling_data, sampling.to_bytes())
+        self.frame_sampling.insert_one(sampling_data)
+        self.videos.update_one({"_id": video_id}, {"$set": {"inferred_frames": len(sampling.inferred_frames())}})
+        # Count trees are built with the sampling mask, so they go too.
+        self.tree_cache.invalidate(lambda key: key in ((video_id, "sampling"), (video_id, "counts")))
+    
+    def get_frame_sampling(self, video_id) -> Optional[FrameSamplingRecord]:
+        # None for videos where every frame was inferred, e.g. datasets.
+        def load():
+            sampling_doc = self.frame_sampling.find_one({"video_id": video_id})
+            return FrameSamplingRecord.from_bytes(self._get_packed(sampling_doc)) if sampling_doc else None
+        
+        return self.tree_cache.get_or_load((video_id, "sampling"), load)
+    
+    def _load_spatial_index(self, video_id) -> Optional[SpatialGridIndex]:
+        live_index = LIVE_SPATIAL_INDEXES.get(video_id)
+        if live_index is not None:
+            return live_index
+        
+        def load():
+            index_doc = self.spatial_indices.find_one({"video_id": video_id})
+            return SpatialGridIndex.from_bytes(self._get_packed(index_doc)) if index_doc else None
+        
+        return self.tree_cache.get_or_load((video_id, "spatial"), load)
+    
+    def _get_segment_tree(self, video_id, object_class):
+        def load():
+            tree_doc = self.segment_trees.find_one({"video_id": video_id, "object_class": object_class})
+            return self._load_segment_tree(tree_doc) if tree_doc else None
+        
+        return self.tree_cache.get_or_load((video_id, object_class), load)
+    
+    def invalidate_tree_cache(self, video_id) -> None:
+        self.tree_cache.invalidate(lambda key: key[0] == video_id)
+    
+    def tree_cache_stats(self) -> Dict[str, int]:
+        return self.tree_cache.stats()
+    
+    def _load_tree_pages(self, video_id, object_class, keys) -> Dict:
+        return {
+            (page["kind"], page["partition"], page["page"]): page["data"]
+            for page in self.segment_tree_nodes.find(self._tree_page_filter(video_id, object_class, keys))
+        }
+    
+    @staticmethod
+    def _tree_page_filter(video_id, object_class, keys) -> Dict:
+        pages_by_group = {}
+        for kind, partition, page in keys:
+            pages_by_group.setdefault((kind, partition), []).append(page)
+        
+        return {
+            "video_id": video_id,
+            "object_class": object_class,
+            "$or": [
+                {"kind": kind, "partition": int(partition), "page": {"$in": pages}}
+                for (kind, partition), pages in pages_by_group.items()
+            ]
+        }
+    
+    def _delete_segment_trees(self, video_id, object_classes=None) -> None:
+        query = {"video_id": video_id}
+        if object_classes is not None:
+            query["object_class"] = {"$in": list(object_classes)}
+        self.segment_tree_nodes.delete_many(query)
+        self._delete_packed(self.segment_trees, query)
     
     def get_video_info(self, video_id: ObjectId) -> Dict:
         return self.videos.find_one({"_id": video_id})
@@ -198,108 +761,402 @@ class DatabaseManager:
         return list(self.videos.find())
     
     def get_frame(self, video_id: ObjectId, frame_number: int) -> Dict:
-        frame = self.frames.find_one({"video_id": video_id, "frame_number": frame_number})
-        
-        if frame:
-            return frame
+        # Falls back to the nearest stored frame, e.g. for videos processed
+        # with frame_skip > 1.
+        directory = self.get_frame_directory(video_id)
+        ordinal = directory.nearest(frame_number)
+        if ordinal is None:
+            return None
+        return self.frames.find_one({"_id": directory.frame_at(ordinal)["_id"]})
+    
+    def get_frame_directory(self, video_id: ObjectId) -> FrameDirectory:
+        def load():
+            return FrameDirectory.from_frames(
+                self.frames.find({"video_id": video_id}, {"frame_number": 1, "image_path": 1, "timestamp": 1})
+            )
         
-        all_frames = list(self.frames.find({"video_id": video_id}).sort("frame_number", 1))
+        if video_id in LIVE_SEGMENT_TREES:
+            # Frames are still arriving; a cached directory would go stale.
+            return load()
+        return self.tree_cache.get_or_load((video_id, "frames"), load)
+    
+    def load_frame_image(self, video_id: ObjectId, frame: Dict[str, Any], video_path: Optional[str] = None):
+        # Dataset frames are image files; frames of imported videos are
+        # decoded from the video file itself. Callers stepping through one
+        # video pass its file_path to skip the video lookup per frame.
+        image_path = frame.get("image_path")
+        if image_path and os.path.exists(image_path):
+            return cv2.imread(image_path)
         
-        if not all_frames:
+        if video_path is None:
+            video = self.get_video_info(video_id)
+            video_path = video.get("file_path") if video else None
+        if not video_path:
             return None
+        return self.frame_store.read(video_path, frame["frame_number"], frame.get("timestamp"))
+    
+    def get_frame_annotations(self, frame_id: ObjectId, video_id: Optional[ObjectId] = None) -> List[Dict]:
+        # Passing the frame's video_id saves a lookup for per-box documents.
+        frame = None
+        if video_id is None:
+            frame = self.frames.find_one({"_id": frame_id}, {"video_id": 1, "frame_number": 1})
+            if not frame:
+                return []
+            video_id = frame["video_id"]
+        if not self._video_layout(video_id)[0]:
+            return list(self.annotations.find({"frame_id": frame_id}))
         
-        if frame_number < 0:
-            return all_frames[0]
-        elif frame_number >= len(all_frames):
-            return all_frames[-1]
-        else:
-            return all_frames[frame_number]
+        frame = frame or self.frames.find_one({"_id": frame_id}, {"video_id": 1, "frame_number": 1})
+        if not frame:
+            return []
+        frame_number = frame["frame_number"]
+        annotations = self._read_bucketed_annotations(frame["video_id"], frame_number, frame_number)
+        return [annotation for annotation in annotations.get(frame_number, []) if annotation["frame_id"] == frame_id]
     
-    def get_frame_annotations(self, frame_id: ObjectId) -> List[Dict]:
-        return list(self.annotations.find({"frame_id": frame_id}))
+    def _read_bucketed_annotations(self, video_id, start_frame, end_frame) -> Dict[int, List[Dict]]:
+        bucket_docs = list(self.annotation_buckets.find({
+            "video_id": video_id,
+            "start_frame": {"$lte": end_frame},
+            "end_frame": {"$gte": start_frame}
+        }))
+        bucket_docs.extend(self._bucket_buffer(self._video_layout(video_id)[1]).pending(video_id, start_frame, end_frame))
+        return self._merge_buckets(bucket_docs, self.config.get('classes', []), start_frame, end_frame)
+    
+    @staticmethod
+    def _merge_buckets(bucket_docs, class_names, start_frame, end_frame) -> Dict[int, List[Dict]]:
+        result = {}
+        for bucket_doc in bucket_docs:
+            for frame_number, annotations in decode_bucket(bucket_doc, class_names, start_frame, end_frame).items():
+                result.setdefault(frame_number, []).extend(annotations)
+        return result
+    
+    @staticmethod
+    def _normalize_classes(object_class) -> Optional[List[int]]:
+        if object_class is None:
+            return None
+        if isinstance(object_class, int):
+            return [object_class]
+        return sorted(set(int(class_id) for class_id in object_class))
     
-    def query_frame_range(self, video_id, start_frame, end_frame, object_class=None):
+    def query_frame_range(self, video_id, start_frame, end_frame, object_class=None, class_mask=None):
         print(f"Querying frames {start_frame}-{end_frame} for video {video_id}, class: {object_class}")
         
-        tree_doc = self.segment_trees.find_one({"video_id": video_id, "object_class": object_class})
-        if not tree_doc:
-            print(f"No segment tree found for video {video_id}, class {object_class}")
+        if class_mask is not None:
+            object_class = class_mask_to_classes(class_mask)
+        classes = self._normalize_classes(object_class)
+        
+        tree = LIVE_SEGMENT_TREES.get(video_id)
+        if tree is not None:
+            # Still ingesting: only frames appended so far are queryable.
+            end_frame = min(end_frame, tree.n - 1)
+            if start_frame > end_frame:
+                return {}
+        else:
+            tree = self._get_segment_tree(video_id, None)
+        if tree is None:
+            print(f"No segment tree found for video {video_id}")
             return {}
         
-        tree = FrameSegmentTree.from_dict(tree_doc["tree_structure"])
+        if isinstance(tree, (CompactFrameSegmentTree, AppendableFrameSegmentTree)):
+            object_ids = tree.query(start_frame, end_frame, classes)
+        elif classes is None:
+            object_ids = tree.query(start_frame, end_frame)
+        else:
+            object_ids = set()
+            for class_id in classes:
+                class_tree = self._get_segment_tree(video_id, class_id)
+                if class_tree is None:
+                    print(f"No segment tree found for video {video_id}, class {class_id}")
+                    continue
+                object_ids |= class_tree.query(start_frame, end_frame)
         
-        object_ids = tree.query(start_frame, end_frame)
         print(f"Found {len(object_ids)} objects in range")
         
-        annotations = list(self.annotations.find({"_id": {"$in": list(object_ids)}}))
+        return self._group_annotations_by_frame(object_ids, video_id, start_frame, end_frame)
+    
+    def query_region(self, video_id, start_frame, end_frame, region, object_class=None, contained=False):
+        print(f"Querying region {region} in frames {start_frame}-{end_frame} for video {video_id}, class: {object_class}")
+        
+        spatial_index = self._load_spatial_index(video_id)
+        if spatial_index is None:
+            print(f"No spatial index found for video {video_id}")
+            return {}
+        
+        object_ids = spatial_index.query(start_frame, end_frame, region, self._normalize_classes(object_class), contained)
+        print(f"Found {len(object_ids)} objects in region")
+        
+        return self._group_annotations_by_frame(object_ids, video_id, start_frame, end_frame)
+    
+    def _group_annotations_by_frame(self, object_ids, video_id, start_frame, end_frame) -> Dict[int, List[Dict]]:
+        if self._video_layout(video_id)[0]:
+            return self._select_annotations(self._read_bucketed_annotations(video_id, start_frame, end_frame), object_ids)
+        
+        groups = self.annotations.aggregate([
+            {"$match": {"_id": {"$in": list(object_ids)}}},
+            {"$group": {"_id": "$frame_number", "annotations": {"$push": "$$ROOT"}}},
+            {"$sort": {"_id": 1}}
+        ])
         
         result = {}
-        for annotation in annotations:
-            frame = self.frames.find_one({"_id": annotation["frame_id"]})
-            if frame:
-                frame_number = frame["frame_number"]
-                if frame_number not in result:
-                    result[frame_number] = []
-                result[frame_number].append(annotation)
+        for group in groups:
+            if group["_id"] is None:
+                # Annotations written before frame_number was denormalized.
+                self._group_by_frame_lookup(group["annotations"], result)
+            else:
+                result.setdefault(group["_id"], []).extend(group["annotations"])
         
         return result
+    
+    @staticmethod
+    def _select_annotations(frames: Dict[int, List[Dict]], object_ids) -> Dict[int, List[Dict]]:
+        object_ids = set(object_ids)
+        result = {}
+        for frame_number, annotations in sorted(frames.items()):
+            matching = [annotation for annotation in annotations if annotation["_id"] in object_ids]
+            if matching:
+                result[frame_number] = matching
+        return result
+    
+    def _group_by_frame_lookup(self, annotations: List[Dict], result: Dict[int, List[Dict]]) -> None:
+        frame_ids = list({annotation["frame_id"] for annotation in annotations})
+        frame_numbers = {
+            frame["_id"]: frame["frame_number"]
+            for frame in self.frames.find({"_id": {"$in": frame_ids}}, {"frame_number": 1})
+        }
+        for annotation in annotations:
+            frame_number = frame_numbers.get(annotation["frame_id"])
+            if frame_number is not None:
+                result.setdefault(frame_number, []).append(annotation)
 
-    def cleanup_duplicates(self):
-        videos = self.videos.find()
+    def _load_count_tree(self, video_id):
+        live_tree = LIVE_SEGMENT_TREES.get(video_id)
+        if live_tree is not None:
+            return self._live_count_tree(live_tree, len(self.config.get('classes', [])))
+        
+        def load():
+            tree_doc = self.count_trees.find_one({"video_id": video_id})
+            if not tree_doc:
+                return None
+            return FrameCountTree.from_dict(
+                tree_doc["tree_structure"],
+                self._inferred_mask(self.get_frame_sampling(video_id), tree_doc["tree_structure"]["n"])
+            )
+        
+        tree = self.tree_cache.get_or_load((video_id, "counts"), load)
+        if tree is None:
+            print(f"No count tree found for video {video_id}")
+        return tree
+    
+    @staticmethod
+    def _live_count_tree(live_tree: AppendableFrameSegmentTree, num_classes: int) -> Optional[FrameCountTree]:
+        if live_tree.n == 0:
+            return None
+        count_tree = FrameCountTree(live_tree.n, num_classes)
+        count_tree.build_from_counts(live_tree.frame_counts(num_classes))
+        return count_tree
+    
+    def aggregate_frame_range(self, video_id, start_frame, end_frame, object_class=None) -> Dict[str, Any]:
+        return self._summarize_counts(self._load_count_tree(video_id), start_frame, end_frame, object_class)
+    
+    @staticmethod
+    def _summarize_counts(tree: Optional[FrameCountTree], start_frame, end_frame, object_class=None) -> Dict[str, Any]:
+        if tree is None:
+            return {}
         
-        for video in videos:
+        end_frame = min(end_frame, tree.n - 1)
+        if start_frame > end_frame:
+            return {"count": 0, "max_per_frame": 0, "min_per_frame": 0, "class_counts": {}}
+        
+        counts, max_density, min_density = tree.query(start_frame, end_frame)
+        column = tree.column(object_class)
+        
+        return {
+            "count": int(counts[column]),
+            "max_per_frame": int(max_density[column]),
+            "min_per_frame": int(min_density[column]),
+            "class_counts": {
+                class_id: int(counts[class_id])
+                for class_id in range(tree.num_classes)
+                if counts[class_id] > 0
+            }
+        }
+    
+    def count_frame_range(self, video_id, start_frame, end_frame, object_class=None) -> int:
+        return self.aggregate_frame_range(video_id, start_frame, end_frame, object_class).get("count", 0)
+    
+    def query_frames_matching(self, video_id, predicate: FramePredicate, start_frame=0, end_frame=None) -> List[tuple]:
+        bitmap_index = self._load_frame_bitmaps(video_id)
+        if bitmap_index is None:
+            print(f"No frame bitmaps found for video {video_id}")
+            return []
+        
+        end_frame = bitmap_index.n - 1 if end_frame is None else min(end_frame, bitmap_index.n - 1)
+        return bitmap_frame_ranges(
+            self._inferred_only(predicate.evaluate(bitmap_index), self.get_frame_sampling(video_id)),
+            max(start_frame, 0), end_frame
+        )
+    
+    @staticmethod
+    def _inferred_mask(sampling: Optional[FrameSamplingRecord], n: int):
+        return None if sampling is None else sampling.inferred_mask(n)
+    
+    @staticmethod
+    def _inferred_only(bits, sampling: Optional[FrameSamplingRecord]):
+        # Frames the detector skipped have no annotations, which would
+        # otherwise read as frames with no objects.
+        if sampling is None:
+            return bits
+        return bits & sampling.inferred_bits(len(bits))
+
+    def cleanup_duplicates(self, batch_size: int = 1000):
+        # Duplicate frame numbers are grouped on the server; the oldest frame
+        # of each group is kept and the rest are merged into it in bulk
+        # batches, so only one batch of groups is held at a time.
+        for video in self.videos.find({}, {"name": 1}):
             video_id = video["_id"]
+            groups = self.frames.aggregate([
+                {"$match": {"video_id": video_id}},
+                {"$group": {
+                    "_id": "$frame_number",
+                    "keep_id": {"$min": "$_id"},
+                    "frame_ids": {"$push": "$_id"},
+                    "count": {"$sum": 1}
+                }},
+                {"$match": {"count": {"$gt": 1}}}
+            ], allowDiskUse=True)
             
-            frames = list(self.frames.find({"video_id": video_id}))
-            
-            frame_groups = {}
-            for frame in frames:
-                frame_number = frame["frame_number"]
-                if frame_number not in frame_groups:
-                    frame_groups[frame_number] = []
-                frame_groups[frame_number].append(frame)
+            removed = 0
+            batch = []
+            for group in groups:
+                batch.append(group)
+                if len(batch) >= batch_size:
+                    removed += self._merge_duplicate_frames(video_id, batch)
+                    batch = []
+            if batch:
+                removed += self._merge_duplicate_frames(video_id, batch)
             
-            for frame_number, group in frame_groups.items():
-                if len(group) > 1:
-                    print(f"Found {len(group)} duplicates for frame {frame_number} in video {video['name']}")
-                    
-                    keep_id = group[0]["_id"]
-                    delete_ids = [frame["_id"] for frame in group[1:]]
-                    
-                    self.frames.delete_many({"_id": {"$in": delete_ids}})
-                    
-                    for frame_id in delete_ids:
-                        self.annotations.update_many(
-                            {"frame_id": frame_id},
-                            {"$set": {"frame_id": keep_id}}
-                        )
+            if removed:
+                print(f"Removed {removed} duplicate frames in video {video.get('name', video_id)}")
+                self.tree_cache.invalidate(lambda key: key == (video_id, "frames"))
+    
+    def _merge_duplicate_frames(self, video_id, groups: List[Dict]) -> int:
+        annotation_operations = []
+        frame_operations = []
+        keep_ids = {}
+        for group in groups:
+            delete_ids = [frame_id for frame_id in group["frame_ids"] if frame_id != group["keep_id"]]
+            annotation_operations.append(UpdateMany(
+                {"frame_id": {"$in": delete_ids}},
+                {"$set": {"frame_id": group["keep_id"]}}
+            ))
+            frame_operations.append(DeleteMany({"_id": {"$in": delete_ids}}))
+            keep_ids[group["_id"]] = group["keep_id"]
+        
+        self.annotations.bulk_write(annotation_operations, ordered=False)
+        deleted = self.frames.bulk_write(frame_operations, ordered=False).deleted_count
+        
+        bucket_operations = []
+        for bucket_doc in self.annotation_buckets.find(
+            {"video_id": video_id, "start_frame": {"$lte": max(keep_ids)}, "end_frame": {"$gte": min(keep_ids)}},
+            {"frame_ids": 1, "start_frame": 1, "span": 1}
+        ):
+            frame_ids = replace_frame_ids(bucket_doc, keep_ids)
+            if frame_ids != bucket_doc["frame_ids"]:
+                bucket_operations.append(UpdateOne({"_id": bucket_doc["_id"]}, {"$set": {"frame_ids": frame_ids}}))
+        if bucket_operations:
+            self.annotation_buckets.bulk_write(bucket_operations, ordered=False)
+        return deleted
 
     def import_video(self, video_data: Dict[str, Any]) -> ObjectId:
-        result = self.videos.insert_one(video_data)
+        result = self.videos.insert_one({**video_data, "annotation_layout": self._configured_layout()})
         return result.inserted_id
     
     def store_frame(self, frame_data: Dict[str, Any]) -> ObjectId:
         result = self.frames.insert_one(frame_data)
         return result.inserted_id
     
+    def store_frames(self, frames: List[Dict[str, Any]]) -> List[ObjectId]:
+        if not frames:
+            return []
+        result = self.frames.insert_many(frames)
+        return result.inserted_ids
+    
     def store_annotations(self, annotations: List[Dict[str, Any]]) -> List[ObjectId]:
         if not annotations:
             return []
+        
+        for annotation in annotations:
+            annotation.setdefault("_id", ObjectId())
+        videos = {}
+        for annotation in annotations:
+            videos.setdefault(annotation["video_id"], []).append(annotation)
+        
+        for video_id, video_annotations in videos.items():
+            bucketed, span = self._video_layout(video_id)
+            if not bucketed:
+                self.annotations.insert_many(video_annotations)
+                continue
             
-        result = self.annotations.insert_many(annotations)
-        return result.inserted_ids
+            # Buffered until the bucket is complete; frames may arrive slightly
+            # out of order, so the newest two buckets per video stay open.
+            bucket_buffer = self._bucket_buffer(span)
+            frames = {}
+            for annotation in video_annotations:
+                frames.setdefault((annotation["frame_number"], annotation["frame_id"]), []).append(annotation)
+            for (frame_number, frame_id), frame_annotations in frames.items():
+                bucket_buffer.add(video_id, frame_number, frame_id, frame_annotations)
+            
+            bucket_docs = bucket_buffer.pop_before(video_id, bucket_buffer.newest_bucket(video_id) - 1)
+            if bucket_docs:
+                self.annotation_buckets.insert_many(bucket_docs)
+        return [annotation["_id"] for annotation in annotations]
+    
+    def flush_annotation_buckets(self, video_id: ObjectId) -> None:
+        bucket_docs = self._bucket_buffer(self._video_layout(video_id)[1]).pop_all(video_id)
+        if bucket_docs:
+            self.annotation_buckets.insert_many(bucket_docs)
         
     def get_videos_by_source_type(self, source_type: str) -> List[Dict]:
         return list(self.videos.find({"source_type": source_type}))
 
     def delete_video_and_related(self, video_id: ObjectId) -> None:
-        frames = list(self.frames.find({"video_id": video_id}))
-        frame_ids = [frame["_id"] for frame in frames]
+        self._delete_frames_and_annotations(video_id)
+        for bucket_buffer in list(PENDING_ANNOTATION_BUCKETS.values()):
+            bucket_buffer.discard(video_id)
         
-        self.annotations.delete_many({"frame_id": {"$in": frame_ids}})
+        self._delete_segment_trees(video_id)
         
-        self.frames.delete_many({"video_id": video_id})
+        self.count_trees.delete_many({"video_id": video_id})
+        self._delete_packed(self.spatial_indices, {"video_id": video_id})
+        self._delete_packed(self.frame_bitmaps, {"video_id": video_id})
+        self._delete_packed(self.frame_sampling, {"video_id": video_id})
+        self.discard_live_segment_tree(video_id)
+        self.invalidate_tree_cache(video_id)
         
-        self.segment_trees.delete_many({"video_id": video_id})
-        
-        self.videos.delete_one({"_id": video_id})
\ No newline at end of file
+        video = self.videos.find_one({"_id": video_id}, {"file_path": 1})
+        if video and video.get("file_path"):
+            self.frame_store.close(video["file_path"])
+        self.videos.delete_one({"_id": video_id})
+        VIDEO_ANNOTATION_LAYOUTS.pop(video_id, None)
+    
+    def _delete_frames_and_annotations(self, video_id) -> None:
+        # Annotations go first: legacy ones are only reachable through
+        # their frames.
+        self.annotations.delete_many({"video_id": video_id})
+        if not self.migrations.find_one({"_id": "annotation_frame_fields"}):
+            self._delete_annotations_by_frame(video_id)
+        self.annotation_buckets.delete_many({"video_id": video_id})
+        self.frames.delete_many({"video_id": video_id})
+        self.import_manifests.delete_many({"video_id": video_id})
+    
+    def _delete_annotations_by_frame(self, video_id, batch_size: int = 1000) -> None:
+        # Annotations written before video_id was denormalized, removed by
+        # frame id a batch at a time.
+        frame_ids = []
+        for frame in self.frames.find({"video_id": video_id}, {"_id": 1}):
+            frame_ids.append(frame["_id"])
+            if len(frame_ids) >= batch_size:
+                self.annotations.delete_many({"frame_id": {"$in": frame_ids}})
+                frame_ids = []
+        if frame_ids:
+            self.annotations.delete_many({"frame_id": {"$in": frame_ids}})
@@ -0,0 +1,190 @@
+import struct
+import numpy as np
+from typing import List, Optional, Tuple
+
+# Packed layout: header, then little-endian uint64 bit planes shaped
+# (columns, planes, words), least significant plane first, bits in
+# np.packbits order with frame 0 first. Column c < num_classes holds the
+# per-frame count of class c, the last column the count of all objects.
+BITMAP_MAGIC = b'FBMP'
+BITMAP_VERSION = 1
+BITMAP_HEADER = struct.Struct('<4sHxxqqq')
+
+
+class FrameBitmapIndex:
+
+    def __init__(self, n: int, num_classes: int):
+        self.n = n
+        self.num_classes = num_classes
+        self.num_words = (n + 63) // 64
+        # Bit-sliced counts: plane p of a column is the packed bitmap of
+        # frames whose count has bit p set, so thresholds are bitwise ops.
+        self.planes = np.zeros((num_classes + 1, 0, self.num_words), dtype=np.uint64)
+
+    @classmethod
+    def from_counts(cls, frame_counts: np.ndarray) -> 'FrameBitmapIndex':
+        frame_counts = np.asarray(frame_counts)
+        index = cls(frame_counts.shape[0], frame_counts.shape[1] - 1)
+        num_planes = int(frame_counts.max()).bit_length() if frame_counts.size else 0
+        columns = np.ascontiguousarray(frame_counts.T, dtype=np.int64)
+        padding = ((0, 0), (0, index.num_words * 64 - index.n))
+        if num_planes:
+            index.planes = np.stack([
+                np.packbits(np.pad((columns >> plane) & 1, padding), axis=1).view('<u8')
+                for plane in range(num_planes)
+            ], axis=1)
+        return index
+
+    def column(self, object_class: Optional[int]) -> int:
+        return self.num_classes if object_class is None else object_class
+
+    def empty(self) -> np.ndarray:
+        return np.zeros(self.num_words, dtype=np.uint64)
+
+    def full(self) -> np.ndarray:
+        return self.mask_tail(np.full(self.num_words, np.iinfo(np.uint64).max, dtype=np.uint64))
+
+    def mask_tail(self, bits: np.ndarray) -> np.ndarray:
+        # Clear the padding bits past the last frame so NOT never selects them.
+        tail_bytes = bits.view(np.uint8)
+        last_byte, tail = divmod(self.n, 8)
+        tail_bytes[last_byte + (1 if tail else 0):] = 0
+        if tail:
+            tail_bytes[last_byte] &= (0xFF << (8 - tail)) & 0xFF
+        return bits
+
+    def at_least(self, object_class: Optional[int], k: int) -> np.ndarray:
+        if k <= 0:
+            return self.full()
+        planes = self.planes[self.column(object_class)]
+        if k >= 1 << len(planes):
+            return self.empty()
+        if k == 1:
+            bits = self.empty()
+            for plane in planes:
+                bits |= plane
+            return bits
+
+        # Compare the sliced counts with k from the most significant plane
+        # down, tracking frames already greater and frames still equal.
+        greater = self.empty()
+        equal = self.full()
+        for plane in range(len(planes) - 1, -1, -1):
+            if (k >> plane) & 1:
+                equal &= planes[plane]
+            else:
+                greater |= equal & planes[plane]
+                equal &= ~planes[plane]
+        return greater | equal
+
+    def count_between(self, object_class: Optional[int], at_least: int = 1,
+                      at_most: Optional[int] = None) -> np.ndarray:
+        bits = self.at_least(object_class, at_least)
+        if at_most is not None:
+            bits = bits & ~self.at_least(object_class, at_most + 1)
+        return bits
+
+    def memory_usage(self) -> int:
+        return self.planes.nbytes
+
+    def to_bytes(self) -> bytes:
+        header = BITMAP_HEADER.pack(BITMAP_MAGIC, BITMAP_VERSION, self.n, self.num_classes, self.planes.shape[1])
+        return header + np.ascontiguousarray(self.planes).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'FrameBitmapIndex':
+        magic, version, n, num_classes, num_planes = BITMAP_HEADER.unpack_from(data, 0)
+        if magic != BITMAP_MAGIC:
+            raise ValueError("Not a packed frame bitmap index")
+        if version != BITMAP_VERSION:
+            raise ValueError(f"Unsupported frame bitmap format version {version}")
+
+        index = cls(n, num_classes)
+        index.planes = np.frombuffer(
+            data, dtype='<u8', count=(num_classes + 1) * num_planes * index.num_words,
+            offset=BITMAP_HEADER.size
+        ).reshape(num_classes + 1, num_planes, index.num_words)
+        return index
+
+
+class FramePredicate:
+
+    def evaluate(self, index: FrameBitmapIndex) -> np.ndarray:
+        raise NotImplementedError
+
+    def __and__(self, other: 'FramePredicate') -> 'FramePredicate':
+        return And(self, other)
+
+    def __or__(self, other: 'FramePredicate') -> 'FramePredicate':
+        return Or(self, other)
+
+    def __invert__(self) -> 'FramePredicate':
+        return Not(self)
+
+
+class Has(FramePredicate):
+    # Frames holding between at_least and at_most objects of a class, or of
+    # any class when object_class is None.
+
+    def __init__(self, object_class: Optional[int] = None, at_least: int = 1, at_most: Optional[int] = None):
+        self.object_class = object_class
+        self.at_least = at_least
+        self.at_most = at_most
+
+    def evaluate(self, index: FrameBitmapIndex) -> np.ndarray:
+        return index.count_between(self.object_class, self.at_least, self.at_most)
+
+    def __repr__(self):
+        return f"Has({self.object_class}, at_least={self.at_least}, at_most={self.at_most})"
+
+
+class And(FramePredicate):
+
+    def __init__(self, *predicates: FramePredicate):
+        self.predicates = predicates
+
+    def evaluate(self, index: FrameBitmapIndex) -> np.ndarray:
+        bits = index.full()
+        for predicate in self.predicates:
+            bits &= predicate.evaluate(index)
+        return bits
+
+    def __repr__(self):
+        return f"And{self.predicates}"
+
+
+class Or(FramePredicate):
+
+    def __init__(self, *predicates: FramePredicate):
+        self.predicates = predicates
+
+    def evaluate(self, index: FrameBitmapIndex) -> np.ndarray:
+        bits = index.empty()
+        for predicate in self.predicates:
+            bits |= predicate.evaluate(index)
+        return bits
+
+    def __repr__(self):
+        return f"Or{self.predicates}"
+
+
+class Not(FramePredicate):
+
+    def __init__(self, predicate: FramePredicate):
+        self.predicate = predicate
+
+    def evaluate(self, index: FrameBitmapIndex) -> np.ndarray:
+        return index.mask_tail(~self.predicate.evaluate(index))
+
+    def __repr__(self):
+        return f"Not({self.predicate!r})"
+
+
+def bitmap_frame_ranges(bits: np.ndarray, l: int, r: int) -> List[Tuple[int, int]]:
+    # Runs of set bits within [l, r] as inclusive (start, end) frame ranges.
+    if l > r:
+        return []
+    first_byte = l // 8
+    frames = np.unpackbits(bits.view(np.uint8)[first_byte:r // 8 + 1])[l - first_byte * 8:r - first_byte * 8 + 1]
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], frames.astype(np.int8), [0]))))
+    return [(int(start) + l, int(end) + l - 1) for start, end in zip(edges[::2], edges[1::2])]
@@ -0,0 +1,67 @@
+import sys
+import numpy as np
+from bson.objectid import ObjectId
+from typing import Dict, List, Any, Iterable, Optional
+
+OBJECT_ID_SIZE = 12
+
+
+class FrameDirectory:
+    # Sorted frame numbers of one video with the frame ids, image paths and
+    # timestamps at the same ordinals, so frame lookups need no database
+    # round trip.
+
+    def __init__(self, frame_numbers: np.ndarray, id_table: np.ndarray, image_paths: List[str],
+                 timestamps: Optional[np.ndarray] = None):
+        self.frame_numbers = frame_numbers
+        self.id_table = id_table
+        self.image_paths = image_paths
+        self.timestamps = timestamps if timestamps is not None else np.full(len(frame_numbers), np.nan)
+
+    @classmethod
+    def from_frames(cls, frames: Iterable[Dict[str, Any]]) -> 'FrameDirectory':
+        rows = sorted(
+            (frame["frame_number"], frame["_id"].binary, frame.get("image_path"), frame.get("timestamp"))
+            for frame in frames
+        )
+        return cls(
+            np.array([row[0] for row in rows], dtype=np.int64),
+            np.frombuffer(b''.join(row[1] for row in rows), dtype=np.uint8).reshape(-1, OBJECT_ID_SIZE),
+            [row[2] for row in rows],
+            np.array([np.nan if row[3] is None else row[3] for row in rows], dtype=np.float64)
+        )
+
+    def __len__(self) -> int:
+        return len(self.frame_numbers)
+
+    def ordinal(self, frame_number: int) -> Optional[int]:
+        index = int(np.searchsorted(self.frame_numbers, frame_number))
+        if index < len(self.frame_numbers) and self.frame_numbers[index] == frame_number:
+            return index
+        return None
+
+    def nearest(self, frame_number: int) -> Optional[int]:
+        # Ordinal of the closest stored frame; ties go to the earlier one.
+        if not len(self.frame_numbers):
+            return None
+        index = int(np.searchsorted(self.frame_numbers, frame_number))
+        if index == 0:
+            return 0
+        if index == len(self.frame_numbers):
+            return index - 1
+        before, after = self.frame_numbers[index - 1], self.frame_numbers[index]
+        return index - 1 if frame_number - before <= after - frame_number else index
+
+    def frame_at(self, ordinal: int) -> Dict[str, Any]:
+        return {
+            "_id": ObjectId(self.id_table[ordinal].tobytes()),
+            "frame_number": int(self.frame_numbers[ordinal]),
+            "image_path": self.image_paths[ordinal],
+            "timestamp": None if np.isnan(self.timestamps[ordinal]) else float(self.timestamps[ordinal])
+        }
+
+    def memory_usage(self) -> int:
+        return (
+            self.frame_numbers.nbytes + self.id_table.nbytes + self.timestamps.nbytes + sys.getsizeof(self.image_paths)
+            + sum(sys.getsizeof(path) for path in self.image_paths)
+        )
@@ -0,0 +1,138 @@
+import struct
+from array import array
+
+import cv2
+import numpy as np
+
+# Packed layout: header, then the inferred flags as np.packbits bits with
+# frame 0 first, padded to whole uint64 words like FrameBitmapIndex, then
+# one little-endian float32 scene score per frame (NaN where none was
+# computed).
+SAMPLING_MAGIC = b'FSMP'
+SAMPLING_VERSION = 1
+SAMPLING_HEADER = struct.Struct('<4sHxxq')
+
+
+class FixedFrameSampler:
+    # Every stride-th frame, the yolo.frame_skip behaviour.
+
+    def __init__(self, stride: int = 1):
+        self.stride = max(1, stride)
+        self.last_score = float('nan')
+
+    def sample(self, frame_idx: int, frame: np.ndarray) -> bool:
+        return frame_idx % self.stride == 0
+
+
+class AdaptiveFrameSampler:
+    # Runs the detector when the scene has changed since the last inferred
+    # frame, measured as the mean absolute difference of small grayscale
+    # thumbnails (0..1), but never more often than every min_stride frames
+    # and never less often than every max_stride frames.
+
+    def __init__(self, min_stride: int = 1, max_stride: int = 15, threshold: float = 0.015, width: int = 64):
+        self.min_stride = max(1, min_stride)
+        self.max_stride = max(self.min_stride, max_stride)
+        self.threshold = threshold
+        self.width = max(8, width)
+        self._last_thumbnail = None
+        self._last_frame = None
+        self.last_score = float('nan')
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        height = max(1, round(frame.shape[0] * self.width / frame.shape[1]))
+        thumbnail = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        return thumbnail.astype(np.float32)
+
+    def sample(self, frame_idx: int, frame: np.ndarray) -> bool:
+        since = None if self._last_frame is None else frame_idx - self._last_frame
+        if since is not None and since < self.min_stride:
+            self.last_score = float('nan')
+            return False
+
+        thumbnail = self._thumbnail(frame)
+        if since is None:
+            self.last_score = float('nan')
+        else:
+            self.last_score = float(np.abs(thumbnail - self._last_thumbnail).mean()) / 255
+            if since < self.max_stride and self.last_score < self.threshold:
+                return False
+
+        self._last_thumbnail = thumbnail
+        self._last_frame = frame_idx
+        return True
+
+
+def create_frame_sampler(yolo_config: dict):
+    if yolo_config.get('sampling', 'fixed') == 'adaptive':
+        adaptive_config = yolo_config.get('adaptive_sampling', {})
+        return AdaptiveFrameSampler(
+            adaptive_config.get('min_stride', 1),
+            adaptive_config.get('max_stride', 15),
+            adaptive_config.get('threshold', 0.015),
+            adaptive_config.get('thumbnail_width', 64)
+        )
+    return FixedFrameSampler(yolo_config.get('frame_skip', 1))
+
+
+class FrameSamplingRecord:
+    # Which decoded frames of a video went through the detector, with the
+    # scene score behind each decision. Frames not inferred have no
+    # annotations, which is not the same as having no objects.
+
+    def __init__(self):
+        self.inferred = bytearray()
+        self.scores = array('f')
+
+    @property
+    def n(self) -> int:
+        return len(self.inferred)
+
+    def add(self, inferred: bool, score: float) -> None:
+        self.inferred.append(1 if inferred else 0)
+        self.scores.append(score)
+
+    def inferred_frames(self) -> np.ndarray:
+        return np.flatnonzero(np.frombuffer(bytes(self.inferred), dtype=np.uint8))
+
+    def inferred_mask(self, n: int) -> np.ndarray:
+        # Per-frame booleans over n frames; frames past the record count as
+        # inferred.
+        mask = np.ones(n, dtype=bool)
+        count = min(self.n, n)
+        mask[:count] = np.frombuffer(bytes(self.inferred), dtype=np.uint8)[:count] != 0
+        return mask
+
+    def inferred_bits(self, num_words: int) -> np.ndarray:
+        # The inferred flags in FrameBitmapIndex layout over num_words words;
+        # frames past the record count as inferred.
+        flags = np.ones(num_words * 64, dtype=np.uint8)
+        n = min(self.n, len(flags))
+        flags[:n] = np.frombuffer(bytes(self.inferred), dtype=np.uint8)[:n]
+        return np.packbits(flags).view('<u8')
+
+    def to_bytes(self) -> bytes:
+        num_words = (self.n + 63) // 64
+        bits = np.packbits(np.pad(np.frombuffer(bytes(self.inferred), dtype=np.uint8), (0, num_words * 64 - self.n)))
+        scores = np.frombuffer(self.scores.tobytes(), dtype=np.float32).astype('<f4')
+        return SAMPLING_HEADER.pack(SAMPLING_MAGIC, SAMPLING_VERSION, self.n) + bits.tobytes() + scores.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'FrameSamplingRecord':
+        magic, version, n = SAMPLING_HEADER.unpack_from(data, 0)
+        if magic != SAMPLING_MAGIC:
+            raise ValueError("Not a packed frame sampling record")
+        if version != SAMPLING_VERSION:
+            raise ValueError(f"Unsupported frame sampling format version {version}")
+
+        offset = SAMPLING_HEADER.size
+        num_bytes = (n + 63) // 64 * 8
+        record = cls()
+        record.inferred = bytearray(np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=num_bytes, offset=offset))[:n].tobytes())
+        record.scores.frombytes(np.frombuffer(data, dtype='<f4', count=n, offset=offset + num_bytes).astype(np.float32).tobytes())
+        return record
+
+    def memory_usage(self) -> int:
+        return len(self.inferred) + self.scores.itemsize * len(self.scores)
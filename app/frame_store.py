@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+class VideoFrameStore:
+    # Decodes frames of imported videos straight from the original file
+    # instead of keeping a JPEG per frame. Captures stay open between reads;
+    # a frame a short way past the last one read is reached by decoding
+    # forward, anything else by seeking to the timestamp recorded for it at
+    # import.
+
+    def __init__(self, max_open: int = 4, max_forward: int = 30):
+        self.max_open = max(1, max_open)
+        self.max_forward = max(0, max_forward)
+        self.seeks = 0
+        self._captures = OrderedDict()  # video path -> [capture, next frame number]
+        self._lock = threading.Lock()
+
+    def read(self, video_path: str, frame_number: int, timestamp: Optional[float] = None) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._open(video_path)
+            if entry is None:
+                return None
+            cap, position = entry
+
+            if not 0 <= frame_number - position <= self.max_forward:
+                self.seeks += 1
+                if timestamp is not None:
+                    cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+                    position = int(round(cap.get(cv2.CAP_PROP_POS_FRAMES)))
+                if timestamp is None or position > frame_number or position < frame_number - self.max_forward:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+                    position = frame_number
+
+            while position < frame_number:
+                if not cap.grab():
+                    self._close(video_path)
+                    return None
+                position += 1
+
+            ret, frame = cap.read()
+            if not ret:
+                self._close(video_path)
+                return None
+            entry[1] = position + 1
+            return frame
+
+    def close(self, video_path: Optional[str] = None) -> None:
+        with self._lock:
+            for path in [video_path] if video_path else list(self._captures):
+                self._close(path)
+
+    def _open(self, video_path: str) -> Optional[list]:
+        entry = self._captures.get(video_path)
+        if entry is not None:
+            self._captures.move_to_end(video_path)
+            return entry
+
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            print(f"Could not open video file: {video_path}")
+            return None
+        entry = self._captures[video_path] = [cap, 0]
+        while len(self._captures) > self.max_open:
+            self._close(next(iter(self._captures)))
+        return entry
+
+    def _close(self, video_path: str) -> None:
+        entry = self._captures.pop(video_path, None)
+        if entry is not None:
+            entry[0].release()
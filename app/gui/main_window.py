@@ -1,6 +1,8 @@
 import tkinter as tk
+import queue
+import threading
 from tkinter import ttk, messagebox
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 from app.database_manager import DatabaseManager
 from app.gui.import_dialog import ImportDialog
@@ -10,11 +12,11 @@ from app.gui.query_panel import QueryPanel
 
 class MainWindow:
     
-    def __init__(self, root: tk.Tk, config: Dict[str, Any]):
+    def __init__(self, root: tk.Tk, config: Dict[str, Any], db_manager: Optional[DatabaseManager] = None):
         self.root = root
         self.config = config
         
-        self.db_manager = DatabaseManager(config)
+        self.db_manager = db_manager or DatabaseManager(config)
         self._setup_ui()        
         self.current_video_id = None
     
@@ -70,7 +72,9 @@ class MainWindow:
         status_bar = ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
         status_bar.grid(row=1, column=0, sticky="ew")
         
-        self._refresh_videos()
+        # Runs once mainloop is up, so the first poll below has a loop to
+        # reschedule on.
+        self.root.after_idle(self._refresh_videos)
     
     def _create_menu(self):
         menubar = tk.Menu(self.root)
@@ -91,19 +95,42 @@ class MainWindow:
         self.root.config(menu=menubar)
     
     def _refresh_videos(self):
+        # The first query waits for the cluster; keep it off the Tk thread.
+        # The worker only fills the queue; Tk is touched from the Tk thread.
+        self.status_var.set("Loading videos...")
+        results = queue.Queue()
+        threading.Thread(target=self._load_videos, args=(results,), daemon=True).start()
+        self._poll_videos(results)
+    
+    def _load_videos(self, results: queue.Queue):
         try:
-            videos = self.db_manager.get_all_videos()
-            
-            self.video_combo['values'] = [f"{video['name']} ({video['total_frames']} frames)" for video in videos]
-            
-            if videos and not self.video_var.get():
-                self.video_var.set(f"{videos[0]['name']} ({videos[0]['total_frames']} frames)")
-                self._on_video_select(None)
-            
-            self.status_var.set(f"Found {len(videos)} videos in database")
+            results.put((self.db_manager.get_all_videos(), None))
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to refresh videos: {str(e)}")
-            self.status_var.set("Failed to refresh videos")
+            results.put((None, str(e)))
+    
+    def _poll_videos(self, results: queue.Queue):
+        try:
+            videos, error = results.get_nowait()
+        except queue.Empty:
+            self.root.after(50, lambda: self._poll_videos(results))
+            return
+        if error is not None:
+            self._on_videos_failed(error)
+        else:
+            self._show_videos(videos)
+    
+    def _show_videos(self, videos: List[Dict[str, Any]]):
+        self.video_combo['values'] = [f"{video['name']} ({video['total_frames']} frames)" for video in videos]
+        
+        if videos and not self.video_var.get():
+            self.video_var.set(f"{videos[0]['name']} ({videos[0]['total_frames']} frames)")
+            self._on_video_select(None)
+        
+        self.status_var.set(f"Found {len(videos)} videos in database")
+    
+    def _on_videos_failed(self, error: str):
+        messagebox.showerror("Error", f"Failed to refresh videos: {error}")
+        self.status_var.set("Failed to refresh videos")
     
     def _on_video_select(self, event):
         video_selection = self.video_var.get()
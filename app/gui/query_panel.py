@@ -16,6 +16,8 @@ class QueryPanel(ttk.Frame):
         self.current_video_id = None
         self.video_player = None
         self.current_results = {}
+        self.current_summary = {}
+        self.current_region = None
         self._setup_ui()
     
     def _setup_ui(self):
@@ -39,7 +41,27 @@ class QueryPanel(ttk.Frame):
         self.end_frame_var = tk.StringVar(value="100")
         ttk.Entry(range_frame, textvariable=self.end_frame_var, width=8).pack(side=tk.LEFT, padx=2)
         
-        ttk.Button(query_frame, text="Run Query", command=self._run_query).pack(fill=tk.X, padx=5, pady=5)
+        region_frame = ttk.Frame(query_frame)
+        region_frame.pack(fill=tk.X, padx=5, pady=2)
+        
+        ttk.Label(region_frame, text="Region:").pack(side=tk.LEFT)
+        self.region_var = tk.StringVar(value="Whole frame")
+        ttk.Label(region_frame, textvariable=self.region_var).pack(side=tk.LEFT, padx=5)
+        ttk.Button(region_frame, text="Clear", command=self._clear_region).pack(side=tk.RIGHT)
+        ttk.Button(region_frame, text="Select Region", command=self._select_region).pack(side=tk.RIGHT, padx=2)
+        
+        self.contained_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            query_frame, 
+            text="Fully inside region", 
+            variable=self.contained_var
+        ).pack(anchor=tk.W, padx=5, pady=2)
+        
+        button_frame = ttk.Frame(query_frame)
+        button_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        ttk.Button(button_frame, text="Run Query", command=self._run_query).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 2))
+        ttk.Button(button_frame, text="Count Only", command=self._run_count).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(2, 0))
         
         results_frame = ttk.LabelFrame(self, text="Query Results")
         results_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -65,6 +87,7 @@ class QueryPanel(ttk.Frame):
     def set_video_id(self, video_id: ObjectId):
         self.current_video_id = video_id
         self._clear_results()
+        self._clear_region()
         
         video_info = self.db_manager.get_video_info(video_id)
         if video_info:
@@ -73,52 +96,135 @@ class QueryPanel(ttk.Frame):
     def set_video_player(self, video_player: VideoPlayer):
         self.video_player = video_player
     
+    def _select_region(self):
+        if not self.video_player or not self.current_video_id:
+            messagebox.showerror("Error", "No video loaded")
+            return
+        self.region_var.set("Drag on the frame...")
+        self.video_player.enable_region_selection(self._on_region_selected)
+    
+    def _on_region_selected(self, region):
+        self.current_region = region
+        x, y, w, h = region
+        self.region_var.set(f"{w}x{h} at ({x}, {y})")
+    
+    def _clear_region(self):
+        self.current_region = None
+        self.region_var.set("Whole frame")
+        if self.video_player:
+            self.video_player.set_region(None)
+    
     def _clear_results(self):
         for item in self.results_tree.get_children():
             self.results_tree.delete(item)
         self.current_results = {}
+        self.current_summary = {}
     
-    def _run_query(self):
+    def _get_query_params(self):
         if not self.current_video_id:
             messagebox.showerror("Error", "No video loaded")
-            return
+            return None
+        
+        start_frame = int(self.start_frame_var.get())
+        end_frame = int(self.end_frame_var.get())
+        
+        video_info = self.db_manager.get_video_info(self.current_video_id)
+        if not video_info:
+            messagebox.showerror("Error", "Video not found")
+            return None
+        
+        total_frames = video_info["total_frames"]
+        if start_frame < 0 or end_frame >= total_frames or start_frame > end_frame:
+            messagebox.showerror(
+                "Error", 
+                f"Invalid frame range. Must be between 0 and {total_frames-1}"
+            )
+            return None
         
+        class_str = self.class_var.get()
+        class_id = None
+        if class_str != "All":
+            class_names = [name.capitalize() for name in self.config.get('classes', [])]
+            if class_str in class_names:
+                class_id = class_names.index(class_str)
+        
+        return start_frame, end_frame, class_id
+    
+    def _run_query(self):
         try:
-            start_frame = int(self.start_frame_var.get())
-            end_frame = int(self.end_frame_var.get())
-            
-            video_info = self.db_manager.get_video_info(self.current_video_id)
-            if not video_info:
-                messagebox.showerror("Error", "Video not found")
+            params = self._get_query_params()
+            if params is None:
                 return
+            start_frame, end_frame, class_id = params
             
-            total_frames = video_info["total_frames"]
-            if start_frame < 0 or end_frame >= total_frames or start_frame > end_frame:
-                messagebox.showerror(
-                    "Error", 
-                    f"Invalid frame range. Must be between 0 and {total_frames-1}"
+            self._clear_results()
+            
+            if self.current_region:
+                # Frame-level aggregates do not apply to a region; the
+                # results tree falls back to counting the returned objects.
+                self.current_results = self.db_manager.query_region(
+                    self.current_video_id,
+                    start_frame,
+                    end_frame,
+                    self.current_region,
+                    class_id,
+                    self.contained_var.get()
+                )
+            else:
+                self.current_results = self.db_manager.query_frame_range(
+                    self.current_video_id, 
+                    start_frame, 
+                    end_frame, 
+                    class_id
+                )
+                self.current_summary = self.db_manager.aggregate_frame_range(
+                    self.current_video_id,
+                    start_frame,
+                    end_frame,
+                    class_id
                 )
-                return
             
-            class_str = self.class_var.get()
-            class_id = None
-            if class_str != "All":
-                class_names = [name.capitalize() for name in self.config.get('classes', [])]
-                if class_str in class_names:
-                    class_id = class_names.index(class_str)
+            self._update_results_tree()
+        except Exception as e:
+            messagebox.showerror("Error", f"Query failed: {str(e)}")
+    
+    def _run_count(self):
+        try:
+            params = self._get_query_params()
+            if params is None:
+                return
+            start_frame, end_frame, class_id = params
             
             self._clear_results()
             
-            self.current_results = self.db_manager.query_frame_range(
-                self.current_video_id, 
-                start_frame, 
-                end_frame, 
+            self.current_summary = self.db_manager.aggregate_frame_range(
+                self.current_video_id,
+                start_frame,
+                end_frame,
                 class_id
             )
             
-            self._update_results_tree()
+            if not self.current_summary:
+                self.results_tree.insert("", tk.END, values=("No results", ""))
+                return
+            
+            self.results_tree.insert("", tk.END, values=("Summary", self._format_summary()))
+            
+            class_names = self.config.get('classes', [])
+            for object_class, count in sorted(self.current_summary["class_counts"].items()):
+                if class_id is not None and object_class != class_id:
+                    continue
+                class_name = class_names[object_class].capitalize() if object_class < len(class_names) else str(object_class)
+                self.results_tree.insert("", tk.END, values=(class_name, f"{count} objects"))
         except Exception as e:
-            messagebox.showerror("Error", f"Query failed: {str(e)}")
+            messagebox.showerror("Error", f"Count failed: {str(e)}")
+    
+    def _format_summary(self) -> str:
+        summary = self.current_summary
+        return (
+            f"{summary['count']} objects, "
+            f"{summary['min_per_frame']}-{summary['max_per_frame']} per frame"
+        )
     
     def _update_results_tree(self):
         for item in self.results_tree.get_children():
@@ -128,11 +234,15 @@ class QueryPanel(ttk.Frame):
             self.results_tree.insert("", tk.END, values=("No results", ""))
             return
         
-        total_objects = sum(len(annotations) for annotations in self.current_results.values())
+        if self.current_summary:
+            objects_summary = self._format_summary()
+        else:
+            total_objects = sum(len(annotations) for annotations in self.current_results.values())
+            objects_summary = f"{total_objects} objects"
         self.results_tree.insert(
             "", 
             tk.END, 
-            values=(f"Found {len(self.current_results)} frames", f"{total_objects} objects")
+            values=(f"Found {len(self.current_results)} frames", objects_summary)
         )
         
         for frame_number in sorted(self.current_results.keys()):
@@ -1,9 +1,8 @@
 import tkinter as tk
 from tkinter import ttk
-import cv2
 import time
 import threading
-from typing import Dict, Any, Callable
+from typing import Dict, Any, Callable, Optional, Tuple
 
 from bson.objectid import ObjectId
 from app.database_manager import DatabaseManager
@@ -17,6 +16,7 @@ class VideoPlayer(ttk.Frame):
         self.config = config
         
         self.current_video_id = None
+        self.current_video_path = None
         self.current_frame = 0
         self.total_frames = 0
         self.fps = 30
@@ -25,6 +25,13 @@ class VideoPlayer(ttk.Frame):
         
         self.on_frame_change = None
         
+        # Displayed frames are scaled to fit the canvas; regions are kept in
+        # original image coordinates.
+        self.display_scale = 1.0
+        self.selected_region = None
+        self.on_region_selected = None
+        self._drag_start = None
+        
         self._setup_ui()
     
     def _setup_ui(self):
@@ -38,6 +45,9 @@ class VideoPlayer(ttk.Frame):
         
         self.canvas = tk.Canvas(image_frame, bg="black")
         self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.canvas.bind("<ButtonPress-1>", self._on_drag_start)
+        self.canvas.bind("<B1-Motion>", self._on_drag_move)
+        self.canvas.bind("<ButtonRelease-1>", self._on_drag_end)
         
         controls_frame = ttk.Frame(self)
         controls_frame.grid(row=1, column=0, sticky="ew", padx=5, pady=5)
@@ -96,7 +106,10 @@ class VideoPlayer(ttk.Frame):
         print(f"Found video: {video_info['name']} with {video_info['total_frames']} frames")
         
         self.current_video_id = video_id
-        self.total_frames = video_info["total_frames"]
+        self.current_video_path = video_info.get("file_path")
+        # The slider walks stored frames, which with frame_skip > 1 are
+        # fewer than the video's total_frames.
+        self.total_frames = max(1, len(self.db_manager.get_frame_directory(video_id)))
         self.fps = video_info["fps"]
         
         self.frame_slider.configure(to=self.total_frames-1)
@@ -111,43 +124,44 @@ class VideoPlayer(ttk.Frame):
             return
         
         try:
-            frames = list(self.db_manager.frames.find(
-                {"video_id": self.current_video_id}
-            ).sort("frame_number", 1))
+            directory = self.db_manager.get_frame_directory(self.current_video_id)
             
-            if not frames:
+            if not len(directory):
                 print(f"No frames found for video {self.current_video_id}")
                 return
             
-            frame_index = max(0, min(frame_index, len(frames) - 1))
+            frame_index = max(0, min(frame_index, len(directory) - 1))
             
-            frame = frames[frame_index]
+            frame = directory.frame_at(frame_index)
             frame_number = frame["frame_number"]
             
-            image_path = frame["image_path"]
-            image = cv2.imread(image_path)
+            image = self.db_manager.load_frame_image(self.current_video_id, frame, self.current_video_path)
             if image is None:
-                print(f"Could not load image: {image_path}")
+                print(f"Could not load frame #{frame_number}")
                 return
             
-            annotations = self.db_manager.get_frame_annotations(frame["_id"])
+            annotations = self.db_manager.get_frame_annotations(frame["_id"], self.current_video_id)
             
             image = draw_bounding_boxes(image, annotations, self.config["class_colors"])
             
             canvas_width = self.canvas.winfo_width()
             canvas_height = self.canvas.winfo_height()
             
+            original_width = image.shape[1]
             if canvas_width > 1 and canvas_height > 1:
                 image = resize_image_to_fit(image, canvas_width, canvas_height)
+            self.display_scale = image.shape[1] / original_width
             
             pil_image = cv2_to_pil(image)
             self.photo = pil_to_tkinter(pil_image)
             
             self.canvas.config(width=pil_image.width, height=pil_image.height)
+            self.canvas.delete("all")
             self.canvas.create_image(0, 0, anchor=tk.NW, image=self.photo)
+            self._draw_region()
             
             self.current_frame = frame_index
-            self.frame_var.set(f"{frame_index} / {len(frames) - 1} (#{frame_number})")
+            self.frame_var.set(f"{frame_index} / {len(directory) - 1} (#{frame_number})")
             self.frame_slider.set(frame_index)
             
             if self.on_frame_change:
@@ -157,6 +171,59 @@ class VideoPlayer(ttk.Frame):
             import traceback
             traceback.print_exc()
     
+    def enable_region_selection(self, callback: Callable[[Tuple[int, int, int, int]], None]):
+        self.on_region_selected = callback
+        self.canvas.config(cursor="crosshair")
+    
+    def set_region(self, region: Optional[Tuple[int, int, int, int]]):
+        self.selected_region = region
+        self._draw_region()
+    
+    def _on_drag_start(self, event):
+        if not self.on_region_selected:
+            return
+        self._drag_start = (event.x, event.y)
+    
+    def _on_drag_move(self, event):
+        if not self._drag_start:
+            return
+        x0, y0 = self._drag_start
+        self.canvas.delete("region")
+        self.canvas.create_rectangle(x0, y0, event.x, event.y, outline="yellow", dash=(4, 2), width=2, tags="region")
+    
+    def _on_drag_end(self, event):
+        if not self._drag_start:
+            return
+        x0, y0 = self._drag_start
+        self._drag_start = None
+        
+        scale = self.display_scale or 1.0
+        left, right = sorted((x0, event.x))
+        top, bottom = sorted((y0, event.y))
+        region = (
+            int(left / scale),
+            int(top / scale),
+            max(1, int((right - left) / scale)),
+            max(1, int((bottom - top) / scale))
+        )
+        
+        callback = self.on_region_selected
+        self.on_region_selected = None
+        self.canvas.config(cursor="")
+        self.set_region(region)
+        callback(region)
+    
+    def _draw_region(self):
+        self.canvas.delete("region")
+        if not self.selected_region:
+            return
+        x, y, w, h = self.selected_region
+        scale = self.display_scale
+        self.canvas.create_rectangle(
+            x * scale, y * scale, (x + w) * scale, (y + h) * scale,
+            outline="yellow", width=2, tags="region"
+        )
+    
     def set_on_frame_change(self, callback: Callable[[int], None]):
         self.on_frame_change = callback
     
@@ -220,4 +287,8 @@ class VideoPlayer(ttk.Frame):
             self.after(0, lambda: self.play_button.configure(text="▶"))
     
     def jump_to_frame(self, frame_number: int):
-        self._load_frame(frame_number)
\ No newline at end of file
+        if not self.current_video_id:
+            return
+        ordinal = self.db_manager.get_frame_directory(self.current_video_id).nearest(frame_number)
+        if ordinal is not None:
+            self._load_frame(ordinal)
\ No newline at end of file
@@ -0,0 +1,39 @@
+import hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path: Path, previous: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    # Size, mtime and content hash of a file, or None if it does not exist.
+    # The recorded hash is reused while size and mtime are unchanged, so an
+    # untouched dataset is checked with stat calls only.
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+        return previous
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": file_hash(path)}
+
+
+def fingerprint_files(paths: List[Path], previous: List[Optional[Dict[str, Any]]],
+                      max_workers: int = 4) -> List[Optional[Dict[str, Any]]]:
+    # hashlib releases the GIL on large buffers, so threads overlap reads
+    # and hashing.
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        return list(executor.map(file_fingerprint, paths, previous))
+
+
+def content_changed(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> bool:
+    return (old or {}).get("hash") != (new or {}).get("hash")
@@ -11,9 +11,9 @@ def main():
     root.geometry("1200x800")
     
     db_manager = DatabaseManager(config)
-    db_manager.create_indices()
+    db_manager.start_background_setup()
     
-    app = MainWindow(root, config)
+    app = MainWindow(root, config, db_manager)
     
     root.mainloop()
 
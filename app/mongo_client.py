@@ -0,0 +1,43 @@
+import threading
+from typing import Dict, Any
+from pymongo import MongoClient
+
+# One client per (uri, pool options) for the whole process, shared by every
+# DatabaseManager so tools and windows do not each open their own pool.
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+POOL_OPTIONS = {
+    'max_pool_size': 'maxPoolSize',
+    'min_pool_size': 'minPoolSize',
+    'max_idle_time_ms': 'maxIdleTimeMS',
+    'wait_queue_timeout_ms': 'waitQueueTimeoutMS',
+    'connect_timeout_ms': 'connectTimeoutMS',
+    'server_selection_timeout_ms': 'serverSelectionTimeoutMS'
+}
+
+
+def get_client(db_config: Dict[str, Any]) -> MongoClient:
+    uri = db_config.get('uri') or 'mongodb://localhost:27017'
+    options = {
+        option: db_config[key]
+        for key, option in POOL_OPTIONS.items()
+        if db_config.get(key) is not None
+    }
+    key = (uri, tuple(sorted(options.items())))
+    
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            # connect=False defers server discovery to the first operation,
+            # so creating the client never waits on the network.
+            client = MongoClient(uri, connect=False, **options)
+            _CLIENTS[key] = client
+        return client
+
+
+def close_clients() -> None:
+    with _CLIENTS_LOCK:
+        for client in _CLIENTS.values():
+            client.close()
+        _CLIENTS.clear()
@@ -0,0 +1,196 @@
+import queue
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def detection_boxes(result) -> np.ndarray:
+    # Rows of x1, y1, x2, y2, confidence, class, copied off the device once.
+    if result is None or getattr(result, 'boxes', None) is None:
+        return np.empty((0, 6), dtype=np.float32)
+    return result.boxes.data.cpu().numpy()[:, :6]
+
+
+def _worker_main(model_path: str, torch_threads: int, slot_names: List[str], frame_shape: Tuple[int, ...],
+                 max_batch: int, tasks, results) -> None:
+    # Runs in a spawned process: one model per process, torch limited to
+    # torch_threads so the workers do not oversubscribe the cores.
+    import torch
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    frames = [np.ndarray(frame_shape, dtype=np.uint8, buffer=slot.buf) for slot in slots]
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            batch = [task]
+            while len(batch) < max_batch:
+                try:
+                    task = tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if task is None:
+                    tasks.put(None)
+                    break
+                batch.append(task)
+
+            slot_indexes = [slot_index for slot_index, _ in batch]
+            request_ids = [request_id for _, request_id in batch]
+            try:
+                boxes = [detection_boxes(result) for result in model([frames[i] for i in slot_indexes], verbose=False)]
+                results.put((slot_indexes, request_ids, boxes, None))
+            except Exception as e:
+                results.put((slot_indexes, request_ids, None, repr(e)))
+    finally:
+        del frames
+        for slot in slots:
+            slot.close()
+
+
+class ProcessInference:
+    # Same interface as BatchInference, but the model runs in worker
+    # processes. Frames are copied into a fixed set of shared memory slots
+    # instead of being pickled; submit() blocks while every slot is in use.
+    # max_frames caps the slot count so the copies stay within the caller's
+    # frame budget. Futures resolve with detection_boxes() arrays.
+
+    def __init__(self, model_path: str, frame_shape: Tuple[int, ...], workers: int = 2,
+                 torch_threads: int = 1, max_batch: int = 8, max_frames: Optional[int] = None):
+        self.frame_shape = tuple(frame_shape)
+        self.workers = max(1, workers)
+        self.batches = 0
+        self.frames = 0
+        self._closed = False
+        self._broken = False
+        self._lock = threading.Lock()
+        self._futures: Dict[int, Future] = {}
+        self._next_id = 0
+
+        num_slots = self.workers * max(1, max_batch) * 2
+        if max_frames is not None:
+            num_slots = max(1, min(num_slots, max_frames))
+        nbytes = int(np.prod(self.frame_shape))
+        self._slots = [shared_memory.SharedMemory(create=True, size=nbytes) for _ in range(num_slots)]
+        self._frames = [np.ndarray(self.frame_shape, dtype=np.uint8, buffer=slot.buf) for slot in self._slots]
+        self._free_slots = queue.Queue()
+        for slot_index in range(len(self._slots)):
+            self._free_slots.put(slot_index)
+
+        context = multiprocessing.get_context('spawn')
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(
+                target=_worker_main,
+                args=(model_path, max(1, torch_threads), [slot.name for slot in self._slots],
+                      self.frame_shape, max(1, max_batch), self._tasks, self._results),
+                daemon=True
+            )
+            for _ in range(self.workers)
+        ]
+        for process in self._processes:
+            process.start()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def submit(self, frame: np.ndarray) -> Future:
+        if self._closed:
+            raise RuntimeError("ProcessInference is closed")
+        if self._broken:
+            raise RuntimeError("Inference worker process exited")
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Expected a frame of shape {self.frame_shape}, got {frame.shape}")
+
+        while True:
+            try:
+                slot_index = self._free_slots.get(timeout=0.5)
+                break
+            except queue.Empty:
+                if self._broken:
+                    raise RuntimeError("Inference worker process exited")
+        self._frames[slot_index][...] = frame
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            if self._broken:
+                self._free_slots.put(slot_index)
+                raise RuntimeError("Inference worker process exited")
+            request_id = self._next_id
+            self._next_id += 1
+            self._futures[request_id] = future
+        self._tasks.put((slot_index, request_id))
+        return future
+
+    def infer(self, frame: np.ndarray) -> np.ndarray:
+        return self.submit(frame).result()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join()
+        self._collector.join()
+        self._fail_pending(RuntimeError("ProcessInference closed before the frame was processed"))
+
+        del self._frames
+        for slot in self._slots:
+            slot.close()
+            slot.unlink()
+        self._tasks.close()
+        self._results.close()
+
+    def __enter__(self) -> 'ProcessInference':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _collect(self) -> None:
+        while True:
+            if not self._closed and not self._broken and not all(process.is_alive() for process in self._processes):
+                # A worker died (failed model load, OOM kill, crash) holding
+                # frames we cannot attribute to it, so nothing pending can be
+                # trusted to complete.
+                with self._lock:
+                    self._broken = True
+                self._fail_pending(RuntimeError("Inference worker process exited"))
+            try:
+                slot_indexes, request_ids, boxes, error = self._results.get(timeout=0.5)
+            except queue.Empty:
+                if self._closed and not any(process.is_alive() for process in self._processes):
+                    return
+                continue
+
+            for slot_index in slot_indexes:
+                self._free_slots.put(slot_index)
+            with self._lock:
+                futures = [self._futures.pop(request_id, None) for request_id in request_ids]
+            if error is not None:
+                for future in futures:
+                    if future is not None:
+                        future.set_exception(RuntimeError(error))
+                continue
+            self.batches += 1
+            self.frames += len(futures)
+            for future, frame_boxes in zip(futures, boxes):
+                if future is not None:
+                    future.set_result(frame_boxes)
+
+    def _fail_pending(self, error: Exception) -> None:
+        with self._lock:
+            futures = list(self._futures.values())
+            self._futures.clear()
+        for future in futures:
+            future.set_exception(error)
@@ -1,5 +1,46 @@
+import sys
+import threading
+import struct
 import numpy as np
-from typing import Dict, Set, List, Optional, Union, Any
+from bson.objectid import ObjectId
+from typing import Callable, Dict, Set, List, Iterable, Optional, Tuple, Union, Any
+
+def tree_levels(n: int) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    # (node, start, end) arrays for every depth of the tree layout shared by the
+    # trees below: node i covers [start, end] and its children 2i+1 and 2i+2
+    # split it at the midpoint.
+    nodes = np.zeros(1, dtype=np.int64)
+    starts = np.zeros(1, dtype=np.int64)
+    ends = np.full(1, n - 1, dtype=np.int64)
+    levels = []
+    while len(nodes):
+        levels.append((nodes, starts, ends))
+        internal = starts < ends
+        nodes, starts, ends = nodes[internal], starts[internal], ends[internal]
+        mids = (starts + ends) // 2
+        nodes = np.concatenate([2 * nodes + 1, 2 * nodes + 2])
+        starts = np.concatenate([starts, mids + 1])
+        ends = np.concatenate([mids, ends])
+    return levels
+
+
+def canonical_nodes(n: int, l: int, r: int) -> List[Tuple[int, int, int]]:
+    # Nodes whose ranges exactly tile [l, r], left to right, found with an
+    # explicit stack instead of recursion.
+    nodes = []
+    stack = [(0, 0, n - 1)]
+    while stack:
+        node, start, end = stack.pop()
+        if start > r or end < l:
+            continue
+        if l <= start and end <= r:
+            nodes.append((node, start, end))
+            continue
+        mid = (start + end) // 2
+        stack.append((2*node+2, mid+1, end))
+        stack.append((2*node+1, start, mid))
+    return nodes
+
 
 class FrameSegmentTree:
 
@@ -9,42 +50,37 @@ class FrameSegmentTree:
         self.height = int(np.ceil(np.log2(n))) + 1
         self.max_size = 2 * (2 ** self.height) - 1
         self.st = [set() for _ in range(self.max_size)]
-        
-    def _build_segment_tree(self, annotations: Dict[int, List[Dict]], node: int, start: int, end: int):
-
-        if start == end:
-            if start in annotations:
-                for obj in annotations[start]:
-                    if self.object_class is None or obj['class_id'] == self.object_class:
-                        self.st[node].add(obj['_id'])
-            return
-            
-        mid = (start + end) // 2
-        self._build_segment_tree(annotations, 2*node+1, start, mid)
-        self._build_segment_tree(annotations, 2*node+2, mid+1, end)
-        
-        self.st[node] = self.st[2*node+1].union(self.st[2*node+2])
     
     def build(self, annotations: Dict[int, List[Dict]]):
-        self._build_segment_tree(annotations, 0, 0, self.n-1)
-    
-    def _query(self, node: int, start: int, end: int, l: int, r: int) -> Set:
-        if start > r or end < l:
-            return set()
-            
-        if l <= start and end <= r:
-            return self.st[node]
-            
-        mid = (start + end) // 2
-        left_query = self._query(2*node+1, start, mid, l, r)
-        right_query = self._query(2*node+2, mid+1, end, l, r)
-        
-        return left_query.union(right_query)
+        # Post-order walk with an explicit stack: no recursion, and each union
+        # still reads two sets that were just built. Set unions reuse stored
+        # hashes, which keeps this faster than rebuilding node sets from lists.
+        stack = [(0, 0, self.n-1, False)]
+        while stack:
+            node, start, end, children_built = stack.pop()
+            if start == end:
+                for obj in annotations.get(start, ()):
+                    if self.object_class is None or obj['class_id'] == self.object_class:
+                        self.st[node].add(obj['_id'])
+            elif children_built:
+                self.st[node] = self.st[2*node+1] | self.st[2*node+2]
+            else:
+                mid = (start + end) // 2
+                stack.append((node, start, end, True))
+                stack.append((2*node+2, mid+1, end, False))
+                stack.append((2*node+1, start, mid, False))
     
     def query(self, l: int, r: int) -> Set:
         if l < 0 or r >= self.n or l > r:
             raise ValueError("Invalid query range")
-        return self._query(0, 0, self.n-1, l, r)
+        result = set()
+        for node, _, _ in canonical_nodes(self.n, l, r):
+            result |= self.st[node]
+        return result
+    
+    def memory_usage(self) -> int:
+        node_bytes = sum(sys.getsizeof(s) for s in self.st)
+        return node_bytes + len(self.st[0]) * OBJECT_ID_OBJECT_SIZE
     
     def to_dict(self) -> Dict[str, Any]:
         serialized_st = [list(s) for s in self.st]
@@ -62,4 +98,514 @@ class FrameSegmentTree:
         tree.height = data['height']
         tree.max_size = data['max_size']
         tree.st = [set(s) for s in data['st']]
-        return tree
\ No newline at end of file
+        return tree
+
+
+# Packed layout: header, int32 class ids, int32 offsets (partitions x (n + 1)),
+# then the 12-byte ObjectId table in ordinal order. All integers little-endian.
+BINARY_MAGIC = b'FSTB'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sHxxqqqq')
+OBJECT_ID_SIZE = 12
+OBJECT_ID_OBJECT_SIZE = sys.getsizeof(ObjectId())
+
+
+class CompactFrameSegmentTree:
+
+    def __init__(self, n: int, object_class: Optional[int] = None):
+        self.n = n
+        self.object_class = object_class
+        self.height = int(np.ceil(np.log2(n))) + 1
+        self.max_size = 2 * (2 ** self.height) - 1
+        # Annotation ids are laid out in one flat buffer ordered by (class, frame).
+        # Every node is partitioned by class: for partition p, a node covering
+        # frames [start, end] owns ordinals offsets[p, start]:offsets[p, end + 1].
+        self.classes = np.empty(0, dtype=np.int64)
+        self.ids = np.empty(0, dtype=object)
+        self.offsets = np.zeros((0, n + 1), dtype=np.int64)
+        # Set instead of ids when loaded from the packed format: raw ObjectId
+        # bytes, one row per ordinal, turned into ObjectIds only when queried.
+        self.id_table = None
+
+    def build(self, annotations: Dict[int, List[Dict]]):
+        frame_numbers = []
+        class_ids = []
+        ids = []
+        for frame_number, objects in annotations.items():
+            if frame_number < 0 or frame_number >= self.n:
+                continue
+            for obj in objects:
+                if self.object_class is None or obj['class_id'] == self.object_class:
+                    frame_numbers.append(frame_number)
+                    class_ids.append(obj['class_id'])
+                    ids.append(obj['_id'])
+
+        frame_numbers = np.asarray(frame_numbers, dtype=np.int64)
+        class_ids = np.asarray(class_ids, dtype=np.int64)
+
+        self.classes = np.unique(class_ids)
+        partitions = np.searchsorted(self.classes, class_ids)
+        order = np.lexsort((frame_numbers, partitions))
+
+        self.ids = np.empty(len(ids), dtype=object)
+        self.ids[:] = ids
+        self.ids = self.ids[order]
+
+        num_partitions = len(self.classes)
+        counts = np.bincount(partitions * self.n + frame_numbers, minlength=num_partitions * self.n)
+        counts = counts.reshape(num_partitions, self.n)
+
+        self.offsets = np.zeros((num_partitions, self.n + 1), dtype=np.int64)
+        np.cumsum(counts, axis=1, out=self.offsets[:, 1:])
+        partition_sizes = self.offsets[:, -1].copy()
+        self.offsets[1:] += np.cumsum(partition_sizes)[:-1, None]
+
+    def _partitions(self, classes: Optional[Iterable[int]] = None) -> np.ndarray:
+        if classes is None:
+            return np.arange(len(self.classes))
+        if isinstance(classes, (int, np.integer)):
+            classes = [classes]
+        classes = np.fromiter((int(c) for c in classes), dtype=np.int64)
+        _, partitions, _ = np.intersect1d(self.classes, classes, return_indices=True)
+        return partitions
+
+    def node_range(self, start: int, end: int, partition: int) -> Tuple[int, int]:
+        return int(self.offsets[partition, start]), int(self.offsets[partition, end + 1])
+
+    def query_ordinals(self, l: int, r: int, classes: Optional[Iterable[int]] = None) -> np.ndarray:
+        if l < 0 or r >= self.n or l > r:
+            raise ValueError("Invalid query range")
+        # Within a partition the canonical nodes of [l, r] are adjacent in the
+        # buffer, so each partition contributes a single slice.
+        slices = []
+        for partition in self._partitions(classes):
+            lo, _ = self.node_range(l, l, partition)
+            _, hi = self.node_range(r, r, partition)
+            if hi > lo:
+                slices.append(np.arange(lo, hi, dtype=np.int64))
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(slices)
+
+    def query(self, l: int, r: int, classes: Optional[Iterable[int]] = None) -> List:
+        ordinals = self.query_ordinals(l, r, classes)
+        if self.id_table is not None:
+            raw = self.id_table[ordinals].tobytes()
+            return [ObjectId(raw[i:i + OBJECT_ID_SIZE]) for i in range(0, len(raw), OBJECT_ID_SIZE)]
+        return self.ids[ordinals].tolist()
+
+    def memory_usage(self) -> int:
+        if self.id_table is not None:
+            id_bytes = self.id_table.nbytes
+        else:
+            id_bytes = self.ids.nbytes + len(self.ids) * OBJECT_ID_OBJECT_SIZE
+        return self.classes.nbytes + self.offsets.nbytes + id_bytes
+
+    def _id_bytes(self) -> bytes:
+        if self.id_table is not None:
+            return self.id_table.tobytes()
+        return b''.join(oid.binary for oid in self.ids)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'kind': 'compact',
+            'n': self.n,
+            'object_class': self.object_class,
+            'height': self.height,
+            'max_size': self.max_size,
+            'classes': self.classes.tolist(),
+            'offsets': self.offsets.tolist(),
+            'ids': self.ids.tolist() if self.id_table is None else self.query(0, self.n - 1)
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'CompactFrameSegmentTree':
+        tree = cls(data['n'], data['object_class'])
+        tree.height = data['height']
+        tree.max_size = data['max_size']
+        tree.classes = np.asarray(data['classes'], dtype=np.int64)
+        tree.offsets = np.asarray(data['offsets'], dtype=np.int64).reshape(len(tree.classes), data['n'] + 1)
+        tree.ids = np.empty(len(data['ids']), dtype=object)
+        tree.ids[:] = data['ids']
+        return tree
+
+    def to_bytes(self) -> bytes:
+        object_class = -1 if self.object_class is None else self.object_class
+        num_ids = int(self.offsets[-1, -1]) if len(self.classes) else 0
+        header = BINARY_HEADER.pack(
+            BINARY_MAGIC, BINARY_VERSION, self.n, object_class, len(self.classes), num_ids
+        )
+        return b''.join([
+            header,
+            self.classes.astype('<i4').tobytes(),
+            self.offsets.astype('<i4').tobytes(),
+            self._id_bytes()
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'CompactFrameSegmentTree':
+        magic, version, n, object_class, num_partitions, num_ids = BINARY_HEADER.unpack_from(data, 0)
+        if magic != BINARY_MAGIC:
+            raise ValueError("Not a packed segment tree")
+        if version != BINARY_VERSION:
+            raise ValueError(f"Unsupported segment tree format version {version}")
+
+        tree = cls(n, None if object_class < 0 else object_class)
+
+        # Views into the buffer: nothing is copied until a query needs it.
+        offset = BINARY_HEADER.size
+        tree.classes = np.frombuffer(data, dtype='<i4', count=num_partitions, offset=offset)
+        offset += 4 * num_partitions
+        tree.offsets = np.frombuffer(data, dtype='<i4', count=num_partitions * (n + 1), offset=offset)
+        tree.offsets = tree.offsets.reshape(num_partitions, n + 1)
+        offset += 4 * num_partitions * (n + 1)
+        tree.id_table = np.frombuffer(data, dtype=np.uint8, count=num_ids * OBJECT_ID_SIZE, offset=offset)
+        tree.id_table = tree.id_table.reshape(num_ids, OBJECT_ID_SIZE)
+        tree.ids = None
+        return tree
+
+    def to_pages(self, page_frames: int, page_ids: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        num_ids = int(self.offsets[-1, -1]) if len(self.classes) else 0
+        header = {
+            'kind': 'paged',
+            'n': self.n,
+            'object_class': self.object_class,
+            'classes': self.classes.tolist(),
+            'num_ids': num_ids,
+            'page_frames': page_frames,
+            'page_ids': page_ids
+        }
+
+        pages = []
+        offsets = self.offsets.astype('<i4')
+        for partition in range(len(self.classes)):
+            for page, start in enumerate(range(0, self.n + 1, page_frames)):
+                pages.append({
+                    'kind': 'offsets',
+                    'partition': partition,
+                    'page': page,
+                    'data': offsets[partition, start:start + page_frames].tobytes()
+                })
+
+        id_bytes = self._id_bytes()
+        page_bytes = page_ids * OBJECT_ID_SIZE
+        for page, start in enumerate(range(0, len(id_bytes), page_bytes)):
+            pages.append({
+                'kind': 'ids',
+                'partition': 0,
+                'page': page,
+                'data': id_bytes[start:start + page_bytes]
+            })
+
+        return header, pages
+
+
+class LazyFrameSegmentTree(CompactFrameSegmentTree):
+
+    def __init__(self, header: Dict[str, Any], load_pages: Callable[[List[Tuple[str, int, int]]], Dict[Tuple[str, int, int], bytes]]):
+        super().__init__(header['n'], header['object_class'])
+        self.classes = np.asarray(header['classes'], dtype=np.int64)
+        self.num_ids = header['num_ids']
+        self.page_frames = header['page_frames']
+        self.page_ids = header['page_ids']
+        # Only pages on a query's path are fetched; load_pages maps
+        # (kind, partition, page) keys to the stored bytes.
+        self.load_pages = load_pages
+        self.pages = {}
+        # Called after pages are added, so a cache holding the tree can
+        # re-measure it.
+        self.on_grow = None
+        self.ids = None
+        self.offsets = None
+
+    def missing_pages(self, keys) -> List[Tuple[str, int, int]]:
+        return [key for key in set(keys) if key not in self.pages]
+
+    def add_pages(self, pages: Dict[Tuple[str, int, int], bytes]) -> None:
+        if pages:
+            self.pages.update(pages)
+            if self.on_grow is not None:
+                self.on_grow()
+
+    def _fetch(self, keys) -> None:
+        missing = self.missing_pages(keys)
+        if missing:
+            self.add_pages(self.load_pages(missing))
+
+    def offset_page_keys(self, l: int, r: int, classes: Optional[Iterable[int]] = None) -> List[Tuple[str, int, int]]:
+        return [
+            ('offsets', partition, frame // self.page_frames)
+            for partition in self._partitions(classes)
+            for frame in (l, r + 1)
+        ]
+
+    def id_page_keys(self, ordinals: np.ndarray) -> List[Tuple[str, int, int]]:
+        return [('ids', 0, int(page)) for page in np.unique(ordinals // self.page_ids)]
+
+    def node_range(self, start: int, end: int, partition: int) -> Tuple[int, int]:
+        return self._offset(partition, start), self._offset(partition, end + 1)
+
+    def _offset(self, partition: int, frame: int) -> int:
+        page, index = divmod(frame, self.page_frames)
+        self._fetch([('offsets', partition, page)])
+        data = self.pages[('offsets', partition, page)]
+        return int(np.frombuffer(data, dtype='<i4', count=1, offset=4 * index)[0])
+
+    def query_ordinals(self, l: int, r: int, classes: Optional[Iterable[int]] = None) -> np.ndarray:
+        if l < 0 or r >= self.n or l > r:
+            raise ValueError("Invalid query range")
+        self._fetch(self.offset_page_keys(l, r, classes))
+        return super().query_ordinals(l, r, classes)
+
+    def query(self, l: int, r: int, classes: Optional[Iterable[int]] = None) -> List:
+        ordinals = self.query_ordinals(l, r, classes)
+        if len(ordinals) == 0:
+            return []
+
+        page_numbers = np.unique(ordinals // self.page_ids)
+        self._fetch(self.id_page_keys(ordinals))
+
+        # Ordinals come back ascending, so each page's share is one slice.
+        starts = np.searchsorted(ordinals, page_numbers * self.page_ids)
+        ends = np.searchsorted(ordinals, (page_numbers + 1) * self.page_ids)
+        id_bytes = []
+        for page, start, end in zip(page_numbers, starts, ends):
+            in_page = ordinals[start:end] - page * self.page_ids
+            table = np.frombuffer(self.pages[('ids', 0, int(page))], dtype=np.uint8).reshape(-1, OBJECT_ID_SIZE)
+            id_bytes.append(table[in_page].tobytes())
+        raw = b''.join(id_bytes)
+        return [ObjectId(raw[i:i + OBJECT_ID_SIZE]) for i in range(0, len(raw), OBJECT_ID_SIZE)]
+
+    def memory_usage(self) -> int:
+        return self.classes.nbytes + sum(len(data) for data in self.pages.values())
+
+    def to_compact(self) -> CompactFrameSegmentTree:
+        num_pages = (self.n + 1 + self.page_frames - 1) // self.page_frames
+        num_id_pages = (self.num_ids + self.page_ids - 1) // self.page_ids
+        self._fetch(
+            [('offsets', partition, page) for partition in range(len(self.classes)) for page in range(num_pages)]
+            + [('ids', 0, page) for page in range(num_id_pages)]
+        )
+
+        tree = CompactFrameSegmentTree(self.n, self.object_class)
+        tree.classes = self.classes
+        tree.offsets = np.array([
+            np.frombuffer(b''.join(self.pages[('offsets', partition, page)] for page in range(num_pages)), dtype='<i4')
+            for partition in range(len(self.classes))
+        ], dtype=np.int64).reshape(len(self.classes), self.n + 1)
+        id_bytes = b''.join(self.pages[('ids', 0, page)] for page in range(num_id_pages))
+        tree.id_table = np.frombuffer(id_bytes, dtype=np.uint8).reshape(-1, OBJECT_ID_SIZE)
+        tree.ids = None
+        return tree
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.to_compact().to_dict()
+
+    def to_bytes(self) -> bytes:
+        return self.to_compact().to_bytes()
+
+
+class AppendableFrameSegmentTree:
+
+    def __init__(self, object_class: Optional[int] = None, initial_capacity: int = 1024):
+        self.n = 0
+        self.object_class = object_class
+        self.classes = []
+        self.partitions = {}
+        # Per partition, annotation ids in frame order and per-frame offsets
+        # into them. Offsets capacity doubles, so appends are amortized O(1).
+        self.ids = []
+        self.offsets = np.zeros((0, initial_capacity + 1), dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def _ensure_capacity(self, n: int):
+        capacity = self.offsets.shape[1] - 1
+        if n <= capacity:
+            return
+        while capacity < n:
+            capacity *= 2
+        offsets = np.zeros((self.offsets.shape[0], capacity + 1), dtype=np.int64)
+        offsets[:, :self.n + 1] = self.offsets[:, :self.n + 1]
+        self.offsets = offsets
+
+    def _partition(self, class_id: int) -> int:
+        partition = self.partitions.get(class_id)
+        if partition is None:
+            partition = len(self.classes)
+            self.partitions[class_id] = partition
+            self.classes.append(class_id)
+            self.ids.append([])
+            self.offsets = np.vstack([self.offsets, np.zeros((1, self.offsets.shape[1]), dtype=np.int64)])
+        return partition
+
+    def append_frame(self, frame_number: int, objects: List[Dict]):
+        with self._lock:
+            if frame_number < self.n:
+                raise ValueError(f"Frame {frame_number} appended out of order")
+
+            new_n = frame_number + 1
+            self._ensure_capacity(new_n)
+            # Frames skipped between the previous end and this one are empty.
+            self.offsets[:, self.n + 1:new_n + 1] = self.offsets[:, self.n:self.n + 1]
+
+            for obj in objects:
+                if self.object_class is None or obj['class_id'] == self.object_class:
+                    partition = self._partition(obj['class_id'])
+                    self.ids[partition].append(obj['_id'])
+                    self.offsets[partition, new_n] += 1
+
+            self.n = new_n
+
+    def _selected_partitions(self, classes: Optional[Iterable[int]] = None) -> List[int]:
+        if classes is None:
+            return list(range(len(self.classes)))
+        if isinstance(classes, (int, np.integer)):
+            classes = [classes]
+        return [self.partitions[c] for c in sorted(set(int(c) for c in classes)) if c in self.partitions]
+
+    def query(self, l: int, r: int, classes: Optional[Iterable[int]] = None) -> List:
+        with self._lock:
+            if l < 0 or r >= self.n or l > r:
+                raise ValueError("Invalid query range")
+            result = []
+            for partition in self._selected_partitions(classes):
+                lo, hi = self.offsets[partition, l], self.offsets[partition, r + 1]
+                result.extend(self.ids[partition][lo:hi])
+            return result
+
+    def frame_counts(self, num_classes: int) -> np.ndarray:
+        with self._lock:
+            counts = np.zeros((self.n, num_classes + 1), dtype=np.int32)
+            for partition, class_id in enumerate(self.classes):
+                per_frame = np.diff(self.offsets[partition, :self.n + 1])
+                if 0 <= class_id < num_classes:
+                    counts[:, class_id] = per_frame
+                counts[:, num_classes] += per_frame.astype(np.int32)
+            return counts
+
+    def memory_usage(self) -> int:
+        num_ids = sum(len(ids) for ids in self.ids)
+        return self.offsets.nbytes + num_ids * (8 + OBJECT_ID_OBJECT_SIZE)
+
+    def to_compact(self) -> CompactFrameSegmentTree:
+        with self._lock:
+            tree = CompactFrameSegmentTree(max(self.n, 1), self.object_class)
+            order = sorted(range(len(self.classes)), key=lambda partition: self.classes[partition])
+
+            tree.classes = np.asarray([self.classes[partition] for partition in order], dtype=np.int64)
+            tree.offsets = np.zeros((len(order), tree.n + 1), dtype=np.int64)
+            ids = []
+            for row, partition in enumerate(order):
+                tree.offsets[row, :self.n + 1] = self.offsets[partition, :self.n + 1] + len(ids)
+                tree.offsets[row, self.n + 1:] = tree.offsets[row, self.n]
+                ids.extend(self.ids[partition])
+            tree.ids = np.empty(len(ids), dtype=object)
+            tree.ids[:] = ids
+            return tree
+
+
+def class_mask_to_classes(class_mask: int) -> List[int]:
+    return [class_id for class_id in range(class_mask.bit_length()) if class_mask >> class_id & 1]
+
+
+def frame_class_counts(annotations: Dict[int, List[Dict]], n: int, num_classes: int) -> np.ndarray:
+    # One row per frame, one column per class plus a trailing all-classes column.
+    counts = np.zeros((n, num_classes + 1), dtype=np.int32)
+    for frame_number, objects in annotations.items():
+        if frame_number < 0 or frame_number >= n:
+            continue
+        for obj in objects:
+            class_id = obj['class_id']
+            if 0 <= class_id < num_classes:
+                counts[frame_number, class_id] += 1
+        counts[frame_number, num_classes] = len(objects)
+    return counts
+
+
+# Minimum density leaf value of frames the detector skipped, so they never
+# set the minimum of a range.
+SKIPPED_FRAME_MIN = np.iinfo(np.int32).max
+
+
+class FrameCountTree:
+
+    def __init__(self, n: int, num_classes: int):
+        self.n = n
+        self.num_classes = num_classes
+        self.height = int(np.ceil(np.log2(n))) + 1
+        self.max_size = 2 * (2 ** self.height) - 1
+        self.frame_counts = np.zeros((n, num_classes + 1), dtype=np.int32)
+        self.counts = np.zeros((self.max_size, num_classes + 1), dtype=np.int32)
+        self.max_density = np.zeros((self.max_size, num_classes + 1), dtype=np.int32)
+        self.min_density = np.zeros((self.max_size, num_classes + 1), dtype=np.int32)
+
+    def build(self, annotations: Dict[int, List[Dict]]):
+        self.build_from_counts(frame_class_counts(annotations, self.n, self.num_classes))
+
+    def build_from_counts(self, frame_counts: np.ndarray, inferred: Optional[np.ndarray] = None):
+        # inferred flags, per frame, whether the detector ran on it; a skipped
+        # frame's zero counts mean "not looked at", not "empty".
+        self.frame_counts = np.asarray(frame_counts, dtype=np.int32)
+        leaf_min = self.frame_counts
+        if inferred is not None:
+            leaf_min = np.where(inferred[:, None], self.frame_counts, SKIPPED_FRAME_MIN).astype(np.int32)
+        # Bottom-up, one vectorized step per tree level.
+        for nodes, starts, ends in reversed(tree_levels(self.n)):
+            leaf = starts == ends
+            leaves = nodes[leaf]
+            self.counts[leaves] = self.frame_counts[starts[leaf]]
+            self.max_density[leaves] = self.frame_counts[starts[leaf]]
+            self.min_density[leaves] = leaf_min[starts[leaf]]
+
+            internal = nodes[~leaf]
+            left, right = 2*internal+1, 2*internal+2
+            self.counts[internal] = self.counts[left] + self.counts[right]
+            self.max_density[internal] = np.maximum(self.max_density[left], self.max_density[right])
+            self.min_density[internal] = np.minimum(self.min_density[left], self.min_density[right])
+
+    def query(self, l: int, r: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if l < 0 or r >= self.n or l > r:
+            raise ValueError("Invalid query range")
+        nodes = [node for node, _, _ in canonical_nodes(self.n, l, r)]
+        min_density = self.min_density[nodes].min(axis=0)
+        # A range of skipped frames only has no inferred minimum; report 0.
+        min_density[min_density == SKIPPED_FRAME_MIN] = 0
+        return (
+            self.counts[nodes].sum(axis=0),
+            self.max_density[nodes].max(axis=0),
+            min_density
+        )
+
+    def memory_usage(self) -> int:
+        return (self.frame_counts.nbytes + self.counts.nbytes
+                + self.max_density.nbytes + self.min_density.nbytes)
+
+    def column(self, object_class: Optional[int] = None) -> int:
+        return self.num_classes if object_class is None else object_class
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Only the leaves are stored; internal nodes are cheap to rebuild.
+        return {
+            'kind': 'counts',
+            'n': self.n,
+            'num_classes': self.num_classes,
+            'frame_counts': self.frame_counts.astype('<i4').tobytes()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], inferred: Optional[np.ndarray] = None) -> 'FrameCountTree':
+        tree = cls(data['n'], data['num_classes'])
+        frame_counts = np.frombuffer(data['frame_counts'], dtype='<i4')
+        tree.build_from_counts(frame_counts.reshape(data['n'], data['num_classes'] + 1), inferred)
+        return tree
+
+
+SEGMENT_TREE_KINDS = {
+    'sets': FrameSegmentTree,
+    'compact': CompactFrameSegmentTree
+}
+
+
+def segment_tree_from_dict(data: Dict[str, Any]) -> Union[FrameSegmentTree, CompactFrameSegmentTree]:
+    tree_cls = SEGMENT_TREE_KINDS.get(data.get('kind', 'sets'), FrameSegmentTree)
+    return tree_cls.from_dict(data)
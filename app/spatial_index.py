@@ -0,0 +1,222 @@
+import struct
+import threading
+import numpy as np
+from bson.objectid import ObjectId
+from typing import Dict, List, Iterable, Optional, Tuple
+
+# Packed layout: header, then int32 frames, classes, boxes (x, y, w, h) and
+# the 12-byte ObjectId table per annotation, int32 cell offsets, and int32
+# (ordinal, frame) entries sorted by (cell, frame). All integers little-endian.
+SPATIAL_MAGIC = b'SGIX'
+SPATIAL_VERSION = 1
+SPATIAL_HEADER = struct.Struct('<4sHxxqqqqq')
+OBJECT_ID_SIZE = 12
+# Live appends are merged into the grid once this many are pending, or as
+# many as are already indexed, so rebuilds stay amortized.
+MIN_PENDING_MERGE = 4096
+
+
+class SpatialGridIndex:
+
+    def __init__(self, cell_size: int = 128):
+        self.cell_size = cell_size
+        self.grid_width = 0
+        self.grid_height = 0
+        self.frames = np.empty(0, dtype=np.int32)
+        self.classes = np.empty(0, dtype=np.int32)
+        self.boxes = np.empty((0, 4), dtype=np.int32)
+        self.id_table = np.empty((0, OBJECT_ID_SIZE), dtype=np.uint8)
+        # Every annotation is listed in each grid cell its box overlaps; a
+        # cell's entries are sorted by frame so a frame range is one slice.
+        self.cell_offsets = np.zeros(1, dtype=np.int32)
+        self.entry_ordinals = np.empty(0, dtype=np.int32)
+        self.entry_frames = np.empty(0, dtype=np.int32)
+        # Appended rows not yet in the grid; queries scan them linearly. The
+        # ingest thread appends while query threads read, so both go through
+        # the lock.
+        self._pending = []
+        self._lock = threading.RLock()
+
+    def add_frame(self, frame_number: int, objects: List[Dict]):
+        rows = [
+            (frame_number, obj['class_id'], *obj['bbox'], obj['_id'].binary)
+            for obj in objects if 'bbox' in obj
+        ]
+        with self._lock:
+            self._pending.extend(rows)
+            if len(self._pending) >= max(MIN_PENDING_MERGE, len(self.frames)):
+                self.finalize()
+
+    def build(self, annotations: Dict[int, List[Dict]]):
+        for frame_number, objects in annotations.items():
+            self.add_frame(frame_number, objects)
+        self.finalize()
+
+    def finalize(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if pending:
+                self._merge(pending)
+
+    def _merge(self, pending: List[tuple]):
+        rows = np.array([row[:6] for row in pending], dtype=np.int64).reshape(-1, 6)
+        id_bytes = b''.join(row[6] for row in pending)
+
+        self.frames = np.concatenate([self.frames, rows[:, 0].astype(np.int32)])
+        self.classes = np.concatenate([self.classes, rows[:, 1].astype(np.int32)])
+        self.boxes = np.concatenate([self.boxes, rows[:, 2:6].astype(np.int32)])
+        self.id_table = np.concatenate([
+            self.id_table,
+            np.frombuffer(id_bytes, dtype=np.uint8).reshape(-1, OBJECT_ID_SIZE)
+        ])
+        self._build_grid()
+
+    def _cell_span(self, x0: np.ndarray, y0: np.ndarray, x1: np.ndarray, y1: np.ndarray):
+        cx0 = np.maximum(x0, 0) // self.cell_size
+        cy0 = np.maximum(y0, 0) // self.cell_size
+        cx1 = np.maximum(np.maximum(x1 - 1, x0), 0) // self.cell_size
+        cy1 = np.maximum(np.maximum(y1 - 1, y0), 0) // self.cell_size
+        return cx0, cy0, cx1, cy1
+
+    def _build_grid(self):
+        boxes = self.boxes.astype(np.int64)
+        x0, y0 = boxes[:, 0], boxes[:, 1]
+        cx0, cy0, cx1, cy1 = self._cell_span(x0, y0, x0 + boxes[:, 2], y0 + boxes[:, 3])
+
+        self.grid_width = int(cx1.max()) + 1 if len(boxes) else 0
+        self.grid_height = int(cy1.max()) + 1 if len(boxes) else 0
+        num_cells = self.grid_width * self.grid_height
+
+        # Expand each annotation into one entry per overlapped cell.
+        span_x = cx1 - cx0 + 1
+        cells_per_box = span_x * (cy1 - cy0 + 1)
+        ordinals = np.repeat(np.arange(len(boxes)), cells_per_box)
+        local = np.arange(len(ordinals)) - np.repeat(np.cumsum(cells_per_box) - cells_per_box, cells_per_box)
+        cells = (cy0[ordinals] + local // span_x[ordinals]) * self.grid_width + cx0[ordinals] + local % span_x[ordinals]
+
+        frames = self.frames[ordinals]
+        order = np.lexsort((frames, cells))
+        self.entry_ordinals = ordinals[order].astype(np.int32)
+        self.entry_frames = frames[order].astype(np.int32)
+
+        self.cell_offsets = np.zeros(num_cells + 1, dtype=np.int32)
+        np.cumsum(np.bincount(cells, minlength=num_cells), out=self.cell_offsets[1:])
+
+    @staticmethod
+    def _box_mask(boxes: np.ndarray, box_classes: np.ndarray, region: Tuple[int, int, int, int],
+                  classes: Optional[Iterable[int]], contained: bool) -> np.ndarray:
+        x, y, w, h = region
+        rx0, ry0, rx1, ry1 = x, y, x + w, y + h
+        boxes = boxes.astype(np.int64)
+        bx0, by0 = boxes[:, 0], boxes[:, 1]
+        bx1, by1 = bx0 + boxes[:, 2], by0 + boxes[:, 3]
+        if contained:
+            mask = (bx0 >= rx0) & (by0 >= ry0) & (bx1 <= rx1) & (by1 <= ry1)
+        else:
+            mask = (bx0 < rx1) & (bx1 > rx0) & (by0 < ry1) & (by1 > ry0)
+        if classes is not None:
+            if isinstance(classes, (int, np.integer)):
+                classes = [classes]
+            mask &= np.isin(box_classes, list(classes))
+        return mask
+
+    def query_ordinals(self, l: int, r: int, region: Tuple[int, int, int, int],
+                       classes: Optional[Iterable[int]] = None, contained: bool = False) -> np.ndarray:
+        # Ordinals of the annotations already in the grid; pending rows are
+        # not included.
+        with self._lock:
+            return self._grid_ordinals(l, r, region, classes, contained)
+
+    def _grid_ordinals(self, l: int, r: int, region: Tuple[int, int, int, int],
+                       classes: Optional[Iterable[int]], contained: bool) -> np.ndarray:
+        x, y, w, h = region
+        rx0, ry0, rx1, ry1 = x, y, x + w, y + h
+        if w <= 0 or h <= 0 or rx1 <= 0 or ry1 <= 0 or not self.grid_width:
+            return np.empty(0, dtype=np.int64)
+
+        cx0, cy0, cx1, cy1 = self._cell_span(rx0, ry0, rx1, ry1)
+        cx1 = min(cx1, self.grid_width - 1)
+        cy1 = min(cy1, self.grid_height - 1)
+
+        candidates = []
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                cell = cy * self.grid_width + cx
+                lo, hi = self.cell_offsets[cell], self.cell_offsets[cell + 1]
+                cell_frames = self.entry_frames[lo:hi]
+                start = lo + np.searchsorted(cell_frames, l, side='left')
+                end = lo + np.searchsorted(cell_frames, r, side='right')
+                candidates.append(self.entry_ordinals[start:end])
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+
+        candidates = np.unique(np.concatenate(candidates)).astype(np.int64)
+        mask = self._box_mask(self.boxes[candidates], self.classes[candidates], region, classes, contained)
+        return candidates[mask]
+
+    def query(self, l: int, r: int, region: Tuple[int, int, int, int],
+              classes: Optional[Iterable[int]] = None, contained: bool = False) -> List[ObjectId]:
+        if region[2] <= 0 or region[3] <= 0:
+            return []
+        with self._lock:
+            raw = self.id_table[self._grid_ordinals(l, r, region, classes, contained)].tobytes()
+            pending = list(self._pending)
+
+        if pending:
+            rows = np.array([row[:6] for row in pending], dtype=np.int64).reshape(-1, 6)
+            mask = (rows[:, 0] >= l) & (rows[:, 0] <= r)
+            mask &= self._box_mask(rows[:, 2:6], rows[:, 1], region, classes, contained)
+            raw += b''.join(pending[i][6] for i in np.flatnonzero(mask))
+        return [ObjectId(raw[i:i + OBJECT_ID_SIZE]) for i in range(0, len(raw), OBJECT_ID_SIZE)]
+
+    def memory_usage(self) -> int:
+        return sum(array.nbytes for array in (
+            self.frames, self.classes, self.boxes, self.id_table,
+            self.cell_offsets, self.entry_ordinals, self.entry_frames
+        ))
+
+    def to_bytes(self) -> bytes:
+        self.finalize()
+        header = SPATIAL_HEADER.pack(
+            SPATIAL_MAGIC, SPATIAL_VERSION, self.cell_size, self.grid_width, self.grid_height,
+            len(self.frames), len(self.entry_ordinals)
+        )
+        return b''.join([
+            header,
+            self.frames.astype('<i4').tobytes(),
+            self.classes.astype('<i4').tobytes(),
+            self.boxes.astype('<i4').tobytes(),
+            self.id_table.tobytes(),
+            self.cell_offsets.astype('<i4').tobytes(),
+            self.entry_ordinals.astype('<i4').tobytes(),
+            self.entry_frames.astype('<i4').tobytes()
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'SpatialGridIndex':
+        magic, version, cell_size, grid_width, grid_height, num_boxes, num_entries = SPATIAL_HEADER.unpack_from(data, 0)
+        if magic != SPATIAL_MAGIC:
+            raise ValueError("Not a packed spatial index")
+        if version != SPATIAL_VERSION:
+            raise ValueError(f"Unsupported spatial index format version {version}")
+
+        index = cls(cell_size)
+        index.grid_width = grid_width
+        index.grid_height = grid_height
+
+        offset = SPATIAL_HEADER.size
+
+        def take(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        index.frames = take('<i4', num_boxes)
+        index.classes = take('<i4', num_boxes)
+        index.boxes = take('<i4', num_boxes * 4).reshape(num_boxes, 4)
+        index.id_table = take(np.uint8, num_boxes * OBJECT_ID_SIZE).reshape(num_boxes, OBJECT_ID_SIZE)
+        index.cell_offsets = take('<i4', grid_width * grid_height + 1)
+        index.entry_ordinals = take('<i4', num_entries)
+        index.entry_frames = take('<i4', num_entries)
+        return index
@@ -0,0 +1,578 @@
+import io
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple
+import bson
+from bson.objectid import ObjectId
+from gridfs.errors import NoFile
+from pymongo import InsertOne, DeleteOne, DeleteMany, UpdateOne, UpdateMany, ReplaceOne
+from pymongo.errors import DuplicateKeyError
+from pymongo.results import InsertOneResult, InsertManyResult, UpdateResult, DeleteResult, BulkWriteResult
+
+from app.storage_backend import StorageBackend
+
+# Fields copied out of each document into SQL columns, so filters, sorts
+# and indexes on them run inside SQLite. Everything else is matched on the
+# decoded document.
+KEY_FIELDS = {
+    "videos": ("video_id", "name", "source_type"),
+    "frames": ("video_id", "frame_number"),
+    "annotations": ("video_id", "frame_number", "frame_id", "class_id"),
+    "annotation_buckets": ("video_id", "bucket", "start_frame", "end_frame"),
+    "segment_trees": ("video_id", "object_class"),
+    "count_trees": ("video_id",),
+    "segment_tree_nodes": ("video_id", "object_class", "kind", "partition", "page"),
+    "spatial_indices": ("video_id",),
+    "frame_bitmaps": ("video_id",),
+    "frame_sampling": ("video_id",),
+    "import_manifests": ("video_id", "frame_number"),
+}
+
+SQL_RANGE_OPERATORS = {"$lt": "<", "$lte": "<=", "$gt": ">", "$gte": ">="}
+FETCH_ROWS = 1000
+
+
+def _sql_value(value):
+    if isinstance(value, ObjectId):
+        return value.binary
+    if isinstance(value, (bool, int, float, str, bytes)) or value is None:
+        return value
+    raise TypeError(f"Cannot store {type(value).__name__} in a key column")
+
+
+def _get_field(doc: Dict[str, Any], path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None, False
+        value = value[part]
+    return value, True
+
+
+def _compare(value, operator: str, operand) -> bool:
+    if value is None or operand is None:
+        return False
+    try:
+        if operator == "$lt":
+            return value < operand
+        if operator == "$lte":
+            return value <= operand
+        if operator == "$gt":
+            return value > operand
+        return value >= operand
+    except TypeError:
+        return False
+
+
+def _equals(value, operand) -> bool:
+    if isinstance(value, list) and not isinstance(operand, list):
+        return operand in value
+    return value == operand
+
+
+def matches(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    # The subset of the MongoDB query language DatabaseManager uses.
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+            continue
+        if field == "$and":
+            if not all(matches(doc, branch) for branch in condition):
+                return False
+            continue
+
+        value, present = _get_field(doc, field)
+        if not (isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition)):
+            if not _equals(value, condition):
+                return False
+            continue
+
+        for operator, operand in condition.items():
+            if operator == "$eq":
+                ok = _equals(value, operand)
+            elif operator == "$ne":
+                ok = not _equals(value, operand)
+            elif operator == "$in":
+                ok = any(_equals(value, item) for item in operand)
+            elif operator == "$nin":
+                ok = not any(_equals(value, item) for item in operand)
+            elif operator == "$exists":
+                ok = present == bool(operand)
+            elif operator in SQL_RANGE_OPERATORS:
+                ok = _compare(value, operator, operand)
+            else:
+                raise ValueError(f"Unsupported query operator: {operator}")
+            if not ok:
+                return False
+    return True
+
+
+def _project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not projection:
+        return doc
+    if any(value for key, value in projection.items() if key != "_id") or projection.get("_id"):
+        result = {key: doc[key] for key, value in projection.items() if value and key in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    return {key: value for key, value in doc.items() if key not in projection}
+
+
+def _sort_key(value):
+    # MongoDB orders null/missing before numbers before strings.
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (bool, int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, ObjectId):
+        return (3, value.binary)
+    return (4, repr(value))
+
+
+def _apply_update(doc: Dict[str, Any], update: Dict[str, Any], inserting: bool) -> None:
+    for operator, fields in update.items():
+        if operator == "$set" or (operator == "$setOnInsert" and inserting):
+            doc.update(fields)
+        elif operator == "$unset":
+            for field in fields:
+                doc.pop(field, None)
+        elif operator == "$inc":
+            for field, amount in fields.items():
+                doc[field] = doc.get(field, 0) + amount
+        elif operator != "$setOnInsert":
+            raise ValueError(f"Unsupported update operator: {operator}")
+
+
+def _expression(doc: Dict[str, Any], expression):
+    if expression == "$$ROOT":
+        return doc
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get_field(doc, expression[1:])[0]
+    return expression
+
+
+def _group(docs: Iterable[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    groups = {}
+    for doc in docs:
+        key = _expression(doc, spec["_id"])
+        group = groups.get(_hashable(key))
+        if group is None:
+            group = groups[_hashable(key)] = {"_id": key}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (operator, expression), = accumulator.items()
+            value = _expression(doc, expression)
+            if operator == "$push":
+                group.setdefault(field, []).append(value)
+            elif operator == "$addToSet":
+                if value not in group.setdefault(field, []):
+                    group[field].append(value)
+            elif operator == "$sum":
+                group[field] = group.get(field, 0) + (value or 0)
+            elif operator == "$first":
+                group.setdefault(field, value)
+            elif operator in ("$min", "$max"):
+                if field not in group or (value is not None and (
+                    value < group[field] if operator == "$min" else value > group[field]
+                )):
+                    group[field] = value
+            else:
+                raise ValueError(f"Unsupported group accumulator: {operator}")
+    return list(groups.values())
+
+
+def _hashable(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _hashable(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return tuple(_hashable(item) for item in value)
+    return value
+
+
+class SQLiteCursor:
+
+    def __init__(self, collection: 'SQLiteCollection', query: Dict[str, Any], projection: Optional[Dict[str, Any]]):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self.sort_fields = []
+        self.limit_count = 0
+
+    def sort(self, key_or_list, direction: Optional[int] = None) -> 'SQLiteCursor':
+        if isinstance(key_or_list, str):
+            key_or_list = [(key_or_list, direction or 1)]
+        self.sort_fields = list(key_or_list)
+        return self
+
+    def limit(self, count: int) -> 'SQLiteCursor':
+        self.limit_count = count
+        return self
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        columns = self.collection.columns
+        order_in_sql = all(field in columns for field, _ in self.sort_fields)
+        docs = self.collection._scan(
+            self.query,
+            self.sort_fields if order_in_sql else [],
+            self.limit_count if order_in_sql else 0
+        )
+        if not order_in_sql:
+            docs = list(docs)
+            for field, direction in reversed(self.sort_fields):
+                docs.sort(key=lambda doc: _sort_key(_get_field(doc, field)[0]), reverse=direction < 0)
+            if self.limit_count:
+                docs = docs[:self.limit_count]
+        for doc in docs:
+            yield _project(doc, self.projection)
+
+    def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        docs = list(self)
+        return docs if length is None else docs[:length]
+
+
+class SQLiteCollection:
+
+    def __init__(self, backend: 'SQLiteBackend', name: str):
+        self.backend = backend
+        self.name = name
+        self.full_name = f"{backend.path.stem}.{name}"
+        self.key_fields = KEY_FIELDS.get(name, ())
+        self.columns = {"_id": "_id", **{field: field for field in self.key_fields}}
+        column_sql = "".join(f', "{field}"' for field in self.key_fields)
+        with backend.lock, backend.connection:
+            backend.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" (_id PRIMARY KEY, doc BLOB NOT NULL{column_sql})'
+            )
+
+    def _row(self, doc: Dict[str, Any]) -> Tuple:
+        return (_sql_value(doc["_id"]), bson.encode(doc)) + tuple(
+            _sql_value(doc.get(field)) for field in self.key_fields
+        )
+
+    def _where(self, query: Dict[str, Any]) -> Tuple[List[str], List[Any], Dict[str, Any]]:
+        # Splits a query into SQL conditions on key columns and the residual
+        # filter that has to run on decoded documents.
+        clauses, params, residual = [], [], {}
+        for field, condition in query.items():
+            if field == "$or":
+                branches = [self._where(branch) for branch in condition]
+                if all(not branch[2] and branch[0] for branch in branches):
+                    clauses.append("(" + " OR ".join("(" + " AND ".join(branch[0]) + ")" for branch in branches) + ")")
+                    for branch in branches:
+                        params.extend(branch[1])
+                else:
+                    residual[field] = condition
+                continue
+            if field not in self.columns:
+                residual[field] = condition
+                continue
+
+            column = f'"{self.columns[field]}"'
+            if not (isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition)):
+                try:
+                    value = _sql_value(condition)
+                except TypeError:
+                    residual[field] = condition
+                    continue
+                if value is None:
+                    clauses.append(f"{column} IS NULL")
+                else:
+                    clauses.append(f"{column} = ?")
+                    params.append(value)
+                continue
+
+            for operator, operand in condition.items():
+                try:
+                    if operator in ("$eq", "$in") or operator in SQL_RANGE_OPERATORS:
+                        values = [_sql_value(item) for item in (operand if operator == "$in" else [operand])]
+                    else:
+                        raise TypeError
+                except TypeError:
+                    residual.setdefault(field, {})[operator] = operand
+                    continue
+                if operator == "$in":
+                    if None in values:
+                        residual.setdefault(field, {})[operator] = operand
+                        continue
+                    clauses.append(f"{column} IN ({', '.join('?' * len(values))})" if values else "0")
+                    params.extend(values)
+                elif values[0] is None:
+                    if operator != "$eq":
+                        residual.setdefault(field, {})[operator] = operand
+                        continue
+                    clauses.append(f"{column} IS NULL")
+                else:
+                    clauses.append(f"{column} {'=' if operator == '$eq' else SQL_RANGE_OPERATORS[operator]} ?")
+                    params.append(values[0])
+        return clauses, params, residual
+
+    def _scan(self, query: Optional[Dict[str, Any]], sort_fields=(), limit: int = 0) -> Iterator[Dict[str, Any]]:
+        clauses, params, residual = self._where(query or {})
+        sql = f'SELECT doc FROM "{self.name}"'
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if sort_fields:
+            sql += " ORDER BY " + ", ".join(
+                f'"{self.columns[field]}" {"DESC" if direction < 0 else "ASC"}' for field, direction in sort_fields
+            )
+        if limit and not residual:
+            sql += f" LIMIT {int(limit)}"
+
+        backend = self.backend
+        with backend.lock:
+            cursor = backend.connection.execute(sql, params)
+            rows = cursor.fetchmany(FETCH_ROWS)
+        returned = 0
+        while rows:
+            for (data,) in rows:
+                doc = bson.decode(data)
+                if residual and not matches(doc, residual):
+                    continue
+                yield doc
+                returned += 1
+                if limit and returned >= limit:
+                    return
+            with backend.lock:
+                rows = cursor.fetchmany(FETCH_ROWS)
+
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None) -> SQLiteCursor:
+        return SQLiteCursor(self, filter or {}, projection)
+
+    def find_one(self, filter: Optional[Dict[str, Any]] = None,
+                 projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        for doc in self.find(filter, projection).limit(1):
+            return doc
+        return None
+
+    def count_documents(self, filter: Dict[str, Any]) -> int:
+        clauses, params, residual = self._where(filter)
+        if residual:
+            return sum(1 for _ in self._scan(filter))
+        sql = f'SELECT COUNT(*) FROM "{self.name}"' + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        with self.backend.lock:
+            return self.backend.connection.execute(sql, params).fetchone()[0]
+
+    def distinct(self, key: str, filter: Optional[Dict[str, Any]] = None) -> List[Any]:
+        values = []
+        for doc in self._scan(filter):
+            value, present = _get_field(doc, key)
+            for item in (value if isinstance(value, list) else [value] if present else []):
+                if item not in values:
+                    values.append(item)
+        return values
+
+    def create_index(self, keys, **kwargs) -> str:
+        fields = [key if isinstance(key, str) else key[0] for key in ([keys] if isinstance(keys, str) else keys)]
+        name = "_".join([self.name] + fields)
+        if all(field in self.columns for field in fields):
+            with self.backend.lock, self.backend.connection:
+                self.backend.connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{name}" ON "{self.name}" '
+                    f'({", ".join(chr(34) + self.columns[field] + chr(34) for field in fields)})'
+                )
+        return name
+
+    def _insert(self, docs: List[Dict[str, Any]]) -> List[Any]:
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+        placeholders = ", ".join("?" * (2 + len(self.key_fields)))
+        try:
+            self.backend.connection.executemany(
+                f'INSERT INTO "{self.name}" VALUES ({placeholders})', [self._row(doc) for doc in docs]
+            )
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e))
+        return [doc["_id"] for doc in docs]
+
+    def insert_one(self, document: Dict[str, Any]) -> InsertOneResult:
+        with self.backend.lock, self.backend.connection:
+            return InsertOneResult(self._insert([document])[0], True)
+
+    def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True) -> InsertManyResult:
+        with self.backend.lock, self.backend.connection:
+            return InsertManyResult(self._insert(list(documents)), True)
+
+    def _update(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool, many: bool,
+                replace: bool = False) -> Dict[str, Any]:
+        docs = list(self._scan(filter, limit=0 if many else 1))
+        for doc in docs:
+            if replace:
+                doc_id = doc["_id"]
+                doc.clear()
+                doc.update(update)
+                doc["_id"] = doc_id
+            else:
+                _apply_update(doc, update, False)
+        if docs:
+            row_columns = ", ".join(["doc = ?"] + [f'"{field}" = ?' for field in self.key_fields])
+            self.backend.connection.executemany(
+                f'UPDATE "{self.name}" SET {row_columns} WHERE _id = ?',
+                [self._row(doc)[1:] + (_sql_value(doc["_id"]),) for doc in docs]
+            )
+            return {"n": len(docs), "nModified": len(docs)}
+        if not upsert:
+            return {"n": 0, "nModified": 0}
+
+        doc = {
+            field: condition for field, condition in filter.items()
+            if not field.startswith("$") and not (isinstance(condition, dict) and any(k.startswith("$") for k in condition))
+        }
+        if replace:
+            doc = {**({"_id": doc["_id"]} if "_id" in doc else {}), **update}
+        else:
+            _apply_update(doc, update, True)
+        return {"n": 0, "nModified": 0, "upserted": self._insert([doc])[0]}
+
+    def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+        with self.backend.lock, self.backend.connection:
+            return UpdateResult(self._update(filter, update, upsert, False), True)
+
+    def update_many(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+        with self.backend.lock, self.backend.connection:
+            return UpdateResult(self._update(filter, update, upsert, True), True)
+
+    def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+        with self.backend.lock, self.backend.connection:
+            return UpdateResult(self._update(filter, replacement, upsert, False, replace=True), True)
+
+    def _delete(self, filter: Dict[str, Any], many: bool) -> int:
+        clauses, params, residual = self._where(filter)
+        if many and not residual:
+            sql = f'DELETE FROM "{self.name}"' + (" WHERE " + " AND ".join(clauses) if clauses else "")
+            return self.backend.connection.execute(sql, params).rowcount
+        ids = [(_sql_value(doc["_id"]),) for doc in self._scan(filter, limit=0 if many else 1)]
+        self.backend.connection.executemany(f'DELETE FROM "{self.name}" WHERE _id = ?', ids)
+        return len(ids)
+
+    def delete_one(self, filter: Dict[str, Any]) -> DeleteResult:
+        with self.backend.lock, self.backend.connection:
+            return DeleteResult({"n": self._delete(filter, False)}, True)
+
+    def delete_many(self, filter: Dict[str, Any]) -> DeleteResult:
+        with self.backend.lock, self.backend.connection:
+            return DeleteResult({"n": self._delete(filter, True)}, True)
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True) -> BulkWriteResult:
+        result = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "nUpserted": 0, "upserted": []}
+        with self.backend.lock, self.backend.connection:
+            for index, request in enumerate(requests):
+                if isinstance(request, InsertOne):
+                    self._insert([request._doc])
+                    result["nInserted"] += 1
+                    continue
+                if isinstance(request, (DeleteOne, DeleteMany)):
+                    result["nRemoved"] += self._delete(request._filter, isinstance(request, DeleteMany))
+                    continue
+                if isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    raw = self._update(
+                        request._filter, request._doc, bool(request._upsert),
+                        isinstance(request, UpdateMany), isinstance(request, ReplaceOne)
+                    )
+                else:
+                    raise TypeError(f"Unsupported bulk operation: {type(request).__name__}")
+                result["nMatched"] += raw["n"]
+                result["nModified"] += raw["nModified"]
+                if "upserted" in raw:
+                    result["nUpserted"] += 1
+                    result["upserted"].append({"index": index, "_id": raw["upserted"]})
+        return BulkWriteResult(result, True)
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> Iterator[Dict[str, Any]]:
+        # $match, $group, $sort and $limit, evaluated in Python after the
+        # leading $match is pushed down to SQLite.
+        stages = list(pipeline)
+        query = stages.pop(0)["$match"] if stages and "$match" in stages[0] else {}
+        docs = self._scan(query)
+        for stage in stages:
+            (operator, spec), = stage.items()
+            if operator == "$match":
+                docs = [doc for doc in docs if matches(doc, spec)]
+            elif operator == "$group":
+                docs = _group(docs, spec)
+            elif operator == "$sort":
+                docs = list(docs)
+                for field, direction in reversed(list(spec.items())):
+                    docs.sort(key=lambda doc: _sort_key(_get_field(doc, field)[0]), reverse=direction < 0)
+            elif operator == "$limit":
+                docs = list(docs)[:spec]
+            else:
+                raise ValueError(f"Unsupported aggregation stage: {operator}")
+        return iter(list(docs))
+
+
+class SQLiteFileStore:
+    # GridFS-style store for packed trees and indexes; SQLite blobs have
+    # no 16 MB document limit, so files are kept whole.
+
+    def __init__(self, backend: 'SQLiteBackend', name: str):
+        self.backend = backend
+        self.name = name
+        with backend.lock, backend.connection:
+            backend.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" (_id BLOB PRIMARY KEY, video_id BLOB, data BLOB NOT NULL)'
+            )
+
+    def put(self, data: bytes, **metadata) -> ObjectId:
+        file_id = ObjectId()
+        video_id = metadata.get("video_id")
+        with self.backend.lock, self.backend.connection:
+            self.backend.connection.execute(
+                f'INSERT INTO "{self.name}" VALUES (?, ?, ?)',
+                (file_id.binary, _sql_value(video_id), bytes(data))
+            )
+        return file_id
+
+    def get(self, file_id: ObjectId) -> io.BytesIO:
+        with self.backend.lock:
+            row = self.backend.connection.execute(
+                f'SELECT data FROM "{self.name}" WHERE _id = ?', (file_id.binary,)
+            ).fetchone()
+        if row is None:
+            raise NoFile(f"no file in {self.name} with _id {file_id}")
+        return io.BytesIO(row[0])
+
+    def delete(self, file_id: ObjectId) -> None:
+        with self.backend.lock, self.backend.connection:
+            self.backend.connection.execute(f'DELETE FROM "{self.name}" WHERE _id = ?', (file_id.binary,))
+
+
+class SQLiteBackend(StorageBackend):
+    # Single-file local store: one table per collection holding BSON
+    # documents plus indexed key columns. Queries run in-process, so a
+    # lookup costs microseconds instead of a network round trip.
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection shared by the GUI, import and writer threads,
+        # serialized by the lock.
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.lock = threading.RLock()
+        self._collections = {}
+        self._file_stores = {}
+
+    def collection(self, name: str) -> SQLiteCollection:
+        with self.lock:
+            if name not in self._collections:
+                self._collections[name] = SQLiteCollection(self, name)
+            return self._collections[name]
+
+    def file_store(self, name: str) -> SQLiteFileStore:
+        with self.lock:
+            if name not in self._file_stores:
+                self._file_stores[name] = SQLiteFileStore(self, name)
+            return self._file_stores[name]
+
+    def describe(self) -> str:
+        return f"SQLite store at {self.path}"
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,49 @@
+from typing import Dict, Any
+import gridfs
+
+from app.mongo_client import get_client
+
+
+class StorageBackend:
+    # Where DatabaseManager keeps its documents. collection() returns an
+    # object with the PyMongo Collection methods DatabaseManager uses
+    # (find, find_one, insert_*, update_*, replace_one, delete_*,
+    # bulk_write, aggregate, distinct, count_documents, create_index);
+    # file_store() one with GridFS-style put/get/delete for packed trees.
+
+    def collection(self, name: str):
+        raise NotImplementedError
+
+    def file_store(self, name: str):
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+
+class MongoBackend(StorageBackend):
+
+    def __init__(self, db_config: Dict[str, Any]):
+        self.uri = db_config.get('uri') or 'mongodb://localhost:27017'
+        self.client = get_client(db_config)
+        self.db = self.client[db_config.get('db_name', 'visdrone_db')]
+
+    def collection(self, name: str):
+        return self.db[name]
+
+    def file_store(self, name: str):
+        return gridfs.GridFS(self.db, collection=name)
+
+    def describe(self) -> str:
+        return f"MongoDB at {self.uri}"
+
+
+def create_storage_backend(config: Dict[str, Any]) -> StorageBackend:
+    storage_config = config.get('storage', {})
+    backend = storage_config.get('backend', 'mongodb')
+    if backend == 'mongodb':
+        return MongoBackend(config.get('mongodb', {}))
+    if backend == 'sqlite':
+        from app.sqlite_backend import SQLiteBackend
+        return SQLiteBackend(storage_config.get('sqlite_path', 'data/visdrone.sqlite'))
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -1,17 +1,19 @@
 import os
 import cv2
 import numpy as np
-import tempfile
+import queue
 import threading
-import shutil
 import torch
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple, Union
-from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Any, Optional, Tuple, Union
+from concurrent.futures import Future
 import time
 
 from bson.objectid import ObjectId
 from app.database_manager import DatabaseManager
+from app.batch_inference import BatchInference
+from app.process_inference import ProcessInference, detection_boxes
+from app.frame_sampler import FrameSamplingRecord, create_frame_sampler
 
 class VideoProcessor:
     
@@ -20,7 +22,8 @@ class VideoProcessor:
         self.db_manager = db_manager
         self.config = config
         self.yolo_model = None
-        self.temp_dir = None
+        self.model_path = None
+        self.inference = None
         self.stop_processing = False
         
         self._init_yolo_model()
@@ -43,6 +46,7 @@ class VideoProcessor:
                 model_name = f"{model_to_best[model_name]}.pt"
             
             print(f"Loading YOLO model: {model_name}")
+            self.model_path = model_name
             self.yolo_model = YOLO(model_name)
             
             self._map_yolo_to_visdrone_classes()
@@ -79,9 +83,7 @@ class VideoProcessor:
         if self.yolo_model is None:
             raise RuntimeError("YOLO model is not initialized")
         
-        self.temp_dir = tempfile.mkdtemp()
-        print(f"Created temporary directory: {self.temp_dir}")
-        
+        video_id = None
         try:
             self.stop_processing = False
             
@@ -110,141 +112,199 @@ class VideoProcessor:
             }
             
             video_id = self.db_manager.import_video(video_data)
+            self.db_manager.start_live_segment_tree(video_id)
             
             yolo_config = self.config.get('yolo', {})
-            frame_skip = yolo_config.get('frame_skip', 1)
-            max_workers = self.config.get('video_import', {}).get('max_workers', 4)
+            import_config = self.config.get('video_import', {})
+            # Every frame between decode and its database write holds a slot,
+            # so at most max_buffered_mb of frames are in memory at once.
+            max_frames = max(1, int(import_config.get('max_buffered_mb', 256) * 2 ** 20) // max(1, width * height * 3))
+            write_batch = max(1, min(import_config.get('write_batch_frames', 32), max_frames))
+            print(f"Buffering at most {max_frames} frames, writing {write_batch} frames per batch")
             
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = []
-                frame_idx = 0
-                
-                while True:
-                    if self.stop_processing:
-                        print("Stopping video processing")
-                        break
-                    
-                    ret, frame = cap.read()
-                    if not ret:
-                        break
-                    
-                    if frame_idx % frame_skip == 0:
-                        frame_path = os.path.join(self.temp_dir, f"frame_{frame_idx:06d}.jpg")
-                        cv2.imwrite(frame_path, frame)
-                        
-                        future = executor.submit(
-                            self._process_frame,
-                            frame,
-                            frame_path,
-                            frame_idx,
-                            video_id,
-                            fps
-                        )
-                        futures.append(future)
-                        
-                        progress = (frame_idx + 1) / total_frames * 100
-                        if callback:
-                            callback(progress, f"Processing frame {frame_idx + 1}/{total_frames}")
-                    
-                    frame_idx += 1
-                
-                for future in futures:
-                    future.result()
+            processes = min(yolo_config.get('inference_processes', 0), os.cpu_count() or 1)
+            if processes > 0:
+                print(f"Running inference in {processes} worker processes")
+                self.inference = ProcessInference(
+                    self.model_path,
+                    (height, width, 3),
+                    processes,
+                    yolo_config.get('torch_threads', 1),
+                    yolo_config.get('batch_size', 8),
+                    max_frames
+                )
+            else:
+                self.inference = BatchInference(
+                    lambda frames: [detection_boxes(result) for result in self.yolo_model(frames)],
+                    yolo_config.get('batch_size', 8),
+                    yolo_config.get('batch_timeout_ms', 20)
+                )
+            frame_slots = threading.Semaphore(max_frames)
+            write_queue = queue.Queue(maxsize=max_frames)
+            stopped = threading.Event()
+            errors = []
+            sampling = FrameSamplingRecord()
+            
+            decoder = threading.Thread(
+                target=self._decode_frames,
+                args=(cap, fps, create_frame_sampler(yolo_config), sampling, total_frames,
+                      frame_slots, write_queue, stopped, errors, callback),
+                daemon=True
+            )
+            decoder.start()
+            try:
+                self._write_frames(write_queue, frame_slots, video_id, write_batch)
+            finally:
+                stopped.set()
+                decoder.join()
+            if errors:
+                raise errors[0]
             
-            self._build_segment_trees(video_id)
+            print(f"Ran detection on {len(sampling.inferred_frames())} of {sampling.n} frames")
+            self.db_manager.store_frame_sampling(video_id, sampling)
+            self.db_manager.flush_annotation_buckets(video_id)
+            self.db_manager.finish_live_segment_tree(video_id)
             
             return video_id
         
         finally:
-            if self.temp_dir and os.path.exists(self.temp_dir):
-                shutil.rmtree(self.temp_dir)
-                print(f"Removed temporary directory: {self.temp_dir}")
+            if self.inference is not None:
+                self.inference.close()
+                self.inference = None
+            if video_id is not None:
+                self.db_manager.flush_annotation_buckets(video_id)
+                self.db_manager.discard_live_segment_tree(video_id)
     
-    def _process_frame(self, frame: np.ndarray, frame_path: str, frame_idx: int, 
-                      video_id: ObjectId, fps: float) -> None:
-
+    def _decode_frames(self, cap, fps: float, sampler, sampling: FrameSamplingRecord, total_frames: int,
+                       frame_slots: threading.Semaphore, write_queue: queue.Queue, stopped: threading.Event,
+                       errors: List[Exception], callback: Optional[callable]) -> None:
+        # Decoder stage: blocks while all frame slots are taken, records the
+        # sampler's decision for every frame, hands each kept frame to the
+        # model and queues it for the writer in frame order. Ends the queue
+        # with None.
         try:
-            frame_data = {
-                "video_id": video_id,
-                "frame_number": frame_idx,
-                "image_path": frame_path,
-                "timestamp": frame_idx / fps
-            }
-            
-            frame_id = self.db_manager.store_frame(frame_data)
-            results = self.yolo_model(frame)
-            annotations = []
-            
-            if len(results) > 0:
-                result = results[0]
+            frame_idx = 0
+            while True:
+                if self.stop_processing:
+                    print("Stopping video processing")
+                    break
+                if not self._wait(lambda: frame_slots.acquire(timeout=0.1), stopped):
+                    return
                 
-                yolo_config = self.config.get('yolo', {})
-                conf_threshold = yolo_config.get('confidence_threshold', 0.5)
+                ret, frame = cap.read()
+                if not ret:
+                    frame_slots.release()
+                    break
                 
-                if hasattr(result, 'boxes'):
-                    boxes = result.boxes
-                    for box in boxes:
-                        box_data = box.data.cpu().numpy()[0]
-                        confidence = box_data[4]
-                        
-                        if confidence >= conf_threshold:
-                            x1, y1, x2, y2 = box_data[0:4]
-                            x = int(x1)
-                            y = int(y1)
-                            w = int(x2 - x1)
-                            h = int(y2 - y1)
-                            
-                            class_id = int(box.cls.cpu().numpy()[0])
-                            
-                            visdrone_class_id = self._map_class_id(class_id)
-                            class_names = self.config.get('classes', [])
-                            class_name = class_names[visdrone_class_id] if visdrone_class_id < len(class_names) else "unknown"
-                            
-                            annotation = {
-                                "frame_id": frame_id,
-                                "bbox": [x, y, w, h],
-                                "class_id": visdrone_class_id,
-                                "class_name": class_name,
-                                "confidence": float(confidence)
-                            }
-                            
-                            annotations.append(annotation)
-            
-            if annotations:
-                self.db_manager.store_annotations(annotations)
-            
+                inferred = sampler.sample(frame_idx, frame)
+                sampling.add(inferred, sampler.last_score)
+                if not inferred:
+                    frame_slots.release()
+                    frame_idx += 1
+                    continue
+                
+                # Frames are read back from the video file later, located by
+                # this timestamp; nothing is written to disk per frame.
+                position_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+                timestamp = position_ms / 1000 if position_ms > 0 else frame_idx / fps
+                item = (frame_idx, timestamp, self.inference.submit(frame))
+                if not self._wait(lambda: self._put(write_queue, item), stopped):
+                    return
+                
+                progress = (frame_idx + 1) / total_frames * 100
+                if callback:
+                    callback(progress, f"Processing frame {frame_idx + 1}/{total_frames}")
+                frame_idx += 1
         except Exception as e:
-            print(f"Error processing frame {frame_idx}: {e}")
+            errors.append(e)
+        finally:
+            cap.release()
+            self._wait(lambda: self._put(write_queue, None), stopped)
     
-    def _map_class_id(self, yolo_class_id: int) -> int:
-        return self.class_mapping.get(yolo_class_id, self.default_class_id)
+    @staticmethod
+    def _wait(attempt: Callable[[], bool], stopped: threading.Event) -> bool:
+        while not stopped.is_set():
+            if attempt():
+                return True
+        return False
     
-    def _build_segment_trees(self, video_id: ObjectId) -> None:
-        print(f"Building segment trees for video {video_id}")
-        
-        frames = list(self.db_manager.frames.find({"video_id": video_id}).sort("frame_number", 1))
-        
-        if not frames:
-            print("No frames found, skipping segment tree creation")
-            return
-        
-        max_frame_number = max(frame["frame_number"] for frame in frames) + 1
-        
-        frame_annotations = {}
+    @staticmethod
+    def _put(write_queue: queue.Queue, item) -> bool:
+        try:
+            write_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            return False
+    
+    def _write_frames(self, write_queue: queue.Queue, frame_slots: threading.Semaphore,
+                      video_id: ObjectId, write_batch: int) -> None:
+        # Writer stage: stores frames in batches, flushing early when the
+        # queue runs dry so the live segment tree does not lag behind.
+        batch = []
+        while True:
+            try:
+                item = write_queue.get(timeout=0.5) if batch else write_queue.get()
+            except queue.Empty:
+                item = False
+            if item:
+                batch.append(item)
+            if batch and (item is None or item is False or len(batch) >= write_batch):
+                self._store_frame_batch(batch, video_id)
+                for _ in batch:
+                    frame_slots.release()
+                batch = []
+            if item is None:
+                return
+    
+    def _store_frame_batch(self, batch: List[Tuple[int, float, Future]], video_id: ObjectId) -> None:
+        frames = []
+        frame_annotations = []
+        for frame_idx, timestamp, detection in batch:
+            frame_id = ObjectId()
+            frames.append({
+                "_id": frame_id,
+                "video_id": video_id,
+                "frame_number": frame_idx,
+                "timestamp": timestamp
+            })
+            try:
+                annotations = self._detections_to_annotations(detection.result(), frame_id, video_id, frame_idx)
+            except Exception as e:
+                print(f"Error processing frame {frame_idx}: {e}")
+                annotations = []
+            frame_annotations.append(annotations)
         
-        for frame in frames:
-            frame_id = frame["_id"]
-            frame_number = frame["frame_number"]
-            
-            annotations = self.db_manager.get_frame_annotations(frame_id)
-            frame_annotations[frame_number] = [
-                {"_id": annotation["_id"], "class_id": annotation["class_id"]}
+        self.db_manager.store_frames(frames)
+        annotations = [annotation for annotations in frame_annotations for annotation in annotations]
+        annotation_ids = iter(self.db_manager.store_annotations(annotations))
+        for frame, annotations in zip(frames, frame_annotations):
+            objects = [
+                {"_id": next(annotation_ids), "class_id": annotation["class_id"], "bbox": annotation["bbox"]}
                 for annotation in annotations
             ]
+            self.db_manager.append_live_frame(video_id, frame["frame_number"], objects)
+    
+    def _detections_to_annotations(self, boxes: np.ndarray, frame_id: ObjectId, video_id: ObjectId, frame_idx: int) -> List[Dict]:
+        conf_threshold = self.config.get('yolo', {}).get('confidence_threshold', 0.5)
+        boxes = boxes[boxes[:, 4] >= conf_threshold]
+        class_names = self.config.get('classes', [])
         
-        self.db_manager._build_segment_trees(video_id, frame_annotations, max_frame_number)
-        
-        print("Segment trees built successfully")
+        annotations = []
+        for x1, y1, x2, y2, confidence, class_id in boxes.tolist():
+            visdrone_class_id = self._map_class_id(int(class_id))
+            annotations.append({
+                "frame_id": frame_id,
+                "video_id": video_id,
+                "frame_number": frame_idx,
+                "bbox": [int(x1), int(y1), int(x2 - x1), int(y2 - y1)],
+                "class_id": visdrone_class_id,
+                "class_name": class_names[visdrone_class_id] if visdrone_class_id < len(class_names) else "unknown",
+                "confidence": float(confidence)
+            })
+        return annotations
+    
+    def _map_class_id(self, yolo_class_id: int) -> int:
+        return self.class_mapping.get(yolo_class_id, self.default_class_id)
     
     def stop(self) -> None:
         self.stop_processing = True
\ No newline at end of file
@@ -0,0 +1,133 @@
+import sys
+import os
+import time
+import argparse
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bson
+from bson.objectid import ObjectId
+
+from app.annotation_buckets import AnnotationBucketBuffer, bucket_index, decode_bucket
+from utils.converters import parse_visdrone_files, visdrone_records_to_mongodb_format
+
+CLASS_NAMES = [
+    "pedestrian", "people", "bicycle", "car", "van",
+    "truck", "tricycle", "awning-tricycle", "bus", "motor"
+]
+
+# Secondary indexes on annotations in the per-box layout besides _id:
+# frame_id, class_id and (video_id, frame_number).
+PER_BOX_INDEXES = 4
+
+
+def make_layouts(annotations_path: Path, repeat: int, bucket_frames: int):
+    files = sorted(annotations_path.glob("*.txt"))
+    parsed = list(parse_visdrone_files(files, len(CLASS_NAMES)))
+    video_id = ObjectId()
+    documents = []
+    buffer = AnnotationBucketBuffer(bucket_frames)
+    buckets = []
+    for copy in range(repeat):
+        for index, records in enumerate(parsed):
+            frame_number = copy * len(parsed) + index
+            frame_id = ObjectId()
+            frame_docs = visdrone_records_to_mongodb_format(records, frame_id, CLASS_NAMES)
+            for annotation in frame_docs:
+                annotation["_id"] = ObjectId()
+                annotation["video_id"] = video_id
+                annotation["frame_number"] = frame_number
+            documents.extend(frame_docs)
+            buffer.add(video_id, frame_number, frame_id, frame_docs)
+            buckets.extend(buffer.pop_before(video_id, bucket_index(frame_number, bucket_frames)))
+    buckets.extend(buffer.pop_all(video_id))
+    return video_id, documents, buckets
+
+
+def scan_documents(encoded):
+    result = {}
+    for data in encoded:
+        annotation = bson.decode(data)
+        result.setdefault(annotation["frame_number"], []).append(annotation)
+    return result
+
+
+def scan_buckets(encoded):
+    result = {}
+    for data in encoded:
+        for frame_number, annotations in decode_bucket(bson.decode(data), CLASS_NAMES).items():
+            result.setdefault(frame_number, []).extend(annotations)
+    return result
+
+
+def measure_local(documents, buckets):
+    encoded_documents = [bson.encode(document) for document in documents]
+    encoded_buckets = [bson.encode(bucket) for bucket in buckets]
+
+    for label, encoded, index_entries, scan in (
+        ("documents", encoded_documents, len(documents) * PER_BOX_INDEXES, scan_documents),
+        ("buckets", encoded_buckets, len(buckets) * 2, scan_buckets),
+    ):
+        start_time = time.perf_counter()
+        frames = scan(encoded)
+        elapsed = time.perf_counter() - start_time
+        size = sum(len(data) for data in encoded)
+        print(
+            f"  {label:<10} {len(encoded):8d} docs  {size / 2**20:8.2f} MiB BSON  "
+            f"{index_entries:9d} index entries  decode+group {elapsed * 1000:8.1f} ms  ({len(frames)} frames)"
+        )
+
+
+def measure_server(uri, database, video_id, documents, buckets):
+    from pymongo import MongoClient
+
+    client = MongoClient(uri)
+    client.drop_database(database)
+    db = client[database]
+    try:
+        db.annotations.create_index([("frame_id", 1)])
+        db.annotations.create_index([("class_id", 1)])
+        db.annotations.create_index([("video_id", 1), ("frame_number", 1)])
+        db.annotation_buckets.create_index([("video_id", 1), ("start_frame", 1)])
+        for start in range(0, len(documents), 10000):
+            db.annotations.insert_many(documents[start:start + 10000], ordered=False)
+        db.annotation_buckets.insert_many(buckets, ordered=False)
+
+        for label, collection, scan in (
+            ("documents", db.annotations, lambda: sum(1 for _ in db.annotations.find({"video_id": video_id}))),
+            ("buckets", db.annotation_buckets, lambda: sum(
+                len(a) for doc in db.annotation_buckets.find({"video_id": video_id})
+                for a in decode_bucket(doc, CLASS_NAMES).values()
+            )),
+        ):
+            stats = db.command("collStats", collection.name)
+            start_time = time.perf_counter()
+            boxes = scan()
+            elapsed = time.perf_counter() - start_time
+            print(
+                f"  {label:<10} storage {stats['storageSize'] / 2**20:8.2f} MiB  "
+                f"indexes {stats['totalIndexSize'] / 2**20:8.2f} MiB  full scan {elapsed * 1000:8.1f} ms  ({boxes} boxes)"
+            )
+    finally:
+        client.drop_database(database)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-box and bucketed annotation storage")
+    parser.add_argument("--annotations", default="videods-test/annotations")
+    parser.add_argument("--repeat", type=int, default=50, help="times to repeat the sample sequence")
+    parser.add_argument("--bucket-frames", type=int, default=256)
+    parser.add_argument("--uri", help="also measure against this MongoDB server (scratch database)")
+    parser.add_argument("--database", default="video_db_layout_benchmark")
+    args = parser.parse_args()
+
+    video_id, documents, buckets = make_layouts(Path(args.annotations), args.repeat, args.bucket_frames)
+    print(f"{len(documents)} annotations, {args.bucket_frames} frames per bucket")
+    measure_local(documents, buckets)
+    if args.uri:
+        measure_server(args.uri, args.database, video_id, documents, buckets)
+
+
+if __name__ == "__main__":
+    main()
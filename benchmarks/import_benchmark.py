@@ -0,0 +1,109 @@
+import sys
+import os
+import time
+import argparse
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+
+from app.bulk_writer import BulkWriter
+
+
+def load_annotation_lines(annotations_path: Path):
+    # (stem, [(x, y, w, h, class_id)]) per annotation file, filtered the way
+    # import_visdrone_dataset filters them.
+    files = []
+    for annotation_file in sorted(annotations_path.glob("*.txt")):
+        boxes = []
+        with open(annotation_file, "r") as f:
+            for line in f:
+                parts = line.strip().split(",")
+                if len(parts) >= 6 and int(parts[4]) != 0:
+                    x, y, w, h = map(int, parts[:4])
+                    class_id = int(parts[5]) - 1
+                    if 0 <= class_id < 10:
+                        boxes.append((x, y, w, h, class_id))
+        files.append((annotation_file.stem, boxes))
+    return files
+
+
+def make_documents(files, repeat: int, video_id: ObjectId):
+    # Yields (kind, document) with client-side ids, repeating the sample
+    # sequence with shifted frame numbers to reach a realistic size.
+    for copy in range(repeat):
+        for index, (stem, boxes) in enumerate(files):
+            frame_number = copy * len(files) + index
+            frame_id = ObjectId()
+            yield "frames", {
+                "_id": frame_id,
+                "video_id": video_id,
+                "frame_number": frame_number,
+                "image_path": f"{stem}.jpg",
+                "timestamp": frame_number / 30
+            }
+            for x, y, w, h, class_id in boxes:
+                yield "annotations", {
+                    "_id": ObjectId(),
+                    "frame_id": frame_id,
+                    "bbox": [x, y, w, h],
+                    "class_id": class_id,
+                    "class_name": str(class_id),
+                    "confidence": 1.0
+                }
+
+
+def run_insert_one(db, files, repeat):
+    count = 0
+    start_time = time.perf_counter()
+    for kind, document in make_documents(files, repeat, ObjectId()):
+        db[kind].insert_one(document)
+        count += 1
+    return count, time.perf_counter() - start_time
+
+
+def run_bulk(db, files, repeat, batch_size, max_pending_batches):
+    start_time = time.perf_counter()
+    with BulkWriter(batch_size, max_pending_batches) as writer:
+        for kind, document in make_documents(files, repeat, ObjectId()):
+            writer.add(db[kind], document)
+    return writer.inserted, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-document and bulk VisDrone import throughput")
+    parser.add_argument("--dataset", default="videods-test", help="dataset directory with an annotations folder")
+    parser.add_argument("--repeat", type=int, default=20, help="times to repeat the sample sequence")
+    # Never the configured server: the scratch database is created and dropped.
+    parser.add_argument("--uri", default="mongodb://localhost:27017", help="MongoDB URI of a scratch server")
+    parser.add_argument("--database", default="video_db_import_benchmark", help="scratch database, dropped afterwards")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--max-pending-batches", type=int, default=4)
+    parser.add_argument("--skip-baseline", action="store_true", help="skip the insert_one baseline")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    db = client[args.database]
+
+    files = load_annotation_lines(Path(args.dataset) / "annotations")
+    num_boxes = sum(len(boxes) for _, boxes in files)
+    print(f"{len(files)} frames, {num_boxes} annotations per copy, {args.repeat} copies")
+
+    try:
+        if not args.skip_baseline:
+            client.drop_database(args.database)
+            count, elapsed = run_insert_one(db, files, args.repeat)
+            print(f"  insert_one per document    {count:9d} docs  {elapsed:8.2f} s  {count / elapsed:10.0f} docs/s")
+
+        for batch_size in args.batch_size:
+            client.drop_database(args.database)
+            count, elapsed = run_bulk(db, files, args.repeat, batch_size, args.max_pending_batches)
+            print(f"  bulk, batch {batch_size:<6d}         {count:9d} docs  {elapsed:8.2f} s  {count / elapsed:10.0f} docs/s")
+    finally:
+        client.drop_database(args.database)
+
+
+if __name__ == "__main__":
+    main()
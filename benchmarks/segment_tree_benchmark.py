@@ -0,0 +1,123 @@
+import sys
+import os
+import time
+import tracemalloc
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bson
+import numpy as np
+from bson.objectid import ObjectId
+
+from app.segment_tree import FrameSegmentTree, CompactFrameSegmentTree
+
+
+def make_frame_annotations(num_frames: int, boxes_per_frame: int, num_classes: int = 10, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    frame_annotations = {}
+    for frame_number in range(num_frames):
+        classes = rng.integers(0, num_classes, size=boxes_per_frame)
+        frame_annotations[frame_number] = [
+            {"_id": ObjectId(), "class_id": int(class_id)}
+            for class_id in classes
+        ]
+    return frame_annotations
+
+
+def measure_build(tree_cls, frame_annotations, num_frames):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    tree = tree_cls(num_frames)
+    tree.build(frame_annotations)
+    elapsed = time.perf_counter() - start_time
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tree, elapsed, current
+
+
+def measure_query(tree, num_frames, repeats: int = 200, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    ranges = [sorted(rng.integers(0, num_frames, size=2)) for _ in range(repeats)]
+    start_time = time.perf_counter()
+    for l, r in ranges:
+        tree.query(int(l), int(r))
+    return (time.perf_counter() - start_time) / repeats
+
+
+def measure_per_video(frame_annotations, num_frames, num_classes: int = 10):
+    # What DatabaseManager stores per video: a general tree plus one per class
+    # for the set-based layout, a single class-partitioned tree for the compact one.
+    start_time = time.perf_counter()
+    trees = [FrameSegmentTree(num_frames)] + [FrameSegmentTree(num_frames, c) for c in range(num_classes)]
+    for tree in trees:
+        tree.build(frame_annotations)
+    sets_time = time.perf_counter() - start_time
+    sets_size = sum(len(bson.encode(tree.to_dict())) for tree in trees)
+    del trees
+
+    start_time = time.perf_counter()
+    tree = CompactFrameSegmentTree(num_frames)
+    tree.build(frame_annotations)
+    compact_time = time.perf_counter() - start_time
+    compact_size = len(bson.encode(tree.to_dict()))
+
+    print(f"  per video, 11 set trees       build {sets_time * 1000:9.1f} ms  stored {sets_size / 2**20:8.1f} MiB")
+    print(f"  per video, 1 multi-class tree build {compact_time * 1000:8.1f} ms  stored {compact_size / 2**20:8.1f} MiB")
+
+
+def measure_serialization(frame_annotations, num_frames, repeats: int = 5):
+    tree = CompactFrameSegmentTree(num_frames)
+    tree.build(frame_annotations)
+
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        dict_doc = bson.encode({"tree_structure": tree.to_dict()})
+    dict_store = (time.perf_counter() - start_time) / repeats
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        CompactFrameSegmentTree.from_dict(bson.decode(dict_doc)["tree_structure"])
+    dict_load = (time.perf_counter() - start_time) / repeats
+
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        binary_doc = bson.encode({"tree_binary": bson.Binary(tree.to_bytes())})
+    binary_store = (time.perf_counter() - start_time) / repeats
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        CompactFrameSegmentTree.from_bytes(bson.decode(binary_doc)["tree_binary"])
+    binary_load = (time.perf_counter() - start_time) / repeats
+
+    print(f"  dict format    size {len(dict_doc) / 2**20:8.2f} MiB  encode {dict_store * 1000:8.1f} ms  load {dict_load * 1000:8.1f} ms")
+    print(f"  binary format  size {len(binary_doc) / 2**20:8.2f} MiB  encode {binary_store * 1000:8.1f} ms  load {binary_load * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare set-based and compact frame segment trees")
+    parser.add_argument("--frames", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--boxes-per-frame", type=int, default=50)
+    parser.add_argument("--per-video", action="store_true", help="also compare everything stored for one video")
+    parser.add_argument("--serialization", action="store_true", help="also compare dict and packed binary formats")
+    args = parser.parse_args()
+
+    for num_frames in args.frames:
+        frame_annotations = make_frame_annotations(num_frames, args.boxes_per_frame)
+        print(f"{num_frames} frames, {num_frames * args.boxes_per_frame} annotations")
+
+        for tree_cls in (FrameSegmentTree, CompactFrameSegmentTree):
+            tree, build_time, memory = measure_build(tree_cls, frame_annotations, num_frames)
+            query_time = measure_query(tree, num_frames)
+            print(
+                f"  {tree_cls.__name__:<24} build {build_time * 1000:9.1f} ms  "
+                f"memory {memory / 2**20:8.1f} MiB  query {query_time * 1000:8.3f} ms"
+            )
+            del tree
+
+        if args.per_video:
+            measure_per_video(frame_annotations, num_frames)
+        if args.serialization:
+            measure_serialization(frame_annotations, num_frames)
+
+
+if __name__ == "__main__":
+    main()
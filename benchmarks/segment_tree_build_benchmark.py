@@ -0,0 +1,119 @@
+import sys
+import os
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.segment_tree import FrameSegmentTree, FrameCountTree
+from benchmarks.segment_tree_benchmark import make_frame_annotations
+
+
+class RecursiveFrameSegmentTree(FrameSegmentTree):
+    # The previous recursive build and query, kept here as the baseline.
+
+    def _build_segment_tree(self, annotations, node, start, end):
+        if start == end:
+            if start in annotations:
+                for obj in annotations[start]:
+                    if self.object_class is None or obj['class_id'] == self.object_class:
+                        self.st[node].add(obj['_id'])
+            return
+        mid = (start + end) // 2
+        self._build_segment_tree(annotations, 2*node+1, start, mid)
+        self._build_segment_tree(annotations, 2*node+2, mid+1, end)
+        self.st[node] = self.st[2*node+1].union(self.st[2*node+2])
+
+    def build(self, annotations):
+        self._build_segment_tree(annotations, 0, 0, self.n-1)
+
+    def _query(self, node, start, end, l, r):
+        if start > r or end < l:
+            return set()
+        if l <= start and end <= r:
+            return self.st[node]
+        mid = (start + end) // 2
+        return self._query(2*node+1, start, mid, l, r).union(self._query(2*node+2, mid+1, end, l, r))
+
+    def query(self, l, r):
+        return self._query(0, 0, self.n-1, l, r)
+
+
+class RecursiveFrameCountTree(FrameCountTree):
+
+    def _build_count_tree(self, node, start, end):
+        if start == end:
+            self.counts[node] = self.frame_counts[start]
+            self.max_density[node] = self.frame_counts[start]
+            self.min_density[node] = self.frame_counts[start]
+            return
+        mid = (start + end) // 2
+        left, right = 2*node+1, 2*node+2
+        self._build_count_tree(left, start, mid)
+        self._build_count_tree(right, mid+1, end)
+        self.counts[node] = self.counts[left] + self.counts[right]
+        self.max_density[node] = np.maximum(self.max_density[left], self.max_density[right])
+        self.min_density[node] = np.minimum(self.min_density[left], self.min_density[right])
+
+    def build_from_counts(self, frame_counts):
+        self.frame_counts = np.asarray(frame_counts, dtype=np.int32)
+        self._build_count_tree(0, 0, self.n-1)
+
+    def _query(self, node, start, end, l, r):
+        if start > r or end < l:
+            return None
+        if l <= start and end <= r:
+            return self.counts[node], self.max_density[node], self.min_density[node]
+        mid = (start + end) // 2
+        left = self._query(2*node+1, start, mid, l, r)
+        right = self._query(2*node+2, mid+1, end, l, r)
+        if left is None:
+            return right
+        if right is None:
+            return left
+        return left[0] + right[0], np.maximum(left[1], right[1]), np.minimum(left[2], right[2])
+
+    def query(self, l, r):
+        return self._query(0, 0, self.n-1, l, r)
+
+
+def time_tree(make_tree, frame_annotations, num_frames, repeats: int = 200, seed: int = 1):
+    start_time = time.perf_counter()
+    tree = make_tree(num_frames)
+    tree.build(frame_annotations)
+    build_time = time.perf_counter() - start_time
+
+    rng = np.random.default_rng(seed)
+    ranges = [sorted(rng.integers(0, num_frames, size=2)) for _ in range(repeats)]
+    start_time = time.perf_counter()
+    for l, r in ranges:
+        tree.query(int(l), int(r))
+    query_time = (time.perf_counter() - start_time) / repeats
+    return build_time, query_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recursive and iterative segment tree builds")
+    parser.add_argument("--frames", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--boxes-per-frame", type=int, default=2)
+    args = parser.parse_args()
+
+    candidates = [
+        ("FrameSegmentTree recursive", RecursiveFrameSegmentTree),
+        ("FrameSegmentTree iterative", FrameSegmentTree),
+        ("FrameCountTree recursive", lambda n: RecursiveFrameCountTree(n, 10)),
+        ("FrameCountTree vectorized", lambda n: FrameCountTree(n, 10)),
+    ]
+
+    for num_frames in args.frames:
+        frame_annotations = make_frame_annotations(num_frames, args.boxes_per_frame)
+        print(f"{num_frames} frames, {num_frames * args.boxes_per_frame} annotations")
+        for name, make_tree in candidates:
+            build_time, query_time = time_tree(make_tree, frame_annotations, num_frames)
+            print(f"  {name:<28} build {build_time * 1000:9.1f} ms  query {query_time * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import sys
+import os
+import copy
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import statistics
+import contextlib
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database_manager import DatabaseManager, SEGMENT_TREE_CACHE
+from utils.config import load_config
+
+
+def make_scaled_dataset(source: Path, repeat: int) -> Path:
+    # One video holding the first sample sequence `repeat` times over, with
+    # frame numbers shifted per copy; images are symlinked.
+    target = Path(tempfile.mkdtemp(prefix="storage_benchmark_"))
+    (target / "images").mkdir()
+    (target / "annotations").mkdir()
+    images = sorted((source / "images").glob("*.jpg"))
+    prefix = images[0].stem.split("_")[0]
+    images = [image for image in images if image.stem.split("_")[0] == prefix]
+    for copy_index in range(repeat):
+        for index, image in enumerate(images):
+            stem = f"{prefix}_00000_d_{copy_index * len(images) + index:07d}"
+            os.symlink(image.resolve(), target / "images" / f"{stem}.jpg")
+            annotation = source / "annotations" / f"{image.stem}.txt"
+            if annotation.exists():
+                shutil.copyfile(annotation, target / "annotations" / f"{stem}.txt")
+    return target
+
+
+def timed(operation, ranges, cold: bool) -> float:
+    samples = []
+    for start, end in ranges:
+        if cold:
+            SEGMENT_TREE_CACHE.clear()
+        start_time = time.perf_counter()
+        operation(start, end)
+        samples.append(time.perf_counter() - start_time)
+    return statistics.median(samples) * 1000
+
+
+def run(config, dataset, repeats):
+    # Returns the manager, the import time and (operation, cold ms, warm ms)
+    # rows; cold runs clear the tree cache first.
+    db_manager = DatabaseManager(config)
+    db_manager.create_indices()
+    SEGMENT_TREE_CACHE.clear()
+
+    start_time = time.perf_counter()
+    video_id = db_manager.import_visdrone_dataset(str(dataset), incremental=False)[0]
+    import_time = time.perf_counter() - start_time
+
+    directory = db_manager.get_frame_directory(video_id)
+    n = int(directory.frame_numbers[-1]) + 1
+    frame_id = directory.frame_at(len(directory) // 2)["_id"]
+    random.seed(0)
+    ranges = [sorted(random.sample(range(n), 2)) for _ in range(repeats)]
+
+    operations = [
+        ("query_frame_range (<=100 frames)", lambda start, end: db_manager.query_frame_range(
+            video_id, start, min(end, start + 100), 3
+        )),
+        ("aggregate_frame_range", lambda start, end: db_manager.aggregate_frame_range(video_id, start, end, 3)),
+        ("query_region", lambda start, end: db_manager.query_region(
+            video_id, start, min(end, start + 100), (100, 100, 400, 300)
+        )),
+        ("get_frame", lambda start, end: db_manager.get_frame(video_id, start)),
+        ("get_frame_annotations", lambda start, end: db_manager.get_frame_annotations(frame_id)),
+    ]
+    rows = []
+    for name, operation in operations:
+        rows.append((name, timed(operation, ranges, True), timed(operation, ranges, False)))
+    return db_manager, import_time, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query latency of the MongoDB and SQLite storage backends")
+    parser.add_argument("--dataset", default="videods-test")
+    parser.add_argument("--repeat", type=int, default=20, help="copies of the sample sequence in the video")
+    parser.add_argument("--queries", type=int, default=50, help="repetitions per operation")
+    parser.add_argument("--uri", help="also measure this MongoDB server (scratch database)")
+    parser.add_argument("--database", default="video_db_storage_benchmark")
+    args = parser.parse_args()
+
+    base_config = load_config()
+    backends = [("sqlite", {"backend": "sqlite"}, {})]
+    if args.uri:
+        backends.append(("mongodb", {"backend": "mongodb"}, {"uri": args.uri, "db_name": args.database}))
+
+    dataset = make_scaled_dataset(Path(args.dataset), args.repeat)
+    workdir = Path(tempfile.mkdtemp(prefix="storage_benchmark_db_"))
+    try:
+        print(f"{len(list((dataset / 'images').glob('*.jpg')))} frames, median of {args.queries} queries")
+        for label, storage, mongodb in backends:
+            config = copy.deepcopy(base_config)
+            config["storage"] = {**storage, "sqlite_path": str(workdir / "benchmark.sqlite")}
+            config["mongodb"] = {**config.get("mongodb", {}), **mongodb}
+            # Every query logs; keep that out of the timings' output.
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                db_manager, import_time, rows = run(config, dataset, args.queries)
+            print(f"  {label}: import {import_time:.2f} s")
+            for name, cold, warm in rows:
+                print(f"    {name:<34} cold {cold:8.2f} ms   warm {warm:8.2f} ms")
+            if label == "mongodb":
+                db_manager.backend.client.drop_database(args.database)
+    finally:
+        shutil.rmtree(dataset)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import sys
+import os
+import time
+import shutil
+import tempfile
+import argparse
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.converters import parse_visdrone_annotations, parse_visdrone_files
+
+NUM_CLASSES = 10
+
+
+def parse_line_by_line(annotation_file: Path):
+    # The parser import_visdrone_dataset used before, without the inserts.
+    boxes = []
+    with open(annotation_file, "r") as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) >= 6:
+                x, y, w, h = map(int, parts[:4])
+                score = int(parts[4])
+                class_id = int(parts[5]) - 1
+                if score == 0:
+                    continue
+                if 0 <= class_id < NUM_CLASSES:
+                    boxes.append({"bbox": [x, y, w, h], "class_id": class_id})
+    return boxes
+
+
+def make_scaled_dataset(source: Path, scale: int) -> Path:
+    target = Path(tempfile.mkdtemp(prefix="visdrone_parse_"))
+    for copy in range(scale):
+        for annotation_file in source.glob("*.txt"):
+            shutil.copyfile(annotation_file, target / f"{copy:04d}_{annotation_file.name}")
+    return target
+
+
+def timed(label, parse, num_files):
+    start_time = time.perf_counter()
+    num_boxes = parse()
+    elapsed = time.perf_counter() - start_time
+    print(f"  {label:<28} {elapsed * 1000:9.1f} ms  {num_files / elapsed:10.0f} files/s  {num_boxes / elapsed:12.0f} boxes/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare VisDrone annotation parsers")
+    parser.add_argument("--annotations", default="videods-test/annotations")
+    parser.add_argument("--scale", type=int, default=50, help="copies of the sample annotation files")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--chunk-size", type=int, default=256)
+    args = parser.parse_args()
+
+    dataset = make_scaled_dataset(Path(args.annotations), args.scale)
+    try:
+        files = sorted(dataset.glob("*.txt"))
+        print(f"{len(files)} annotation files")
+
+        timed("line by line", lambda: sum(len(parse_line_by_line(f)) for f in files), len(files))
+        timed("numpy, per file", lambda: sum(len(parse_visdrone_annotations(f, NUM_CLASSES)) for f in files), len(files))
+        timed(
+            "numpy, batched",
+            lambda: sum(len(r) for r in parse_visdrone_files(files, NUM_CLASSES, 1, args.chunk_size)),
+            len(files)
+        )
+        for workers in args.workers:
+            timed(
+                f"numpy, {workers} processes",
+                lambda: sum(len(r) for r in parse_visdrone_files(files, NUM_CLASSES, workers, args.chunk_size)),
+                len(files)
+            )
+    finally:
+        shutil.rmtree(dataset)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import sys
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from app.batch_inference import BatchInference
+from app.process_inference import ProcessInference
+
+
+def load_frames(video_path, num_frames, size):
+    if video_path:
+        frames = []
+        cap = cv2.VideoCapture(video_path)
+        while len(frames) < num_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+        return frames
+    width, height = size
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(num_frames)]
+
+
+def run_threads(model, frames, workers):
+    # The previous VideoProcessor path: one model call per frame from a
+    # thread pool sharing the model.
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda frame: model(frame, verbose=False), frames))
+    return len(frames) / (time.perf_counter() - start_time)
+
+
+def run_batched(model, frames, batch_size, timeout_ms):
+    start_time = time.perf_counter()
+    with BatchInference(lambda batch: model(batch, verbose=False), batch_size, timeout_ms) as inference:
+        futures = [inference.submit(frame) for frame in frames]
+        for future in futures:
+            future.result()
+    return len(frames) / (time.perf_counter() - start_time)
+
+
+def run_processes(model_path, frames, workers, torch_threads, batch_size):
+    # Model loading in the workers is not timed: the first frame of each
+    # worker is sent through before the clock starts.
+    with ProcessInference(model_path, frames[0].shape, workers, torch_threads, batch_size) as inference:
+        for future in [inference.submit(frames[0]) for _ in range(workers)]:
+            future.result()
+        start_time = time.perf_counter()
+        futures = [inference.submit(frame) for frame in frames]
+        for future in futures:
+            future.result()
+        return len(frames) / (time.perf_counter() - start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YOLO frames per second against inference batch size")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--video", help="read frames from this video instead of random images")
+    parser.add_argument("--frames", type=int, default=128)
+    parser.add_argument("--size", default="1280x720", help="random frame size, WIDTHxHEIGHT")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--timeout-ms", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=4, help="threads for the per-frame baseline")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--processes", type=int, nargs="*", default=[], help="worker process counts to measure")
+    parser.add_argument("--torch-threads", type=int, default=1, help="torch threads per worker process")
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+
+    model = YOLO(args.model)
+    model.to(args.device)
+    frames = load_frames(args.video, args.frames, tuple(int(v) for v in args.size.split("x")))
+    model(frames[:2], verbose=False)  # warm-up
+
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}, {args.model} on {args.device}")
+    print(f"  per frame, {args.workers} threads        {run_threads(model, frames, args.workers):8.2f} fps")
+    for batch_size in args.batch_sizes:
+        fps = run_batched(model, frames, batch_size, args.timeout_ms)
+        print(f"  batched, batch size {batch_size:<3d}          {fps:8.2f} fps")
+    for workers in args.processes:
+        fps = run_processes(args.model, frames, workers, args.torch_threads, args.batch_sizes[-1])
+        print(f"  {workers:<2d} processes x {args.torch_threads} threads     {fps:8.2f} fps")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ setup(
     author_email="your.email@example.com",
     packages=find_packages(),
     install_requires=[
-        "pymongo>=4.0.0",
+        "pymongo>=4.10",
         "opencv-python>=4.5.0",
         "numpy>=1.20.0",
         "pillow>=8.0.0",
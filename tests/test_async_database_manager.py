@@ -0,0 +1,282 @@
+import asyncio
+import json
+import os
+import uuid
+from pathlib import Path
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from app.async_database_manager import AsyncDatabaseManager
+from app.database_manager import DatabaseManager, SEGMENT_TREE_CACHE, VIDEO_ANNOTATION_LAYOUTS
+from app.frame_bitmap import Has
+from app.frame_sampler import FrameSamplingRecord
+from app.mongo_client import close_clients
+
+# Runs against a real server; every test here is skipped when none answers.
+MONGODB_URI = os.environ.get('VIDEODB_TEST_MONGODB_URI', 'mongodb://localhost:27017')
+REPO_ROOT = Path(__file__).resolve().parents[1]
+DATASET_PATH = REPO_ROOT / 'videods-test'
+
+STORAGE_VARIANTS = {
+    'paged-documents': {
+        'segment_tree': {'representation': 'compact', 'storage': 'paged', 'page_frames': 8, 'page_ids': 64},
+        'annotation_storage': {'layout': 'documents'}
+    },
+    'gridfs-buckets': {
+        'segment_tree': {'representation': 'compact', 'storage': 'binary', 'inline_limit_bytes': 0},
+        'annotation_storage': {'layout': 'buckets', 'bucket_frames': 8}
+    },
+    'sets-documents': {
+        'segment_tree': {'representation': 'sets'},
+        'annotation_storage': {'layout': 'documents'}
+    }
+}
+
+
+def _mongodb_available() -> bool:
+    client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+
+@pytest.fixture(scope='module')
+def mongodb_uri():
+    if not _mongodb_available():
+        pytest.skip(f"No MongoDB server at {MONGODB_URI}")
+    return MONGODB_URI
+
+
+@pytest.fixture(scope='module', params=list(STORAGE_VARIANTS))
+def imported(request, mongodb_uri):
+    with open(REPO_ROOT / 'config.json') as f:
+        config = json.load(f)
+    config.update(STORAGE_VARIANTS[request.param])
+    config['storage'] = {'backend': 'mongodb'}
+    config['mongodb'] = {'uri': mongodb_uri, 'db_name': f"videodb_test_{uuid.uuid4().hex[:12]}", 'async_concurrency': 2}
+
+    db_manager = DatabaseManager(config)
+    db_manager.create_indices()
+    video_ids = db_manager.import_visdrone_dataset(str(DATASET_PATH))
+
+    # Every other frame of the first video marked as skipped by the sampler.
+    first_video = db_manager.get_video_info(video_ids[0])
+    sampling = FrameSamplingRecord()
+    for frame_number in range(first_video['total_frames'] + 64):
+        sampling.add(frame_number % 2 == 0, float('nan'))
+    db_manager.store_frame_sampling(video_ids[0], sampling)
+
+    yield config, db_manager, video_ids
+
+    MongoClient(mongodb_uri).drop_database(config['mongodb']['db_name'])
+    close_clients()
+
+
+def run_async(config, check):
+    # Starts every check cold, so the async loaders are the ones exercised.
+    SEGMENT_TREE_CACHE.clear()
+    VIDEO_ANNOTATION_LAYOUTS.clear()
+
+    async def main():
+        async with AsyncDatabaseManager(config) as manager:
+            return await check(manager)
+
+    return asyncio.run(main())
+
+
+def normalized(frames):
+    return {
+        frame_number: sorted(annotations, key=lambda annotation: str(annotation['_id']))
+        for frame_number, annotations in frames.items()
+    }
+
+
+def frame_range(db_manager, video_id):
+    numbers = [frame['frame_number'] for frame in db_manager.frames.find({'video_id': video_id}, {'frame_number': 1})]
+    return min(numbers), max(numbers)
+
+
+def test_video_reads_match_sync(imported):
+    config, db_manager, video_ids = imported
+    db_manager.videos.update_one({'_id': video_ids[1]}, {'$set': {'source_type': 'video'}})
+    video = db_manager.get_video_info(video_ids[0])
+
+    async def check(manager):
+        return (
+            await manager.get_all_videos(),
+            await manager.get_video_info(video_ids[0]),
+            await manager.get_video_by_name(video['name']),
+            await manager.get_videos_by_source_type('video')
+        )
+
+    all_videos, info, by_name, by_source = run_async(config, check)
+    assert sorted(v['_id'] for v in all_videos) == sorted(video_ids)
+    assert info == video
+    assert by_name['_id'] == video_ids[0]
+    assert [v['_id'] for v in by_source] == [video_ids[1]]
+
+
+def test_frame_reads_match_sync(imported):
+    config, db_manager, video_ids = imported
+    SEGMENT_TREE_CACHE.clear()
+    expected = {}
+    for video_id in video_ids:
+        first, last = frame_range(db_manager, video_id)
+        for frame_number in (first, (first + last) // 2, last, last + 10):
+            frame = db_manager.get_frame(video_id, frame_number)
+            expected[video_id, frame_number] = (
+                frame,
+                normalized({0: db_manager.get_frame_annotations(frame['_id'])}),
+                normalized({0: db_manager.get_frame_annotations(frame['_id'], video_id)})
+            )
+
+    async def check(manager):
+        actual = {}
+        for video_id, frame_number in expected:
+            frame = await manager.get_frame(video_id, frame_number)
+            actual[video_id, frame_number] = (
+                frame,
+                normalized({0: await manager.get_frame_annotations(frame['_id'])}),
+                normalized({0: await manager.get_frame_annotations(frame['_id'], video_id)})
+            )
+        return actual
+
+    assert run_async(config, check) == expected
+    assert any(annotations[0] for _, annotations, _ in expected.values())
+
+
+def test_queries_match_sync(imported):
+    config, db_manager, video_ids = imported
+    region = (200, 150, 600, 400)
+    SEGMENT_TREE_CACHE.clear()
+    expected = {}
+    for video_id in video_ids:
+        first, last = frame_range(db_manager, video_id)
+        middle = (first + last) // 2
+        expected[video_id] = (
+            normalized(db_manager.query_frame_range(video_id, first, last)),
+            normalized(db_manager.query_frame_range(video_id, middle, last, object_class=3)),
+            normalized(db_manager.query_frame_range(video_id, first, middle, class_mask=0b11)),
+            normalized(db_manager.query_region(video_id, first, last, region)),
+            normalized(db_manager.query_region(video_id, first, last, region, [0, 3], contained=True)),
+            db_manager.aggregate_frame_range(video_id, first, last),
+            db_manager.aggregate_frame_range(video_id, middle, last, 3),
+            db_manager.count_frame_range(video_id, first, last, 0),
+            db_manager.query_frames_matching(video_id, Has(3, at_least=5)),
+            db_manager.query_frames_matching(video_id, ~Has(0), first, middle)
+        )
+
+    async def check(manager):
+        actual = {}
+        for video_id in video_ids:
+            first, last = frame_range(db_manager, video_id)
+            middle = (first + last) // 2
+            actual[video_id] = (
+                normalized(await manager.query_frame_range(video_id, first, last)),
+                normalized(await manager.query_frame_range(video_id, middle, last, object_class=3)),
+                normalized(await manager.query_frame_range(video_id, first, middle, class_mask=0b11)),
+                normalized(await manager.query_region(video_id, first, last, region)),
+                normalized(await manager.query_region(video_id, first, last, region, [0, 3], contained=True)),
+                await manager.aggregate_frame_range(video_id, first, last),
+                await manager.aggregate_frame_range(video_id, middle, last, 3),
+                await manager.count_frame_range(video_id, first, last, 0),
+                await manager.query_frames_matching(video_id, Has(3, at_least=5)),
+                await manager.query_frames_matching(video_id, ~Has(0), first, middle)
+            )
+        return actual
+
+    actual = run_async(config, check)
+    assert actual == expected
+    assert all(result[0] and result[5]['count'] for result in expected.values())
+
+
+def test_frame_sampling_masks_async_matches(imported):
+    config, db_manager, video_ids = imported
+
+    first, last = frame_range(db_manager, video_ids[0])
+    frame_counts = db_manager._load_count_tree(video_ids[0]).frame_counts
+    inferred_totals = frame_counts[first - first % 2:last + 1:2, -1]
+
+    async def check(manager):
+        sampling = await manager.get_frame_sampling(video_ids[0])
+        return (
+            sampling,
+            await manager.query_frames_matching(video_ids[0], Has()),
+            await manager.aggregate_frame_range(video_ids[0], first, last),
+            await manager.aggregate_frame_range(video_ids[0], first | 1, first | 1)
+        )
+
+    sampling, ranges, summary, skipped_only = run_async(config, check)
+    assert sampling.inferred_frames()[:3].tolist() == [0, 2, 4]
+    assert ranges and all(start == end and start % 2 == 0 for start, end in ranges)
+    # Skipped frames have zero rows in the count tree but never set the minimum.
+    assert summary['min_per_frame'] == inferred_totals.min() > 0
+    assert summary == db_manager.aggregate_frame_range(video_ids[0], first, last)
+    assert skipped_only['min_per_frame'] == 0
+
+
+def test_fan_out_matches_per_video_queries(imported):
+    config, db_manager, video_ids = imported
+    region = (100, 100, 500, 500)
+    end_frame = min(frame_range(db_manager, video_id)[1] for video_id in video_ids)
+    ranges = [(0, 10), (5, end_frame), (20, 20), (end_frame, 10)]
+    SEGMENT_TREE_CACHE.clear()
+    expected_frames = {}
+    expected_regions = {}
+    expected_counts = {}
+    for video_id in video_ids:
+        frames = db_manager.query_frame_range(video_id, 0, end_frame, 3)
+        if frames:
+            expected_frames[video_id] = normalized(frames)
+        regions = db_manager.query_region(video_id, 0, end_frame, region)
+        if regions:
+            expected_regions[video_id] = normalized(regions)
+        expected_counts[video_id] = db_manager.aggregate_frame_range(video_id, 0, end_frame)
+    expected_ranges = [db_manager.aggregate_frame_range(video_ids[1], start, end, 0) for start, end in ranges]
+
+    async def check(manager):
+        return (
+            await manager.query_frame_range_all_videos(0, end_frame, 3),
+            await manager.query_region_all_videos(0, end_frame, region),
+            await manager.aggregate_frame_range_all_videos(0, end_frame),
+            await manager.aggregate_frame_range_all_videos(0, end_frame, video_ids=video_ids[1:]),
+            await manager.aggregate_ranges(video_ids[1], ranges, 0)
+        )
+
+    frames, regions, counts, subset_counts, range_counts = run_async(config, check)
+    assert {video_id: normalized(result) for video_id, result in frames.items()} == expected_frames
+    assert {video_id: normalized(result) for video_id, result in regions.items()} == expected_regions
+    assert counts == expected_counts
+    assert subset_counts == {video_id: expected_counts[video_id] for video_id in video_ids[1:]}
+    assert range_counts == expected_ranges
+
+
+def test_gather_limited_bounds_concurrency_and_keeps_order():
+    async def run(manager, concurrency=None):
+        in_flight = [0]
+        peak = [0]
+
+        async def work(value):
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            await asyncio.sleep(0.01 * (value % 3))
+            in_flight[0] -= 1
+            return value * 2
+
+        results = await manager.gather_limited((work(value) for value in range(10)), concurrency)
+        return results, peak[0]
+
+    async def main():
+        async with AsyncDatabaseManager({'mongodb': {'async_concurrency': 3}}) as manager:
+            return await run(manager), await run(manager, 1)
+
+    (default, default_peak), (explicit, explicit_peak) = asyncio.run(main())
+    assert default == explicit == [value * 2 for value in range(10)]
+    assert default_peak == 3
+    assert explicit_peak == 1
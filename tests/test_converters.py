@@ -0,0 +1,31 @@
+import numpy as np
+
+from utils.converters import _parse_rows, _parse_rows_slow, parse_visdrone_batch
+
+
+def test_parse_rows_mixed_widths_keep_their_own_columns():
+    text = b'1,2,3,4,5,6,7,8\n1,2,3,4,5,6,7\n1,2,3,4,5,6,7,8,9\n'
+    expected = [[1, 2, 3, 4, 5, 6]] * 3
+    assert _parse_rows(text).tolist() == expected
+    assert _parse_rows_slow(text).tolist() == expected
+
+
+def test_parse_rows_regular_and_short_lines():
+    assert _parse_rows(b'10,20,30,40,1,4,0,0\r\n11,21,31,41,0,2,0,0\r\n').tolist() == [
+        [10, 20, 30, 40, 1, 4], [11, 21, 31, 41, 0, 2]
+    ]
+    assert _parse_rows(b'1,2,3,4,5,6,7,8\n1,2,3\n\n2,3,4,5,6,7,8,9').tolist() == [
+        [1, 2, 3, 4, 5, 6], [2, 3, 4, 5, 6, 7]
+    ]
+    assert _parse_rows(b'').shape == (0, 6)
+
+
+def test_parse_visdrone_batch_mixed_widths_across_files(tmp_path):
+    first = tmp_path / 'a.txt'
+    second = tmp_path / 'b.txt'
+    first.write_bytes(b'1,2,3,4,1,4,0,0\n1,2,3,4,1,5,0\n')
+    second.write_bytes(b'5,6,7,8,1,6,0,0,9\n')
+    records = parse_visdrone_batch([first, second, tmp_path / 'missing.txt'], 10)
+    assert [len(r) for r in records] == [2, 1, 0]
+    assert records[0]['class_id'].tolist() == [3, 4]
+    assert records[1][['x', 'y', 'w', 'h']].tolist() == [(5, 6, 7, 8)]
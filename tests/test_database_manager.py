@@ -0,0 +1,275 @@
+import json
+import random
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from app.database_manager import DatabaseManager
+from app.frame_bitmap import Has
+from app.frame_sampler import FrameSamplingRecord
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+NUM_FRAMES = {'0000001': 40, '0000002': 25}
+
+STORAGE_VARIANTS = {
+    'paged-documents': {
+        'segment_tree': {'representation': 'compact', 'storage': 'paged', 'page_frames': 8, 'page_ids': 16},
+        'annotation_storage': {'layout': 'documents'}
+    },
+    'files-buckets': {
+        'segment_tree': {'representation': 'compact', 'storage': 'binary', 'inline_limit_bytes': 0},
+        'annotation_storage': {'layout': 'buckets', 'bucket_frames': 8}
+    },
+    'sets-buckets': {
+        'segment_tree': {'representation': 'sets'},
+        'annotation_storage': {'layout': 'buckets', 'bucket_frames': 16}
+    }
+}
+
+
+def write_dataset(path: Path, seed: int):
+    # A small VisDrone-style dataset: frames 1..N per video, some without
+    # annotation files or with ignored boxes (score 0, categories 0 and 11).
+    rng = random.Random(seed)
+    (path / 'images').mkdir(parents=True)
+    (path / 'annotations').mkdir()
+    expected = {}
+    image = np.zeros((48, 64, 3), dtype=np.uint8)
+    for video, num_frames in NUM_FRAMES.items():
+        frames = expected[video] = {}
+        for frame_number in range(1, num_frames + 1):
+            stem = f"{video}_00000_d_{frame_number:07d}"
+            cv2.imwrite(str(path / 'images' / f"{stem}.jpg"), image)
+            if rng.random() < 0.15:
+                continue
+            lines = []
+            frames[frame_number] = []
+            for _ in range(rng.randint(0, 6)):
+                box = [rng.randrange(0, 500), rng.randrange(0, 400), rng.randint(1, 120), rng.randint(1, 120)]
+                score = 0 if rng.random() < 0.1 else 1
+                category = rng.randint(0, 11)
+                lines.append(",".join(map(str, box + [score, category, 0, 0])))
+                if score and 1 <= category <= 10:
+                    frames[frame_number].append((category - 1, tuple(box)))
+            (path / 'annotations' / f"{stem}.txt").write_text("\n".join(lines) + "\n")
+    return expected
+
+
+@pytest.fixture(scope='module', params=list(STORAGE_VARIANTS))
+def imported(request, tmp_path_factory):
+    root = tmp_path_factory.mktemp(request.param)
+    expected = write_dataset(root / 'dataset', seed=len(request.param))
+    with open(REPO_ROOT / 'config.json') as f:
+        config = json.load(f)
+    config.update(STORAGE_VARIANTS[request.param])
+    config['storage'] = {'backend': 'sqlite', 'sqlite_path': str(root / 'store.sqlite')}
+
+    db_manager = DatabaseManager(config)
+    db_manager.create_indices()
+    video_ids = db_manager.import_visdrone_dataset(str(root / 'dataset'))
+    videos = {db_manager.get_video_info(video_id)['video_id']: video_id for video_id in video_ids}
+    yield db_manager, {videos[video]: frames for video, frames in expected.items()}
+    db_manager.backend.close()
+
+
+def annotation_keys(frames):
+    return {
+        frame_number: sorted((annotation['class_id'], tuple(annotation['bbox'])) for annotation in annotations)
+        for frame_number, annotations in frames.items()
+    }
+
+
+def expected_frames(frames, l, r, classes=None, keep=lambda box: True):
+    result = {}
+    for frame_number, objects in frames.items():
+        if l <= frame_number <= r:
+            selected = sorted(
+                (class_id, box) for class_id, box in objects
+                if (classes is None or class_id in classes) and keep(box)
+            )
+            if selected:
+                result[frame_number] = selected
+    return result
+
+
+def frame_counts(frames, num_classes):
+    counts = np.zeros((max(frames) + 1, num_classes + 1), dtype=np.int64)
+    for frame_number, objects in frames.items():
+        for class_id, _ in objects:
+            counts[frame_number, class_id] += 1
+        counts[frame_number, num_classes] = len(objects)
+    return counts
+
+
+def frame_runs(frame_numbers):
+    runs = []
+    for frame in frame_numbers:
+        if runs and runs[-1][1] == frame - 1:
+            runs[-1] = (runs[-1][0], frame)
+        else:
+            runs.append((frame, frame))
+    return runs
+
+
+def random_ranges(n, rng, count=15):
+    ranges = [(0, n - 1), (1, 1), (n - 1, n - 1)]
+    for _ in range(count):
+        l = rng.randrange(n)
+        ranges.append((l, rng.randrange(l, n)))
+    return ranges
+
+
+def test_import_stores_every_kept_annotation(imported):
+    db_manager, expected = imported
+    for video_id, frames in expected.items():
+        assert sum(len(objects) for objects in frames.values()) > 20
+        video = db_manager.get_video_info(video_id)
+        assert video['total_frames'] == NUM_FRAMES[video['video_id']]
+        assert len(db_manager.get_frame_directory(video_id)) == video['total_frames']
+        frame = db_manager.get_frame(video_id, 3)
+        assert annotation_keys({0: db_manager.get_frame_annotations(frame['_id'], video_id)}) == \
+            {0: sorted(frames.get(3, []))}
+
+
+def test_query_frame_range(imported):
+    db_manager, expected = imported
+    rng = random.Random(1)
+    for video_id, frames in expected.items():
+        n = max(frames) + 1
+        for l, r in random_ranges(n, rng):
+            classes = rng.sample(range(10), rng.randint(1, 4))
+            assert annotation_keys(db_manager.query_frame_range(video_id, l, r)) == expected_frames(frames, l, r)
+            assert annotation_keys(db_manager.query_frame_range(video_id, l, r, classes)) == \
+                expected_frames(frames, l, r, classes)
+            class_mask = sum(1 << class_id for class_id in classes)
+            assert annotation_keys(db_manager.query_frame_range(video_id, l, r, class_mask=class_mask)) == \
+                expected_frames(frames, l, r, classes)
+
+
+def test_query_region(imported):
+    db_manager, expected = imported
+    rng = random.Random(2)
+    for video_id, frames in expected.items():
+        n = max(frames) + 1
+        for l, r in random_ranges(n, rng):
+            x, y, w, h = rng.randrange(0, 400), rng.randrange(0, 300), rng.randint(1, 300), rng.randint(1, 300)
+
+            def intersects(box):
+                return box[0] < x + w and box[0] + box[2] > x and box[1] < y + h and box[1] + box[3] > y
+
+            def contained(box):
+                return box[0] >= x and box[1] >= y and box[0] + box[2] <= x + w and box[1] + box[3] <= y + h
+
+            classes = rng.sample(range(10), 3)
+            assert annotation_keys(db_manager.query_region(video_id, l, r, (x, y, w, h))) == \
+                expected_frames(frames, l, r, keep=intersects)
+            assert annotation_keys(db_manager.query_region(video_id, l, r, (x, y, w, h), classes, contained=True)) == \
+                expected_frames(frames, l, r, classes, keep=contained)
+
+
+def test_aggregate_frame_range(imported):
+    db_manager, expected = imported
+    rng = random.Random(3)
+    for video_id, frames in expected.items():
+        counts = frame_counts(frames, 10)
+        n = len(counts)
+        for l, r in random_ranges(n, rng) + [(n - 3, n + 50)]:
+            window = counts[l:min(r, n - 1) + 1]
+            for object_class in (None, rng.randrange(10)):
+                column = 10 if object_class is None else object_class
+                summary = db_manager.aggregate_frame_range(video_id, l, r, object_class)
+                assert summary == {
+                    'count': int(window[:, column].sum()),
+                    'max_per_frame': int(window[:, column].max()),
+                    'min_per_frame': int(window[:, column].min()),
+                    'class_counts': {c: int(window[:, c].sum()) for c in range(10) if window[:, c].sum()}
+                }
+                assert db_manager.count_frame_range(video_id, l, r, object_class) == summary['count']
+
+
+def test_query_frames_matching(imported):
+    db_manager, expected = imported
+    rng = random.Random(4)
+    for video_id, frames in expected.items():
+        counts = frame_counts(frames, 10)
+        n = len(counts)
+        predicates = [
+            (Has(), counts[:, 10] >= 1),
+            (Has(None, at_least=2, at_most=4), (counts[:, 10] >= 2) & (counts[:, 10] <= 4)),
+            (Has(3) | Has(5), (counts[:, 3] >= 1) | (counts[:, 5] >= 1)),
+            (~Has(0) & Has(None, at_least=3), (counts[:, 0] == 0) & (counts[:, 10] >= 3))
+        ]
+        for predicate, selected in predicates:
+            l = rng.randrange(n)
+            r = rng.randrange(l, n + 10)
+            frames_in_range = [f for f in np.flatnonzero(selected).tolist() if l <= f <= min(r, n - 1)]
+            assert db_manager.query_frames_matching(video_id, predicate, l, r) == frame_runs(frames_in_range)
+
+
+def test_sampling_masks_frame_queries_and_minimum(imported):
+    db_manager, expected = imported
+    video_id, frames = next(iter(expected.items()))
+    counts = frame_counts(frames, 10)
+    n = len(counts)
+    inferred = np.arange(n) % 3 != 1
+    sampling = FrameSamplingRecord()
+    for frame_number in range(n):
+        sampling.add(bool(inferred[frame_number]), float('nan'))
+    db_manager.store_frame_sampling(video_id, sampling)
+    try:
+        has_any = np.flatnonzero((counts[:, 10] >= 1) & inferred).tolist()
+        assert db_manager.query_frames_matching(video_id, Has()) == frame_runs(has_any)
+        summary = db_manager.aggregate_frame_range(video_id, 0, n - 1)
+        assert summary['min_per_frame'] == int(counts[inferred, 10].min())
+        assert summary['count'] == int(counts[:, 10].sum())
+    finally:
+        db_manager.frame_sampling.delete_many({"video_id": video_id})
+        db_manager.tree_cache.invalidate(lambda key: key[0] == video_id)
+
+
+def test_reimport_drops_trees_cached_while_importing(tmp_path, monkeypatch):
+    expected = write_dataset(tmp_path / 'dataset', seed=5)
+    with open(REPO_ROOT / 'config.json') as f:
+        config = json.load(f)
+    config.update(STORAGE_VARIANTS['files-buckets'])
+    config['storage'] = {'backend': 'sqlite', 'sqlite_path': str(tmp_path / 'store.sqlite')}
+    db_manager = DatabaseManager(config)
+    db_manager.create_indices()
+    try:
+        video_ids = db_manager.import_visdrone_dataset(str(tmp_path / 'dataset'))
+        video_id = next(v for v in video_ids if db_manager.get_video_info(v)['video_id'] == '0000001')
+        frames = expected['0000001']
+        frame_number = max(frames)
+        (tmp_path / 'dataset' / 'annotations' / f"0000001_00000_d_{frame_number:07d}.txt").write_text(
+            "10,20,30,40,1,4,0,0\n10,20,30,40,1,4,0,0\n"
+        )
+        frames[frame_number] = [(3, (10, 20, 30, 40))] * 2
+
+        # A query landing between the early invalidation and the writes
+        # caches the trees of the previous import.
+        import_changed_frames = db_manager._import_changed_frames
+
+        def query_then_import(mongo_video_id, *args):
+            last = db_manager.get_video_info(mongo_video_id)['total_frames']
+            db_manager.query_frame_range(mongo_video_id, 0, last)
+            db_manager.aggregate_frame_range(mongo_video_id, 0, last)
+            import_changed_frames(mongo_video_id, *args)
+
+        monkeypatch.setattr(db_manager, '_import_changed_frames', query_then_import)
+        db_manager.import_visdrone_dataset(str(tmp_path / 'dataset'), incremental=True)
+
+        counts = frame_counts(frames, 10)
+        assert annotation_keys(db_manager.query_frame_range(video_id, 0, frame_number)) == \
+            expected_frames(frames, 0, frame_number)
+        assert db_manager.aggregate_frame_range(video_id, 0, frame_number)['count'] == int(counts[:, 10].sum())
+
+        # An image-only change rewrites frames but returns before the trees
+        # are rebuilt; what the query cached still has to go.
+        cv2.imwrite(str(tmp_path / 'dataset' / 'images' / "0000001_00000_d_0000001.jpg"), np.ones((48, 64, 3), np.uint8))
+        db_manager.import_visdrone_dataset(str(tmp_path / 'dataset'), incremental=True)
+        assert db_manager.tree_cache.get((video_id, "frames")) is None
+        assert db_manager.tree_cache.get((video_id, "counts")) is None
+    finally:
+        db_manager.backend.close()
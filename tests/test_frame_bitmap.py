@@ -0,0 +1,139 @@
+import random
+
+import numpy as np
+import pytest
+
+from app.frame_bitmap import (
+    BITMAP_HEADER, BITMAP_MAGIC, BITMAP_VERSION, And, FrameBitmapIndex, Has, Not, Or, bitmap_frame_ranges
+)
+
+NUM_CLASSES = 3
+
+
+def random_counts(n, seed):
+    rng = np.random.default_rng(seed)
+    counts = np.zeros((n, NUM_CLASSES + 1), dtype=np.int32)
+    counts[:, :NUM_CLASSES] = rng.integers(0, 6, size=(n, NUM_CLASSES)) * (rng.random((n, 1)) < 0.7)
+    counts[:, NUM_CLASSES] = counts[:, :NUM_CLASSES].sum(axis=1)
+    return counts
+
+
+def selected_frames(bits, n):
+    # Every bit, padding included, so stray tail bits show up as frames >= n.
+    return set(np.flatnonzero(np.unpackbits(bits.view(np.uint8))).tolist())
+
+
+def matches(predicate, counts, frame):
+    # Reference evaluation of a predicate on one frame's counts.
+    if isinstance(predicate, Has):
+        column = NUM_CLASSES if predicate.object_class is None else predicate.object_class
+        count = counts[frame, column]
+        return count >= predicate.at_least and (predicate.at_most is None or count <= predicate.at_most)
+    if isinstance(predicate, And):
+        return all(matches(p, counts, frame) for p in predicate.predicates)
+    if isinstance(predicate, Or):
+        return any(matches(p, counts, frame) for p in predicate.predicates)
+    if isinstance(predicate, Not):
+        return not matches(predicate.predicate, counts, frame)
+    raise TypeError(predicate)
+
+
+def random_predicate(rng, depth=0):
+    choice = rng.random() if depth < 3 else 0
+    if choice < 0.4:
+        at_least = rng.randint(0, 7)
+        at_most = None if rng.random() < 0.5 else rng.randint(at_least, 12)
+        return Has(rng.choice([None, *range(NUM_CLASSES)]), at_least, at_most)
+    if choice < 0.6:
+        return random_predicate(rng, depth + 1) & random_predicate(rng, depth + 1)
+    if choice < 0.8:
+        return random_predicate(rng, depth + 1) | random_predicate(rng, depth + 1)
+    return ~random_predicate(rng, depth + 1)
+
+
+def reference_ranges(frames, l, r):
+    ranges = []
+    for frame in sorted(f for f in frames if l <= f <= r):
+        if ranges and ranges[-1][1] == frame - 1:
+            ranges[-1][1] = frame
+        else:
+            ranges.append([frame, frame])
+    return [tuple(run) for run in ranges]
+
+
+@pytest.mark.parametrize('n', [1, 7, 63, 64, 65, 130, 1000])
+def test_predicates_match_per_frame_sets(n):
+    counts = random_counts(n, seed=n)
+    index = FrameBitmapIndex.from_counts(counts)
+    rng = random.Random(n)
+    for _ in range(100):
+        predicate = random_predicate(rng)
+        expected = {frame for frame in range(n) if matches(predicate, counts, frame)}
+        assert selected_frames(predicate.evaluate(index), n) == expected, predicate
+
+
+@pytest.mark.parametrize('n', [1, 5, 64, 70, 129])
+def test_not_leaves_tail_bits_clear(n):
+    counts = random_counts(n, seed=n + 1)
+    index = FrameBitmapIndex.from_counts(counts)
+    assert selected_frames(Not(Has(None, at_least=100)).evaluate(index), n) == set(range(n))
+    assert selected_frames((~Has(0) | Has(0)).evaluate(index), n) == set(range(n))
+    assert selected_frames((~~Has(1, 0)).evaluate(index), n) == set(range(n))
+    assert selected_frames(And().evaluate(index), n) == set(range(n))
+    assert selected_frames(Or().evaluate(index), n) == set()
+
+
+def test_counts_beyond_stored_planes():
+    counts = np.array([[0, 0], [1, 1], [3, 3], [2, 2]], dtype=np.int32)
+    index = FrameBitmapIndex.from_counts(counts)
+    assert selected_frames(Has(0, at_least=4).evaluate(index), 4) == set()
+    assert selected_frames(Has(0, at_least=0).evaluate(index), 4) == {0, 1, 2, 3}
+    assert selected_frames(Has(0, at_least=2, at_most=2).evaluate(index), 4) == {3}
+
+    empty = FrameBitmapIndex.from_counts(np.zeros((5, 2), dtype=np.int32))
+    assert selected_frames(Has(None).evaluate(empty), 5) == set()
+    assert selected_frames((~Has(None)).evaluate(empty), 5) == set(range(5))
+
+
+@pytest.mark.parametrize('n', [1, 9, 64, 200])
+def test_frame_ranges_match_reference(n):
+    counts = random_counts(n, seed=n + 2)
+    index = FrameBitmapIndex.from_counts(counts)
+    rng = random.Random(n)
+    for _ in range(50):
+        predicate = random_predicate(rng)
+        bits = predicate.evaluate(index)
+        frames = selected_frames(bits, n)
+        l = rng.randrange(n)
+        # Callers clip end_frame to the last frame before collapsing ranges.
+        r = min(rng.randrange(l, n + 20), n - 1)
+        assert bitmap_frame_ranges(bits, l, r) == reference_ranges(frames, l, r)
+        assert bitmap_frame_ranges(bits, 0, n - 1) == reference_ranges(frames, 0, n - 1)
+
+
+def test_frame_ranges_clipped_by_end_frame():
+    index = FrameBitmapIndex.from_counts(np.array([[1, 1]] * 10 + [[0, 0]] * 2 + [[1, 1]] * 4, dtype=np.int32))
+    bits = Has(0).evaluate(index)
+    assert bitmap_frame_ranges(bits, 0, 15) == [(0, 9), (12, 15)]
+    assert bitmap_frame_ranges(bits, 3, 7) == [(3, 7)]
+    assert bitmap_frame_ranges(bits, 8, 13) == [(8, 9), (12, 13)]
+    assert bitmap_frame_ranges(bits, 10, 11) == []
+    assert bitmap_frame_ranges(bits, 5, 4) == []
+    assert bitmap_frame_ranges((~Has(0)).evaluate(index), 0, 15) == [(10, 11)]
+
+
+def test_packed_bitmaps_round_trip_and_reject_bad_headers():
+    counts = random_counts(100, seed=3)
+    index = FrameBitmapIndex.from_counts(counts)
+    data = index.to_bytes()
+    restored = FrameBitmapIndex.from_bytes(data)
+    predicate = Has(1, at_least=2) & ~Has(None, at_least=9)
+    np.testing.assert_array_equal(restored.planes, index.planes)
+    np.testing.assert_array_equal(predicate.evaluate(restored), predicate.evaluate(index))
+
+    _, _, *fields = BITMAP_HEADER.unpack_from(data, 0)
+    body = data[BITMAP_HEADER.size:]
+    with pytest.raises(ValueError, match="Not a packed frame bitmap index"):
+        FrameBitmapIndex.from_bytes(BITMAP_HEADER.pack(b'XXXX', BITMAP_VERSION, *fields) + body)
+    with pytest.raises(ValueError, match="Unsupported frame bitmap format version"):
+        FrameBitmapIndex.from_bytes(BITMAP_HEADER.pack(BITMAP_MAGIC, BITMAP_VERSION + 1, *fields) + body)
@@ -0,0 +1,198 @@
+import random
+import struct
+
+import numpy as np
+import pytest
+from bson.objectid import ObjectId
+
+from app.segment_tree import (
+    BINARY_HEADER, BINARY_MAGIC, BINARY_VERSION, CompactFrameSegmentTree, FrameCountTree, FrameSegmentTree,
+    class_mask_to_classes, frame_class_counts
+)
+
+NUM_CLASSES = 5
+
+
+def random_annotations(n, seed, empty_ratio=0.3, max_objects=6):
+    rng = random.Random(seed)
+    annotations = {}
+    for frame_number in range(n):
+        if rng.random() < empty_ratio:
+            continue
+        annotations[frame_number] = [
+            {'_id': ObjectId(), 'class_id': rng.randrange(NUM_CLASSES)}
+            for _ in range(rng.randint(1, max_objects))
+        ]
+    return annotations
+
+
+def sets_query(annotations, n, l, r, classes=None):
+    # Reference: one FrameSegmentTree per class, or a single unfiltered one.
+    if classes is None:
+        tree = FrameSegmentTree(n)
+        tree.build(annotations)
+        return tree.query(l, r)
+    result = set()
+    for class_id in classes:
+        tree = FrameSegmentTree(n, class_id)
+        tree.build(annotations)
+        result |= tree.query(l, r)
+    return result
+
+
+def random_ranges(n, rng, count):
+    ranges = [(0, 0), (n - 1, n - 1), (0, n - 1)]
+    for _ in range(count):
+        l = rng.randrange(n)
+        ranges.append((l, rng.randrange(l, n)))
+    return ranges
+
+
+@pytest.mark.parametrize('n', [1, 2, 7, 64, 257])
+def test_compact_tree_matches_set_tree(n):
+    annotations = random_annotations(n, seed=n)
+    compact = CompactFrameSegmentTree(n)
+    compact.build(annotations)
+    reference = FrameSegmentTree(n)
+    reference.build(annotations)
+
+    rng = random.Random(n)
+    for l, r in random_ranges(n, rng, 50):
+        assert set(compact.query(l, r)) == reference.query(l, r)
+        class_mask = rng.randrange(1, 2 ** NUM_CLASSES)
+        classes = class_mask_to_classes(class_mask)
+        assert set(compact.query(l, r, classes)) == sets_query(annotations, n, l, r, classes)
+        assert set(compact.query(l, r, classes[0])) == sets_query(annotations, n, l, r, classes[:1])
+
+
+def test_compact_tree_query_returns_each_id_once():
+    annotations = random_annotations(100, seed=1)
+    tree = CompactFrameSegmentTree(100)
+    tree.build(annotations)
+    ids = tree.query(0, 99)
+    assert len(ids) == len(set(ids)) == sum(len(objects) for objects in annotations.values())
+
+
+def test_compact_tree_empty_frames_and_classes():
+    annotations = {3: [{'_id': ObjectId(), 'class_id': 2}], 4: []}
+    tree = CompactFrameSegmentTree(10)
+    tree.build(annotations)
+    assert tree.query(0, 2) == []
+    assert tree.query(4, 9) == []
+    assert tree.query(0, 9, [0, 1]) == []
+    assert tree.query(3, 3, [1, 2]) == [annotations[3][0]['_id']]
+
+    empty = CompactFrameSegmentTree(5)
+    empty.build({})
+    assert empty.query(0, 4) == []
+
+
+def test_compact_tree_single_class_tree_ignores_other_classes():
+    annotations = random_annotations(50, seed=2)
+    tree = CompactFrameSegmentTree(50, object_class=3)
+    tree.build(annotations)
+    assert set(tree.query(0, 49)) == sets_query(annotations, 50, 0, 49, [3])
+    assert tree.query(0, 49, [0, 1]) == []
+
+
+@pytest.mark.parametrize('l, r', [(-1, 3), (2, 10), (5, 4)])
+def test_compact_tree_rejects_invalid_ranges(l, r):
+    tree = CompactFrameSegmentTree(10)
+    tree.build({})
+    with pytest.raises(ValueError):
+        tree.query(l, r)
+
+
+@pytest.mark.parametrize('n, object_class', [(1, None), (33, None), (200, None), (200, 2)])
+def test_packed_tree_round_trip(n, object_class):
+    annotations = random_annotations(n, seed=n + 7)
+    tree = CompactFrameSegmentTree(n, object_class)
+    tree.build(annotations)
+    packed = CompactFrameSegmentTree.from_bytes(tree.to_bytes())
+    assert packed.n == n
+    assert packed.object_class == object_class
+    assert packed.to_bytes() == tree.to_bytes()
+
+    reference = FrameSegmentTree(n, object_class)
+    reference.build(annotations)
+    rng = random.Random(n)
+    for l, r in random_ranges(n, rng, 50):
+        assert set(packed.query(l, r)) == reference.query(l, r)
+        assert packed.query(l, r) == tree.query(l, r)
+        classes = class_mask_to_classes(rng.randrange(1, 2 ** NUM_CLASSES))
+        assert packed.query(l, r, classes) == tree.query(l, r, classes)
+
+
+def test_packed_tree_round_trip_without_annotations():
+    tree = CompactFrameSegmentTree(4)
+    tree.build({})
+    packed = CompactFrameSegmentTree.from_bytes(tree.to_bytes())
+    assert packed.query(0, 3) == []
+
+
+def test_packed_tree_rejects_bad_headers():
+    tree = CompactFrameSegmentTree(8)
+    tree.build(random_annotations(8, seed=3))
+    data = tree.to_bytes()
+    body = data[BINARY_HEADER.size:]
+    _, _, *fields = BINARY_HEADER.unpack_from(data, 0)
+
+    with pytest.raises(ValueError, match="Not a packed segment tree"):
+        CompactFrameSegmentTree.from_bytes(BINARY_HEADER.pack(b'XXXX', BINARY_VERSION, *fields) + body)
+    with pytest.raises(ValueError, match="Unsupported segment tree format version"):
+        CompactFrameSegmentTree.from_bytes(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION + 1, *fields) + body)
+    with pytest.raises(struct.error):
+        CompactFrameSegmentTree.from_bytes(data[:BINARY_HEADER.size - 1])
+
+
+@pytest.mark.parametrize('n', [1, 5, 64, 300])
+def test_count_tree_matches_numpy(n):
+    annotations = random_annotations(n, seed=n + 11)
+    tree = FrameCountTree(n, NUM_CLASSES)
+    tree.build(annotations)
+    frame_counts = frame_class_counts(annotations, n, NUM_CLASSES)
+    assert frame_counts[:, -1].sum() == sum(len(objects) for objects in annotations.values())
+
+    rng = random.Random(n)
+    for l, r in random_ranges(n, rng, 50):
+        counts, max_density, min_density = tree.query(l, r)
+        window = frame_counts[l:r + 1]
+        np.testing.assert_array_equal(counts, window.sum(axis=0))
+        np.testing.assert_array_equal(max_density, window.max(axis=0))
+        np.testing.assert_array_equal(min_density, window.min(axis=0))
+
+
+@pytest.mark.parametrize('n', [1, 9, 128, 301])
+def test_count_tree_masks_skipped_frames_out_of_minimum(n):
+    annotations = random_annotations(n, seed=n + 13, empty_ratio=0.1)
+    frame_counts = frame_class_counts(annotations, n, NUM_CLASSES)
+    rng = np.random.default_rng(n)
+    inferred = rng.random(n) < 0.4
+    # Skipped frames hold no annotations, as after adaptive sampling.
+    frame_counts[~inferred] = 0
+    tree = FrameCountTree(n, NUM_CLASSES)
+    tree.build_from_counts(frame_counts, inferred)
+    restored = FrameCountTree.from_dict(tree.to_dict(), inferred)
+
+    for l, r in random_ranges(n, random.Random(n), 50):
+        window = frame_counts[l:r + 1]
+        inferred_window = window[inferred[l:r + 1]]
+        expected_min = inferred_window.min(axis=0) if len(inferred_window) else np.zeros(NUM_CLASSES + 1)
+        for counted in (tree, restored):
+            counts, max_density, min_density = counted.query(l, r)
+            np.testing.assert_array_equal(counts, window.sum(axis=0))
+            np.testing.assert_array_equal(max_density, window.max(axis=0))
+            np.testing.assert_array_equal(min_density, expected_min)
+
+
+def test_count_tree_minimum_ignores_skipped_empty_frames():
+    frame_counts = np.array([[2, 2], [0, 0], [3, 3], [0, 0], [1, 1]], dtype=np.int32)
+    inferred = np.array([True, False, True, False, True])
+    tree = FrameCountTree(5, 1)
+    tree.build_from_counts(frame_counts, inferred)
+    assert tree.query(0, 4)[2].tolist() == [1, 1]
+    assert tree.query(0, 2)[2].tolist() == [2, 2]
+    assert tree.query(1, 1)[2].tolist() == [0, 0]
+    unmasked = FrameCountTree(5, 1)
+    unmasked.build_from_counts(frame_counts)
+    assert unmasked.query(0, 4)[2].tolist() == [0, 0]
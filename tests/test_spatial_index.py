@@ -0,0 +1,179 @@
+import random
+import threading
+
+import pytest
+from bson.objectid import ObjectId
+
+from app import spatial_index
+from app.spatial_index import SPATIAL_HEADER, SPATIAL_MAGIC, SPATIAL_VERSION, SpatialGridIndex
+
+CELL_SIZE = 32
+NUM_CLASSES = 4
+
+
+def random_box(rng):
+    # Half the boxes start or end exactly on a cell boundary.
+    if rng.random() < 0.5:
+        x = rng.randrange(0, 8) * CELL_SIZE
+        y = rng.randrange(0, 8) * CELL_SIZE
+        w = rng.choice([CELL_SIZE, 2 * CELL_SIZE, rng.randint(1, 3 * CELL_SIZE)])
+        h = rng.choice([CELL_SIZE, rng.randint(1, 3 * CELL_SIZE)])
+    else:
+        x, y = rng.randrange(0, 250), rng.randrange(0, 250)
+        w, h = rng.randint(1, 80), rng.randint(1, 80)
+    return [x, y, w, h]
+
+
+def random_annotations(num_frames, seed):
+    rng = random.Random(seed)
+    return {
+        frame_number: [
+            {'_id': ObjectId(), 'class_id': rng.randrange(NUM_CLASSES), 'bbox': random_box(rng)}
+            for _ in range(rng.randint(0, 5))
+        ]
+        for frame_number in range(num_frames)
+    }
+
+
+def brute_force(annotations, l, r, region, classes=None, contained=False):
+    x, y, w, h = region
+    result = set()
+    for frame_number, objects in annotations.items():
+        if not l <= frame_number <= r:
+            continue
+        for obj in objects:
+            bx, by, bw, bh = obj['bbox']
+            if classes is not None and obj['class_id'] not in classes:
+                continue
+            if contained:
+                hit = bx >= x and by >= y and bx + bw <= x + w and by + bh <= y + h
+            else:
+                hit = bx < x + w and bx + bw > x and by < y + h and by + bh > y
+            if hit:
+                result.add(obj['_id'])
+    return result
+
+
+def random_query(rng, num_frames):
+    l = rng.randrange(num_frames)
+    r = rng.randrange(l, num_frames)
+    if rng.random() < 0.5:
+        region = (rng.randrange(0, 8) * CELL_SIZE, rng.randrange(0, 8) * CELL_SIZE,
+                  rng.randint(1, 4) * CELL_SIZE, rng.randint(1, 4) * CELL_SIZE)
+    else:
+        region = (rng.randrange(-40, 300), rng.randrange(-40, 300), rng.randint(1, 200), rng.randint(1, 200))
+    classes = None if rng.random() < 0.4 else rng.sample(range(NUM_CLASSES), rng.randint(1, 3))
+    return l, r, region, classes, rng.random() < 0.5
+
+
+def check_queries(index, annotations, num_frames, seed, count=200):
+    rng = random.Random(seed)
+    for _ in range(count):
+        l, r, region, classes, contained = random_query(rng, num_frames)
+        ids = index.query(l, r, region, classes, contained)
+        assert len(ids) == len(set(ids))
+        assert set(ids) == brute_force(annotations, l, r, region, classes, contained), (l, r, region, classes, contained)
+
+
+def test_grid_queries_match_brute_force():
+    annotations = random_annotations(60, seed=1)
+    index = SpatialGridIndex(CELL_SIZE)
+    index.build(annotations)
+    check_queries(index, annotations, 60, seed=2)
+
+
+def test_cell_boundary_boxes():
+    inside = {'_id': ObjectId(), 'class_id': 0, 'bbox': [CELL_SIZE, CELL_SIZE, CELL_SIZE, CELL_SIZE]}
+    spanning = {'_id': ObjectId(), 'class_id': 1, 'bbox': [CELL_SIZE - 1, 0, 2, 2 * CELL_SIZE]}
+    index = SpatialGridIndex(CELL_SIZE)
+    index.build({0: [inside, spanning]})
+
+    # A region ending exactly where a box starts does not touch it.
+    assert index.query(0, 0, (0, 0, CELL_SIZE, CELL_SIZE)) == [spanning['_id']]
+    assert set(index.query(0, 0, (CELL_SIZE, CELL_SIZE, 1, 1))) == {inside['_id'], spanning['_id']}
+    assert index.query(0, 0, (CELL_SIZE, CELL_SIZE, CELL_SIZE, CELL_SIZE), contained=True) == [inside['_id']]
+    assert index.query(0, 0, (2 * CELL_SIZE, 0, CELL_SIZE, 3 * CELL_SIZE)) == []
+    assert index.query(0, 0, (0, 0, 0, 10)) == []
+    assert index.query(1, 5, (0, 0, 100, 100)) == []
+
+
+def test_packed_index_round_trip():
+    annotations = random_annotations(40, seed=3)
+    index = SpatialGridIndex(CELL_SIZE)
+    index.build(annotations)
+    packed = SpatialGridIndex.from_bytes(index.to_bytes())
+    assert packed.cell_size == CELL_SIZE
+    assert packed.to_bytes() == index.to_bytes()
+    check_queries(packed, annotations, 40, seed=4)
+
+    empty = SpatialGridIndex.from_bytes(SpatialGridIndex(CELL_SIZE).to_bytes())
+    assert empty.query(0, 10, (0, 0, 100, 100)) == []
+
+
+def test_packed_index_rejects_bad_headers():
+    index = SpatialGridIndex(CELL_SIZE)
+    index.build(random_annotations(5, seed=5))
+    data = index.to_bytes()
+    _, _, *fields = SPATIAL_HEADER.unpack_from(data, 0)
+    body = data[SPATIAL_HEADER.size:]
+    with pytest.raises(ValueError, match="Not a packed spatial index"):
+        SpatialGridIndex.from_bytes(SPATIAL_HEADER.pack(b'XXXX', SPATIAL_VERSION, *fields) + body)
+    with pytest.raises(ValueError, match="Unsupported spatial index format version"):
+        SpatialGridIndex.from_bytes(SPATIAL_HEADER.pack(SPATIAL_MAGIC, SPATIAL_VERSION + 1, *fields) + body)
+
+
+def test_live_frames_are_queryable_before_and_after_merges(monkeypatch):
+    monkeypatch.setattr(spatial_index, 'MIN_PENDING_MERGE', 16)
+    annotations = random_annotations(80, seed=6)
+    index = SpatialGridIndex(CELL_SIZE)
+    for frame_number, objects in annotations.items():
+        index.add_frame(frame_number, objects)
+        if frame_number % 20 == 19:
+            added = {f: annotations[f] for f in range(frame_number + 1)}
+            check_queries(index, added, frame_number + 1, seed=frame_number, count=30)
+    assert index._pending
+    check_queries(index, annotations, 80, seed=7)
+    index.finalize()
+    assert not index._pending
+    check_queries(index, annotations, 80, seed=8)
+
+
+def test_concurrent_appends_and_queries(monkeypatch):
+    monkeypatch.setattr(spatial_index, 'MIN_PENDING_MERGE', 8)
+    num_frames = 300
+    annotations = random_annotations(num_frames, seed=9)
+    index = SpatialGridIndex(CELL_SIZE)
+    added = [-1]
+    done = threading.Event()
+    errors = []
+
+    def ingest():
+        for frame_number in range(num_frames):
+            index.add_frame(frame_number, annotations[frame_number])
+            added[0] = frame_number
+        done.set()
+
+    def read(seed):
+        rng = random.Random(seed)
+        try:
+            while not done.is_set():
+                last = added[0]
+                if last < 0:
+                    continue
+                _, _, region, classes, contained = random_query(rng, num_frames)
+                l = rng.randrange(last + 1)
+                # Every frame up to last was fully added before the query.
+                ids = index.query(l, last, region, classes, contained)
+                expected = brute_force(annotations, l, last, region, classes, contained)
+                if len(ids) != len(set(ids)) or set(ids) != expected:
+                    errors.append((l, last, region, classes, contained))
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read, args=(seed,)) for seed in range(3)]
+    for reader in readers:
+        reader.start()
+    ingest()
+    for reader in readers:
+        reader.join()
+    assert errors == []
@@ -8,7 +8,15 @@ load_dotenv()
 DEFAULT_CONFIG = {
      'mongodb': {
         'uri': os.getenv("MONGODB_URL"),
-        'db_name': 'visdrone_db'
+        'db_name': 'visdrone_db',
+        'max_pool_size': 20,
+        'min_pool_size': 0,
+        'server_selection_timeout_ms': 10000,
+        'async_concurrency': 8  # queries in flight per fan-out in AsyncDatabaseManager
+    },
+    'storage': {
+        'backend': 'mongodb',  # 'mongodb' or 'sqlite' (local single-file store, works offline)
+        'sqlite_path': 'data/visdrone.sqlite'
     },
     'classes': [
         'pedestrian',
@@ -41,6 +49,17 @@ DEFAULT_CONFIG = {
         'confidence_threshold': 0.5,
         'iou_threshold': 0.45,
         'frame_skip': 1,  
+        'sampling': 'fixed',  # 'fixed': every frame_skip-th frame; 'adaptive': on scene change
+        'adaptive_sampling': {
+            'min_stride': 1,  # frames at least this far apart
+            'max_stride': 15,  # and at most this far apart
+            'threshold': 0.015,  # mean thumbnail difference (0-1) that counts as a change
+            'thumbnail_width': 64
+        },
+        'batch_size': 8,  # frames per model call
+        'batch_timeout_ms': 20,  # longest wait for a batch to fill
+        'inference_processes': 0,  # >0: run the model in this many worker processes
+        'torch_threads': 1,  # torch threads per worker process
         'class_mapping': {
             '0': 0,  # person -> pedestrian
             '1': 2,  # bicycle -> bicycle
@@ -50,10 +69,38 @@ DEFAULT_CONFIG = {
             '7': 5   # truck -> truck
         }
     },
+    'segment_tree': {
+        'representation': 'compact',  # 'compact' or 'sets'
+        'storage': 'paged',  # 'paged' (lazily loaded node pages) or 'packed'
+        'page_frames': 4096,
+        'page_ids': 4096,
+        'inline_limit_bytes': 8 * 1024 * 1024,  # larger packed trees go to GridFS
+        'cache_max_bytes': 256 * 1024 * 1024
+    },
+    'spatial_index': {
+        'cell_size': 128  # grid cell size in pixels
+    },
+    'annotation_storage': {
+        'layout': 'documents',  # 'documents' (one per box) or 'buckets'
+        'bucket_frames': 256  # frames per bucket document
+    },
+    'dataset_import': {
+        'batch_size': 5000,  # documents per insert_many
+        'max_pending_batches': 4,  # batches queued for the writer thread
+        'parse_workers': 4,  # processes parsing annotation files
+        'parse_chunk_files': 256,  # annotation files per parse task
+        'incremental': True  # re-import only frames whose files changed
+    },
     'video_import': {
         'default_video_path': '../videos',
         'temp_frames_dir': 'temp_frames',
-        'max_workers': 4  
+        'max_workers': 4,
+        'max_buffered_mb': 256,
+        'write_batch_frames': 32
+    },
+    'frame_store': {
+        'max_open_videos': 4,  # video files kept open for frame reads
+        'max_forward_frames': 30  # decode forward instead of seeking up to this far
     }
 }
 
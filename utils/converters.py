@@ -1,36 +1,122 @@
+import os
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple, Iterator
+import numpy as np
 from bson.objectid import ObjectId
 
-def visdrone_to_mongodb_format(annotation_file: Path, frame_id: ObjectId, class_names: List[str]) -> List[Dict[str, Any]]:
-    annotations = []
+# One row per kept VisDrone box; class_id is already zero-based.
+VISDRONE_DTYPE = np.dtype([
+    ('x', '<i4'), ('y', '<i4'), ('w', '<i4'), ('h', '<i4'),
+    ('score', '<i4'), ('class_id', '<i4')
+])
+
+def _parse_rows_slow(text: bytes) -> np.ndarray:
+    rows = []
+    for line in text.splitlines():
+        parts = line.strip().split(b",")
+        if len(parts) >= 6:
+            rows.append([int(part) for part in parts[:6]])
+    return np.array(rows, dtype=np.int64).reshape(-1, 6)
+
+def _parse_rows(text: bytes) -> np.ndarray:
+    # Fast path for the regular case: every line has the same number of
+    # comma-separated integers, so the whole text parses in one call.
+    text = text.replace(b"\r", b"").strip()
+    if not text:
+        return np.empty((0, 6), dtype=np.int64)
+    chars = np.frombuffer(text, dtype=np.uint8)
+    line_of_char = np.cumsum(chars == ord("\n"))
+    num_lines = int(line_of_char[-1]) + 1
+    commas_per_line = np.bincount(line_of_char[chars == ord(",")], minlength=num_lines)
+    num_columns = int(commas_per_line[0]) + 1
+    # Checking only the total would let lines of different widths cancel out.
+    if num_columns >= 6 and (commas_per_line == num_columns - 1).all():
+        values = np.fromstring(text.replace(b"\n", b","), dtype=np.int64, sep=",")
+        if values.size == num_lines * num_columns:
+            return values.reshape(num_lines, num_columns)[:, :6]
+    return _parse_rows_slow(text)
+
+def _keep_mask(rows: np.ndarray, num_classes: int) -> np.ndarray:
+    # Same rules as the line parser: drop ignored regions (score 0) and
+    # classes outside the configured list.
+    class_ids = rows[:, 5] - 1
+    return (rows[:, 4] != 0) & (class_ids >= 0) & (class_ids < num_classes)
+
+def _filter_rows(rows: np.ndarray, num_classes: int, keep: Optional[np.ndarray] = None) -> np.ndarray:
+    if keep is None:
+        keep = _keep_mask(rows, num_classes)
+    kept = rows[keep]
+    records = np.empty(len(kept), dtype=VISDRONE_DTYPE)
+    for column, field in enumerate(VISDRONE_DTYPE.names):
+        records[field] = kept[:, column]
+    records['class_id'] -= 1
+    return records
+
+def parse_visdrone_annotations(annotation_file: Path, num_classes: int) -> np.ndarray:
+    try:
+        with open(annotation_file, "rb") as f:
+            return _filter_rows(_parse_rows(f.read()), num_classes)
+    except FileNotFoundError:
+        return np.empty(0, dtype=VISDRONE_DTYPE)
+
+def parse_visdrone_batch(annotation_files: List[Path], num_classes: int) -> List[np.ndarray]:
+    # Joins a batch of files into one buffer so the numeric parse and the
+    # filtering run once, then splits the rows back per file.
+    texts = []
+    for annotation_file in annotation_files:
+        try:
+            with open(annotation_file, "rb") as f:
+                texts.append(f.read().replace(b"\r", b"").strip())
+        except FileNotFoundError:
+            texts.append(b"")
+    
+    line_counts = [text.count(b"\n") + 1 if text else 0 for text in texts]
+    rows = _parse_rows(b"\n".join(text for text in texts if text))
+    if len(rows) != sum(line_counts):
+        # Some file has short or blank lines; parse file by file instead.
+        return [_filter_rows(_parse_rows(text), num_classes) for text in texts]
+    
+    file_index = np.repeat(np.arange(len(texts)), line_counts)
+    keep = _keep_mask(rows, num_classes)
+    records = _filter_rows(rows, num_classes, keep)
+    return np.split(records, np.cumsum(np.bincount(file_index[keep], minlength=len(texts)))[:-1])
+
+def parse_visdrone_files(annotation_files: List[Path], num_classes: int, max_workers: int = 1,
+                         chunk_size: int = 256) -> Iterator[np.ndarray]:
+    # Parsed records per file, in input order. With more than one worker the
+    # batches are parsed in a process pool while earlier ones are consumed.
+    chunks = [annotation_files[i:i + chunk_size] for i in range(0, len(annotation_files), chunk_size)]
+    max_workers = min(max_workers, os.cpu_count() or 1)
+    if max_workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from parse_visdrone_batch(chunk, num_classes)
+        return
     
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for records in executor.map(parse_visdrone_batch, chunks, [num_classes] * len(chunks)):
+            yield from records
+
+def visdrone_records_to_mongodb_format(records: np.ndarray, frame_id: ObjectId, class_names: List[str]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "frame_id": frame_id,
+            "bbox": [x, y, w, h],
+            "class_id": class_id,
+            "class_name": class_names[class_id],
+            "confidence": 1.0  # Default confidence
+        }
+        for x, y, w, h, _, class_id in records.tolist()
+    ]
+
+def visdrone_to_mongodb_format(annotation_file: Path, frame_id: ObjectId, class_names: List[str]) -> List[Dict[str, Any]]:
     try:
-        with open(annotation_file, "r") as f:
-            for line in f:
-                parts = line.strip().split(",")
-                if len(parts) >= 6:
-                    x, y, w, h = map(int, parts[:4])
-                    score = int(parts[4])
-                    class_id = int(parts[5]) - 1  
-                    
-                    if score == 0:
-                        continue
-                    
-                    if 0 <= class_id < len(class_names):
-                        annotation_data = {
-                            "frame_id": frame_id,
-                            "bbox": [x, y, w, h],
-                            "class_id": class_id,
-                            "class_name": class_names[class_id],
-                            "confidence": 1.0  # Default confidence
-                        }
-                        
-                        annotations.append(annotation_data)
+        records = parse_visdrone_annotations(annotation_file, len(class_names))
     except Exception as e:
         print(f"Error processing annotation file {annotation_file}: {e}")
+        return []
     
-    return annotations
+    return visdrone_records_to_mongodb_format(records, frame_id, class_names)
 
 def convert_box_to_yolo_format(size: Tuple[int, int], box: Tuple[int, int, int, int]) -> Tuple[float, float, float, float]:
     dw = 1. / size[0]